@@ -1,15 +1,26 @@
 import os
 import sys
-from flask import Flask, render_template, jsonify, request
-import json
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 
 # Make sure Python can find your modules (assuming they're in the same directory or a subfolder)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import llm_metrics
+import document_store
+import job_queue
+import shared_cache
+import explanation_batch
+import explanation_prefetch
 from correction_service import get_correction_explanation
-from generate_explanation import generate_correction_explanation_single  # <--- Use correct file name
+from generate_explanation import (  # <--- Use correct file name
+    generate_correction_explanation_cached,
+    stream_correction_explanation_cached,
+    format_sse
+)
 
 app = Flask(__name__)
+# Reject oversized uploads before reading them (job_queue checks each page again).
+app.config["MAX_CONTENT_LENGTH"] = job_queue.MAX_PAGES * job_queue.MAX_UPLOAD_BYTES
 
 @app.route("/")
 def index():
@@ -21,19 +32,127 @@ def index():
 @app.route("/data.json")
 def get_data():
     """
-    Fetches and serves sentence/correction data from 'output.json' (adjust path as needed).
+    Fetches and serves sentence/correction data from 'output.json' (adjust path as needed),
+    or from the document store when a ?document=<id> is given. The serialized body comes
+    from the shared cache after the first request in any worker.
     """
+    document_id = request.args.get("document")
+    if document_id:
+        body = document_store.get_store().get_document_json(document_id)
+        if body is None:
+            return jsonify({"error": "Document not found", "document_id": document_id}), 404
+        return app.response_class(body, mimetype="application/json")
     try:
-        with open("output.json", "r") as f:  # Ensure 'output.json' is in the right location
-            data = json.load(f)
-        return jsonify(data)
+        # Ensure 'output.json' is in the right location
+        return app.response_class(document_store.file_document_json("output.json"), mimetype="application/json")
     except Exception as e:
         return jsonify({"error": "Failed to load output.json", "details": str(e)}), 500
 
+@app.route("/data.json/index")
+def get_data_index():
+    """
+    Lightweight document index: sentence count and each sentence record's byte offset and
+    size, so the frontend can plan its /sentences requests. ?document=<id> as for /data.json.
+    """
+    document_id = request.args.get("document")
+    if document_id:
+        index = document_store.get_store().get_document_index(document_id)
+        if index is None:
+            return jsonify({"error": "Document not found", "document_id": document_id}), 404
+        return jsonify(index)
+    try:
+        return jsonify(document_store.file_document_index("output.json"))
+    except Exception as e:
+        return jsonify({"error": "Failed to load output.json", "details": str(e)}), 500
+
+@app.route("/sentences")
+def get_sentences():
+    """
+    One range of sentences: ?start=<first index>&count=<n> (at most MAX_RANGE_SENTENCES),
+    from the stored ?document=<id> or from output.json.
+    """
+    start = request.args.get("start", 0, type=int)
+    count = request.args.get("count", 20, type=int)
+    if start < 0 or count < 1:
+        return jsonify({"error": "start must be >= 0 and count >= 1"}), 400
+    document_id = request.args.get("document")
+    if document_id:
+        page = document_store.get_store().get_sentence_range(document_id, start, count)
+        if page is None:
+            return jsonify({"error": "Document not found", "document_id": document_id}), 404
+        return jsonify(page)
+    try:
+        return jsonify(document_store.file_sentence_range("output.json", start, count))
+    except Exception as e:
+        return jsonify({"error": "Failed to load output.json", "details": str(e)}), 500
+
+@app.route("/documents")
+def list_documents():
+    """
+    Lists the most recent documents in the store (id, source, sentence count, timestamps).
+    """
+    return jsonify({"documents": document_store.get_store().list_documents(request.args.get("limit", 100, type=int))})
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Uploads one or more page images (multipart field 'image', in reading order) and queues
+    an OCR -> correction -> render job. Optional form field 'correction_mode'.
+    Returns 202 with the job status, 429 + Retry-After when the queue is full.
+    """
+    pages = [(f.filename, f.read()) for f in request.files.getlist("image")]
+    client = request.headers.get("X-Client-Id") or request.remote_addr
+    try:
+        job = job_queue.get_job_queue().submit(
+            pages, client=client, correction_mode=request.form.get("correction_mode", "full_text")
+        )
+    except job_queue.QueueFull as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+    except job_queue.JobError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(job_queue.with_links(job)), 202, {"Location": f"/jobs/{job['id']}"}
+
+@app.route("/jobs")
+def list_jobs():
+    """
+    Recent jobs and the current queue depth.
+    """
+    queue = job_queue.get_job_queue()
+    return jsonify({"queue": queue.depth(), "jobs": queue.list_jobs(request.args.get("limit", 50, type=int))})
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    Job status with per-stage progress (ocr, correction, align, diff, render, store).
+    """
+    job = job_queue.get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "job_id": job_id}), 404
+    return jsonify(job_queue.with_links(job))
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    """
+    The finished document (same shape as /data.json); 202 with the status while the job
+    is still queued or running, 500 with the error if it failed, 404 if the document has
+    been deleted since.
+    """
+    job = job_queue.get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "job_id": job_id}), 404
+    if job["status"] == "failed":
+        return jsonify({"error": "Job failed", "details": job["error"], "job_id": job_id}), 500
+    if job["status"] != "done":
+        return jsonify(job_queue.with_links(job)), 202
+    body = document_store.get_store().get_document_json(job_id)
+    if body is None:  # Deleted since the job finished
+        return jsonify({"error": "Document not found", "document_id": job_id}), 404
+    return app.response_class(body, mimetype="application/json")
+
 @app.route("/highlight_click", methods=["POST"])
 def highlight_click():
     """
-    Handles highlight-box clicks from the frontend. 
+    Handles highlight-box clicks from the frontend (documentId selects a stored document).
     Calls `get_correction_explanation` to retrieve the relevant sentence/block data,
     then runs a multi-step LLM explanation via `generate_correction_explanation_single`.
     """
@@ -58,10 +177,14 @@ def highlight_click():
         correction_block = correction_info.get("correction_block")
         correction_entry = correction_info.get("correction_entry")  # THIS IS MISSING!
 
-        # 5) Generate explanation using the multi-step approach
-        explanation = generate_correction_explanation_single(
-            block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry
-        )
+        # 5) Generate explanation using the multi-step approach (or reuse a cached or
+        #    hover-prefetched one, waiting for the prefetch if it is still running)
+        with llm_metrics.trace("highlight_click", blockType=block_type, sentenceIndex=data.get("sentenceIndex")):
+            explanation = explanation_prefetch.get_prefetcher().join(
+                block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry
+            ) or generate_correction_explanation_cached(
+                block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry
+            )
 
         result = {"explanation": explanation}
         
@@ -72,6 +195,137 @@ def highlight_click():
         print("[ERROR] Failed to process highlight click:", str(e))
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+@app.route("/highlight_click/stream", methods=["POST"])
+def highlight_click_stream():
+    """
+    Streaming variant of /highlight_click.
+    Sends server-sent events: 'status' for intermediate steps, 'token' for each piece of
+    the explanation as the model produces it, then 'done' with the full text.
+    """
+    data = request.get_json()
+    print("[DEBUG] Received streaming highlight click:", data)
+    correction_info = get_correction_explanation(data)
+    if "error" in correction_info:
+        return jsonify(correction_info), 400
+
+    def generate():
+        try:
+            with llm_metrics.trace("highlight_click/stream", blockType=data.get("blockType"),
+                                   sentenceIndex=data.get("sentenceIndex")):
+                # A running hover prefetch finishes first; the stream is then a cache hit.
+                explanation_prefetch.get_prefetcher().join(
+                    data.get("blockType"),
+                    correction_info.get("ocr_sentence"),
+                    correction_info.get("corrected_sentence"),
+                    correction_info.get("correction_block"),
+                    correction_info.get("correction_entry")
+                )
+                for event, payload in stream_correction_explanation_cached(
+                    data.get("blockType"),
+                    correction_info.get("ocr_sentence"),
+                    correction_info.get("corrected_sentence"),
+                    correction_info.get("correction_block"),
+                    correction_info.get("correction_entry")
+                ):
+                    yield format_sse(event, payload)
+        except Exception as e:
+            print("[ERROR] Failed to stream highlight click:", str(e))
+            yield format_sse("error", str(e))
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/highlight_batch", methods=["POST"])
+def highlight_batch():
+    """
+    Explanations for many blocks in one request, e.g. a whole sentence or essay:
+    {"documentId"?, "blocks": [{"sentenceIndex", "blockType", "blockIndex"}, ...], "sentences": [...]}.
+    Returns {"explanations": {"<sentence>:<type>:<block>": {"explanation"} or {"error"}}, "stats"}
+    (see explanation_batch).
+    """
+    data = request.get_json()
+    print("[DEBUG] Received highlight batch:", data)
+    resolved = explanation_batch.resolve_batch(data)
+    if "error" in resolved:
+        return jsonify(resolved), 400
+    try:
+        with llm_metrics.trace("highlight_batch", blocks=len(resolved)):
+            return jsonify(explanation_batch.batch_explanations(resolved))
+    except Exception as e:
+        print("[ERROR] Failed to process highlight batch:", str(e))
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+@app.route("/highlight_batch/stream", methods=["POST"])
+def highlight_batch_stream():
+    """
+    Streaming variant of /highlight_batch: a 'block' event ({"key", "explanation" or "error"})
+    as each block is ready, cached ones first, then 'done' with the stats.
+    """
+    data = request.get_json()
+    resolved = explanation_batch.resolve_batch(data)
+    if "error" in resolved:
+        return jsonify(resolved), 400
+
+    def generate():
+        try:
+            with llm_metrics.trace("highlight_batch/stream", blocks=len(resolved)):
+                for event, payload in explanation_batch.iter_batch_explanations(resolved):
+                    yield format_sse(event, payload)
+        except Exception as e:
+            print("[ERROR] Failed to stream highlight batch:", str(e))
+            yield format_sse("error", str(e))
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/highlight_prefetch", methods=["POST"])
+def highlight_prefetch():
+    """
+    Hover prefetch (same payload as /highlight_click): starts generating the block's
+    explanation in the background so the click is a cache hit, and returns at once with
+    the prefetch status (see explanation_prefetch). 429 when the session's budget is spent.
+    """
+    data = request.get_json()
+    correction_info = get_correction_explanation(data)
+    if "error" in correction_info:
+        return jsonify(correction_info), 400
+    session = request.headers.get("X-Client-Id") or request.remote_addr
+    prefetcher = explanation_prefetch.get_prefetcher()
+    status = prefetcher.prefetch(
+        session,
+        data.get("blockType"),
+        correction_info.get("ocr_sentence"),
+        correction_info.get("corrected_sentence"),
+        correction_info.get("correction_block"),
+        correction_info.get("correction_entry")
+    )
+    result = {"status": status, "remaining": prefetcher.remaining(session)}
+    if status == "over_budget":
+        return jsonify(result), 429
+    return jsonify(result), 202 if status in ("queued", "pending") else 200
+
+@app.route("/prefetch_stats")
+def prefetch_stats():
+    """
+    Hover prefetch counts for this worker process (queued, cached, joined by a click, over budget, ...).
+    """
+    return jsonify(explanation_prefetch.get_prefetcher().stats())
+
+@app.route("/llm_stats")
+def llm_stats():
+    """
+    Per-call LLM stats for this worker process: latency histograms, tokens and cost
+    per (step, model), plus the most recent request traces (?traces=N).
+    """
+    return jsonify(llm_metrics.get_stats(traces=request.args.get("traces", 10, type=int)))
+
+@app.route("/cache_stats")
+def cache_stats():
+    """
+    Hit/miss/eviction counts of this worker's cache tiers (the shared tier's size is host-wide).
+    """
+    return jsonify(shared_cache.get_stats())
+
 if __name__ == "__main__":
     """
     Runs the Flask app (development mode).
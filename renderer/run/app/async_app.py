@@ -0,0 +1,358 @@
+import os
+import sys
+import asyncio
+from aiohttp import web
+
+# Make sure Python can find your modules (same layout as app.py)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import llm_metrics
+import document_store
+import job_queue
+import shared_cache
+import explanation_batch
+import explanation_prefetch
+from correction_service import get_correction_explanation
+from generate_explanation import (
+    agenerate_correction_explanation_cached,
+    astream_correction_explanation_cached,
+    format_sse
+)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+STATIC_DIR = os.path.join(APP_DIR, "static")
+OUTPUT_JSON = "output.json"  # Relative to the working directory, like app.py
+
+async def index(request):
+    """
+    Serves the main frontend page (index.html has no template variables).
+    """
+    return web.FileResponse(os.path.join(TEMPLATES_DIR, "index.html"))
+
+async def get_data(request):
+    """
+    Serves sentence/correction data from 'output.json', or from the document store
+    when a ?document=<id> is given. Both are read (or taken from the shared cache) in a
+    worker thread so the event loop stays free.
+    """
+    document_id = request.query.get("document")
+    if document_id:
+        body = await asyncio.get_running_loop().run_in_executor(
+            None, document_store.get_store().get_document_json, document_id
+        )
+        if body is None:
+            return web.json_response({"error": "Document not found", "document_id": document_id}, status=404)
+        return web.Response(text=body, content_type="application/json")
+    try:
+        body = await asyncio.get_running_loop().run_in_executor(None, document_store.file_document_json, OUTPUT_JSON)
+        return web.Response(text=body, content_type="application/json")
+    except Exception as e:
+        return web.json_response({"error": "Failed to load output.json", "details": str(e)}, status=500)
+
+async def get_data_index(request):
+    """
+    Lightweight document index (sentence count, byte offsets), see app.get_data_index.
+    """
+    document_id = request.query.get("document")
+    loop = asyncio.get_running_loop()
+    if document_id:
+        index = await loop.run_in_executor(None, document_store.get_store().get_document_index, document_id)
+        if index is None:
+            return web.json_response({"error": "Document not found", "document_id": document_id}, status=404)
+        return web.json_response(index)
+    try:
+        return web.json_response(await loop.run_in_executor(None, document_store.file_document_index, OUTPUT_JSON))
+    except Exception as e:
+        return web.json_response({"error": "Failed to load output.json", "details": str(e)}, status=500)
+
+async def get_sentences(request):
+    """
+    One range of sentences (?start=&count=), see app.get_sentences.
+    """
+    try:
+        start = int(request.query.get("start", 0))
+        count = int(request.query.get("count", 20))
+    except ValueError:
+        start, count = -1, 0
+    if start < 0 or count < 1:
+        return web.json_response({"error": "start must be >= 0 and count >= 1"}, status=400)
+    document_id = request.query.get("document")
+    loop = asyncio.get_running_loop()
+    if document_id:
+        page = await loop.run_in_executor(
+            None, document_store.get_store().get_sentence_range, document_id, start, count
+        )
+        if page is None:
+            return web.json_response({"error": "Document not found", "document_id": document_id}, status=404)
+        return web.json_response(page)
+    try:
+        page = await loop.run_in_executor(None, document_store.file_sentence_range, OUTPUT_JSON, start, count)
+    except Exception as e:
+        return web.json_response({"error": "Failed to load output.json", "details": str(e)}, status=500)
+    return web.json_response(page)
+
+async def list_documents(request):
+    """
+    Lists the most recent documents in the store, see app.list_documents.
+    """
+    documents = await asyncio.get_running_loop().run_in_executor(
+        None, document_store.get_store().list_documents, int(request.query.get("limit", 100))
+    )
+    return web.json_response({"documents": documents})
+
+async def create_job(request):
+    """
+    Uploads page images and queues a pipeline job, see app.create_job.
+    """
+    pages = []
+    correction_mode = "full_text"
+    reader = await request.multipart()
+    async for part in reader:
+        if part.name == "image":
+            pages.append((part.filename, await part.read()))
+        elif part.name == "correction_mode":
+            correction_mode = await part.text()
+    client = request.headers.get("X-Client-Id") or request.remote
+    try:
+        job = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: job_queue.get_job_queue().submit(pages, client=client, correction_mode=correction_mode)
+        )
+    except job_queue.QueueFull as e:
+        return web.json_response({"error": str(e), "retry_after": e.retry_after}, status=429,
+                                 headers={"Retry-After": str(e.retry_after)})
+    except job_queue.JobError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+    return web.json_response(job_queue.with_links(job), status=202, headers={"Location": f"/jobs/{job['id']}"})
+
+async def list_jobs(request):
+    """
+    Recent jobs and the current queue depth, see app.list_jobs.
+    """
+    queue = job_queue.get_job_queue()
+    limit = int(request.query.get("limit", 50))
+    jobs = await asyncio.get_running_loop().run_in_executor(None, queue.list_jobs, limit)
+    return web.json_response({"queue": queue.depth(), "jobs": jobs})
+
+async def job_status(request):
+    """
+    Job status with per-stage progress, see app.job_status.
+    """
+    job_id = request.match_info["job_id"]
+    job = await asyncio.get_running_loop().run_in_executor(None, job_queue.get_job_queue().get, job_id)
+    if job is None:
+        return web.json_response({"error": "Job not found", "job_id": job_id}, status=404)
+    return web.json_response(job_queue.with_links(job))
+
+async def job_result(request):
+    """
+    The finished document, see app.job_result.
+    """
+    job_id = request.match_info["job_id"]
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, job_queue.get_job_queue().get, job_id)
+    if job is None:
+        return web.json_response({"error": "Job not found", "job_id": job_id}, status=404)
+    if job["status"] == "failed":
+        return web.json_response({"error": "Job failed", "details": job["error"], "job_id": job_id}, status=500)
+    if job["status"] != "done":
+        return web.json_response(job_queue.with_links(job), status=202)
+    body = await loop.run_in_executor(None, document_store.get_store().get_document_json, job_id)
+    if body is None:
+        return web.json_response({"error": "Document not found", "document_id": job_id}, status=404)
+    return web.Response(text=body, content_type="application/json")
+
+async def highlight_click(request):
+    """
+    Async twin of app.highlight_click.
+    Block lookup runs in a worker thread; the LLM calls are awaited, so one process
+    can hold many pending explanations at once.
+    """
+    try:
+        data = await request.json()
+        print("[DEBUG] Received highlight click:", data)
+
+        correction_info = await asyncio.get_running_loop().run_in_executor(
+            None, get_correction_explanation, data
+        )
+        if "error" in correction_info:
+            return web.json_response(correction_info, status=400)
+
+        args = (
+            data.get("blockType"),
+            correction_info.get("ocr_sentence"),
+            correction_info.get("corrected_sentence"),
+            correction_info.get("correction_block"),
+            correction_info.get("correction_entry"),
+        )
+        with llm_metrics.trace("highlight_click", blockType=data.get("blockType"),
+                               sentenceIndex=data.get("sentenceIndex")):
+            explanation = (await explanation_prefetch.get_prefetcher().ajoin(*args)
+                           or await agenerate_correction_explanation_cached(*args))
+        return web.json_response({"explanation": explanation})
+    except Exception as e:
+        print("[ERROR] Failed to process highlight click:", str(e))
+        return web.json_response({"error": "Internal server error", "details": str(e)}, status=500)
+
+async def highlight_click_stream(request):
+    """
+    Streaming variant of /highlight_click (server-sent events), see app.highlight_click_stream.
+    """
+    data = await request.json()
+    correction_info = await asyncio.get_running_loop().run_in_executor(
+        None, get_correction_explanation, data
+    )
+    if "error" in correction_info:
+        return web.json_response(correction_info, status=400)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    args = (
+        data.get("blockType"),
+        correction_info.get("ocr_sentence"),
+        correction_info.get("corrected_sentence"),
+        correction_info.get("correction_block"),
+        correction_info.get("correction_entry"),
+    )
+    try:
+        with llm_metrics.trace("highlight_click/stream", blockType=data.get("blockType"),
+                               sentenceIndex=data.get("sentenceIndex")):
+            # A running hover prefetch finishes first; the stream is then a cache hit.
+            await explanation_prefetch.get_prefetcher().ajoin(*args)
+            async for event, payload in astream_correction_explanation_cached(*args):
+                await response.write(format_sse(event, payload).encode("utf-8"))
+    except Exception as e:
+        print("[ERROR] Failed to stream highlight click:", str(e))
+        await response.write(format_sse("error", str(e)).encode("utf-8"))
+    await response.write_eof()
+    return response
+
+async def highlight_batch(request):
+    """
+    Explanations for many blocks in one request, see app.highlight_batch. The sentences
+    are read in a worker thread; the generations are awaited concurrently.
+    """
+    data = await request.json()
+    resolved = await asyncio.get_running_loop().run_in_executor(None, explanation_batch.resolve_batch, data)
+    if "error" in resolved:
+        return web.json_response(resolved, status=400)
+    try:
+        with llm_metrics.trace("highlight_batch", blocks=len(resolved)):
+            return web.json_response(await explanation_batch.abatch_explanations(resolved))
+    except Exception as e:
+        print("[ERROR] Failed to process highlight batch:", str(e))
+        return web.json_response({"error": "Internal server error", "details": str(e)}, status=500)
+
+async def highlight_batch_stream(request):
+    """
+    Streaming variant of /highlight_batch (server-sent events), see app.highlight_batch_stream.
+    """
+    data = await request.json()
+    resolved = await asyncio.get_running_loop().run_in_executor(None, explanation_batch.resolve_batch, data)
+    if "error" in resolved:
+        return web.json_response(resolved, status=400)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    try:
+        with llm_metrics.trace("highlight_batch/stream", blocks=len(resolved)):
+            async for event, payload in explanation_batch.aiter_batch_explanations(resolved):
+                await response.write(format_sse(event, payload).encode("utf-8"))
+    except Exception as e:
+        print("[ERROR] Failed to stream highlight batch:", str(e))
+        await response.write(format_sse("error", str(e)).encode("utf-8"))
+    await response.write_eof()
+    return response
+
+async def highlight_prefetch(request):
+    """
+    Hover prefetch, see app.highlight_prefetch. The generation runs on the prefetcher's
+    own threads; the lookup and the cache checks run in a worker thread.
+    """
+    data = await request.json()
+    loop = asyncio.get_running_loop()
+    correction_info = await loop.run_in_executor(None, get_correction_explanation, data)
+    if "error" in correction_info:
+        return web.json_response(correction_info, status=400)
+    session = request.headers.get("X-Client-Id") or request.remote
+    prefetcher = explanation_prefetch.get_prefetcher()
+    status = await loop.run_in_executor(
+        None,
+        prefetcher.prefetch,
+        session,
+        data.get("blockType"),
+        correction_info.get("ocr_sentence"),
+        correction_info.get("corrected_sentence"),
+        correction_info.get("correction_block"),
+        correction_info.get("correction_entry"),
+    )
+    result = {"status": status, "remaining": prefetcher.remaining(session)}
+    if status == "over_budget":
+        return web.json_response(result, status=429)
+    return web.json_response(result, status=202 if status in ("queued", "pending") else 200)
+
+async def prefetch_stats(request):
+    """
+    Hover prefetch counts for this worker process, see app.prefetch_stats.
+    """
+    return web.json_response(explanation_prefetch.get_prefetcher().stats())
+
+async def llm_stats(request):
+    """
+    Per-call LLM stats for this worker process, see app.llm_stats.
+    """
+    return web.json_response(llm_metrics.get_stats(traces=int(request.query.get("traces", 10))))
+
+async def cache_stats(request):
+    """
+    Cache tier stats for this worker process, see app.cache_stats.
+    """
+    return web.json_response(shared_cache.get_stats())
+
+async def close_llm_client(app):
+    # llm_client is imported on the first LLM call (see generate_explanation); nothing to close before that.
+    llm_client = sys.modules.get("llm_client")
+    if llm_client is not None:
+        await llm_client.aclose()
+
+def create_app():
+    # Room for a full multi-page upload (aiohttp's default limit is 1 MiB).
+    app = web.Application(client_max_size=job_queue.MAX_PAGES * job_queue.MAX_UPLOAD_BYTES)
+    app.router.add_get("/", index)
+    app.router.add_get("/data.json", get_data)
+    app.router.add_get("/data.json/index", get_data_index)
+    app.router.add_get("/sentences", get_sentences)
+    app.router.add_get("/documents", list_documents)
+    app.router.add_post("/jobs", create_job)
+    app.router.add_get("/jobs", list_jobs)
+    app.router.add_get("/jobs/{job_id}", job_status)
+    app.router.add_get("/jobs/{job_id}/result", job_result)
+    app.router.add_post("/highlight_click", highlight_click)
+    app.router.add_post("/highlight_click/stream", highlight_click_stream)
+    app.router.add_post("/highlight_batch", highlight_batch)
+    app.router.add_post("/highlight_batch/stream", highlight_batch_stream)
+    app.router.add_post("/highlight_prefetch", highlight_prefetch)
+    app.router.add_get("/prefetch_stats", prefetch_stats)
+    app.router.add_get("/llm_stats", llm_stats)
+    app.router.add_get("/cache_stats", cache_stats)
+    app.router.add_static("/static", STATIC_DIR)
+    app.on_cleanup.append(close_llm_client)
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    """
+    Runs the asyncio server directly.
+    Under gunicorn, use the aiohttp worker class instead:
+      gunicorn -b 0.0.0.0:5000 --worker-class aiohttp.GunicornWebWorker async_app:app
+    """
+    web.run_app(app, host="0.0.0.0", port=5000)
@@ -1,8 +1,12 @@
 import json
 import os
 import sys
-import copy
-import string
+
+# custom_sentence, document_store and sentence_index live in renderer/run
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import custom_sentence
+import document_store
+from sentence_index import IndexUnavailable, read_record
 
 # Paths (adjust as needed)
 SENTENCE_MAPPING_PATH = "/home/keithuncouth/hw_hero/renderer/run/sentence_mapping.json"
@@ -11,13 +15,15 @@ OUTPUT_JSON_PATH = "/home/keithuncouth/hw_hero/renderer/run/app/output.json"
 # --- Configurable Isolated Punctuation Rules ---
 
 # Default set of punctuation characters to consider
-CUSTOM_ISOLATED_PUNCTUATION = set(string.punctuation)  # You can update this later.
+CUSTOM_ISOLATED_PUNCTUATION = set(custom_sentence.ISOLATED_PUNCTUATION)  # You can update this later.
 # Custom sequences (tuples of characters) that count as isolated (e.g. double periods)
-CUSTOM_SEQUENCES = {("..",), ("...",)}
+CUSTOM_SEQUENCES = set(custom_sentence.ISOLATED_SEQUENCES)
 
 def update_isolated_punctuation_rules(new_punctuation_set=None, new_sequences=None):
     """
     Update the rules for isolated punctuation.
+    Only documents without precomputed custom sentences (rendered before main.py stored them)
+    are affected; the others were classified with the defaults when they were rendered.
     Args:
         new_punctuation_set (set): New set of punctuation characters.
         new_sequences (set): New set of tuples representing punctuation sequences.
@@ -33,52 +39,40 @@ def update_isolated_punctuation_rules(new_punctuation_set=None, new_sequences=No
 
 def is_isolated_punctuation(token, token_list):
     """
-    Determines if a token is isolated punctuation.
-    A token is isolated if its character is in the CUSTOM_ISOLATED_PUNCTUATION set and 
-    both its previous and next tokens (if any) are punctuation or spaces,
-    or if it is part of a custom sequence defined in CUSTOM_SEQUENCES.
+    Determines if a token is isolated punctuation under the current rules
+    (see custom_sentence.is_isolated_punctuation).
     """
-    index = token["index"]
-    char = token["char"]
-    if char not in CUSTOM_ISOLATED_PUNCTUATION:
-        return False
-    prev_token = token_list[index - 1] if index > 0 else None
-    next_token = token_list[index + 1] if index + 1 < len(token_list) else None
-    prev_ok = (prev_token is None) or (prev_token["char"] in CUSTOM_ISOLATED_PUNCTUATION or prev_token["char"] == " ")
-    next_ok = (next_token is None) or (next_token["char"] in CUSTOM_ISOLATED_PUNCTUATION or next_token["char"] == " ")
-    surrounding = "".join(token_list[i]["char"] for i in range(max(0, index - 1), min(len(token_list), index + 2)))
-    sequence_found = any("".join(seq) in surrounding for seq in CUSTOM_SEQUENCES)
-    return (prev_ok and next_ok) or sequence_found
+    return custom_sentence.is_isolated_punctuation(token, token_list, CUSTOM_ISOLATED_PUNCTUATION, CUSTOM_SEQUENCES)
 
-def get_ocr_sentence_if_isolated(correction_entry, clicked_delete_block_id):
+def get_ocr_sentence_if_isolated(correction_entry, clicked_delete_block_id, ocr_sentence=None):
     """
     If any delete token (for the clicked block) is isolated punctuation, load and return the OCR sentence.
-    Otherwise, return None.
+    Otherwise, return None. Pass ocr_sentence when the caller already has it to skip loading the mapping.
     """
-    tokens = correction_entry.get("final_sentence_tokens", [])
-    for token in tokens:
-        if token.get("type") == "delete" and int(token.get("deleteBlockId", -1)) == int(clicked_delete_block_id):
-            if is_isolated_punctuation(token, tokens):
-                print(f"\n--- DEBUG: Isolated punctuation detected ('{token['char']}') at index {token['index']} ---")
-                if not os.path.exists(SENTENCE_MAPPING_PATH):
-                    print(f"ERROR: {SENTENCE_MAPPING_PATH} not found.")
-                    return {"error": "Sentence mapping file not found"}
-                try:
-                    with open(SENTENCE_MAPPING_PATH, "r", encoding="utf-8") as f:
-                        sentence_mapping = json.load(f)
-                    sentence_index = correction_entry.get("sentence_index")
-                    sentence_entry = next((s for s in sentence_mapping.get("sentences", [])
-                                           if s.get("sentence_index") == sentence_index), None)
-                    if sentence_entry:
-                        print("\n--- DEBUG: Returning OCR sentence due to isolated punctuation ---")
-                        return sentence_entry.get("ocr_sentence", "")
-                    else:
-                        print(f"ERROR: No sentence found in mapping for index {sentence_index}")
-                        return {"error": "OCR sentence not found"}
-                except Exception as e:
-                    print("ERROR: Failed to load sentence mapping:", str(e))
-                    return {"error": "JSON load error", "details": str(e)}
-    return None
+    if not custom_sentence.delete_is_isolated_punctuation(correction_entry, clicked_delete_block_id,
+                                                         CUSTOM_ISOLATED_PUNCTUATION, CUSTOM_SEQUENCES):
+        return None
+    print(f"\n--- DEBUG: Isolated punctuation detected in delete block {clicked_delete_block_id} ---")
+    if ocr_sentence is not None:
+        return ocr_sentence
+    if not os.path.exists(SENTENCE_MAPPING_PATH):
+        print(f"ERROR: {SENTENCE_MAPPING_PATH} not found.")
+        return {"error": "Sentence mapping file not found"}
+    try:
+        with open(SENTENCE_MAPPING_PATH, "r", encoding="utf-8") as f:
+            sentence_mapping = json.load(f)
+        sentence_index = correction_entry.get("sentence_index")
+        sentence_entry = next((s for s in sentence_mapping.get("sentences", [])
+                               if s.get("sentence_index") == sentence_index), None)
+        if sentence_entry:
+            print("\n--- DEBUG: Returning OCR sentence due to isolated punctuation ---")
+            return sentence_entry.get("ocr_sentence", "")
+        else:
+            print(f"ERROR: No sentence found in mapping for index {sentence_index}")
+            return {"error": "OCR sentence not found"}
+    except Exception as e:
+        print("ERROR: Failed to load sentence mapping:", str(e))
+        return {"error": "JSON load error", "details": str(e)}
 
 # --- Standard Functions ---
 
@@ -93,6 +87,8 @@ def get_correction_explanation(data):
     except Exception as e:
         print("DEBUG: Input parsing error:", e)
         return {"error": "Invalid input", "details": str(e)}
+    if data.get("documentId"):
+        return get_correction_explanation_from_store(data["documentId"], block_type, block_index, sentence_index)
     if not os.path.exists(SENTENCE_MAPPING_PATH):
         print(f"ERROR: {SENTENCE_MAPPING_PATH} does not exist")
         return {"error": "Sentence mapping file not found"}
@@ -100,23 +96,14 @@ def get_correction_explanation(data):
         print(f"ERROR: {OUTPUT_JSON_PATH} does not exist")
         return {"error": "Output file not found"}
     try:
-        with open(SENTENCE_MAPPING_PATH, "r", encoding="utf-8") as f:
-            sentence_mapping = json.load(f)
-        with open(OUTPUT_JSON_PATH, "r", encoding="utf-8") as f:
-            output_data = json.load(f)
-        print(f"DEBUG: Loaded {len(sentence_mapping.get('sentences', []))} sentences")
-        print(f"DEBUG: Loaded {len(output_data.get('sentences', []))} corrections")
+        sentence_entry, correction_entry = load_sentence_entries(sentence_index)
     except Exception as e:
         print("DEBUG: Error loading JSON files:", e)
         return {"error": "JSON load error", "details": str(e)}
-    sentence_entry = next((s for s in sentence_mapping.get("sentences", [])
-                           if s.get("sentence_index") == sentence_index), None)
     if not sentence_entry:
         print(f"DEBUG: No sentence found for index {sentence_index}")
         return {"error": "Sentence not found", "sentence_index": sentence_index}
     print(f"DEBUG: Found sentence {sentence_entry.get('ocr_sentence')}")
-    correction_entry = next((c for c in output_data.get("sentences", [])
-                             if c.get("sentence_index") == sentence_index), None)
     if not correction_entry:
         print(f"DEBUG: No correction found for index {sentence_index}")
         return {"error": "Corrections not found", "sentence_index": sentence_index}
@@ -143,11 +130,180 @@ def get_correction_explanation(data):
     print("DEBUG: Correction block found:", correction_block)
     print("DEBUG: Correction entry keys:", list(correction_entry.keys()))
     print("DEBUG: final_sentence_tokens:", correction_entry.get("final_sentence_tokens"))
+    # Decoded for this call only, so no copies are needed.
+    return {
+        "ocr_sentence": sentence_entry.get("ocr_sentence"),
+        "corrected_sentence": sentence_entry.get("corrected_sentence"),
+        "correction_block": correction_block,
+        "correction_entry": correction_entry
+    }
+
+# --- Batches (POST /highlight_batch) ---
+
+BLOCK_TYPES = {block_type: (key, index_field) for key, (block_type, index_field) in document_store.BLOCK_KINDS.items()}
+
+def batch_key(sentence_index, block_type, block_index):
+    """
+    Key of one block in a batch request and response, e.g. "3:replacement:0".
+    """
+    return f"{sentence_index}:{block_type}:{block_index}"
+
+def find_block(correction_entry, block_type, block_index):
+    """
+    The block of the given type and index in a rendered sentence entry, or None.
+    """
+    key, index_field = BLOCK_TYPES[block_type]
+    return next((b for b in correction_entry.get(key, []) if b.get(index_field, -1) == block_index), None)
+
+def parse_block_requests(data):
+    """
+    Return ([(sentence_index, block_type, block_index)], [sentence_index]) from a batch
+    request: "blocks" as {"sentenceIndex", "blockType", "blockIndex"} objects or
+    [sentenceIndex, blockType, blockIndex] lists, and "sentences" whose blocks are all wanted.
+    Raises ValueError (or KeyError/TypeError) on malformed input.
+    """
+    requested = []
+    for entry in data.get("blocks") or []:
+        if isinstance(entry, dict):
+            entry = (entry["sentenceIndex"], entry["blockType"], entry["blockIndex"])
+        sentence_index, block_type, block_index = entry
+        if block_type not in BLOCK_TYPES:
+            raise ValueError(f"Unknown block type: {block_type}")
+        requested.append((int(sentence_index), block_type, int(block_index)))
+    sentences = [int(s) for s in data.get("sentences") or []]
+    if not requested and not sentences:
+        raise ValueError("No blocks or sentences requested")
+    return requested, sentences
+
+def get_correction_explanations(data, store=None):
+    """
+    get_correction_explanation for many blocks at once ({"blocks", "sentences", "documentId"},
+    see parse_block_requests). Each sentence is read once however many of its blocks are
+    asked for. Returns {batch_key: correction info (plus "block_type") or error} in request
+    order (a listed sentence that can't be read is reported under its index), or
+    {"error": ...} if the request itself is invalid.
+    """
+    try:
+        requested, sentences = parse_block_requests(data)
+    except (KeyError, TypeError, ValueError) as e:
+        print("DEBUG: Batch input parsing error:", e)
+        return {"error": "Invalid input", "details": str(e)}
+    document_id = data.get("documentId")
+    if not document_id and not os.path.exists(SENTENCE_MAPPING_PATH):
+        print(f"ERROR: {SENTENCE_MAPPING_PATH} does not exist")
+        return {"error": "Sentence mapping file not found"}
+    if not document_id and not os.path.exists(OUTPUT_JSON_PATH):
+        print(f"ERROR: {OUTPUT_JSON_PATH} does not exist")
+        return {"error": "Output file not found"}
+    store = store or (document_store.get_store() if document_id else None)
+    loaded = {}
+
+    def load(sentence_index):
+        # (sentence mapping entry, rendered entry), or an error dict
+        if sentence_index not in loaded:
+            try:
+                if document_id:
+                    found = store.get_sentence(document_id, sentence_index)
+                else:
+                    found = load_sentence_entries(sentence_index)
+                    found = None if None in found else found
+            except Exception as e:
+                print("DEBUG: Error loading sentence", sentence_index, e)
+                found = {"error": "Sentence load error", "details": str(e)}
+            loaded[sentence_index] = found or {"error": "Sentence not found", "sentence_index": sentence_index}
+        return loaded[sentence_index]
+
+    results = {}
+    for sentence_index in sentences:
+        found = load(sentence_index)
+        if isinstance(found, dict):
+            results[str(sentence_index)] = found
+            continue
+        for block_type, (key, index_field) in BLOCK_TYPES.items():
+            requested.extend((sentence_index, block_type, b.get(index_field, -1)) for b in found[1].get(key, []))
+
+    for sentence_index, block_type, block_index in requested:
+        key = batch_key(sentence_index, block_type, block_index)
+        found = load(sentence_index)
+        if isinstance(found, dict):
+            results[key] = found
+            continue
+        sentence_entry, correction_entry = found
+        correction_block = find_block(correction_entry, block_type, block_index)
+        if correction_block is None:
+            results[key] = {"error": f"{block_type.capitalize()} block not found", "block_index": block_index}
+            continue
+        results[key] = {
+            "block_type": block_type,
+            "ocr_sentence": sentence_entry.get("ocr_sentence"),
+            "corrected_sentence": sentence_entry.get("corrected_sentence"),
+            "correction_block": correction_block,
+            "correction_entry": correction_entry
+        }
+    print(f"DEBUG: Resolved {len(results)} batch blocks from {len(loaded)} sentences")
+    return results
+
+def load_sentence_entries(sentence_index):
+    """
+    Return (sentence mapping entry, output.json entry) for one sentence, either may be None.
+    Reads just that sentence through the .idx sidecars main.py writes; files without an
+    up-to-date sidecar are parsed whole.
+    """
+    entries = []
+    for path in (SENTENCE_MAPPING_PATH, OUTPUT_JSON_PATH):
+        try:
+            entries.append(read_record(path, sentence_index))
+            continue
+        except IndexUnavailable as e:
+            print(f"DEBUG: {e}; parsing the whole file")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        print(f"DEBUG: Loaded {len(data.get('sentences', []))} sentences from {path}")
+        entries.append(next((s for s in data.get("sentences", []) if s.get("sentence_index") == sentence_index), None))
+    return tuple(entries)
+
+def get_correction_explanation_from_store(document_id, block_type, block_index, sentence_index, store=None):
+    """
+    get_correction_explanation for a document in the document store: two indexed
+    lookups (the sentence and the block) instead of loading both JSON files, cached in the
+    store's shared cache until the document changes. (output.json lookups are not cached:
+    they decode one record through the mmapped sidecar already.)
+    """
+    store = store or document_store.get_store()
+    cache_key = f"{document_id}:{sentence_index}:{block_type}:{block_index}"
+    cached = store.cache.get(document_store.CORRECTION_CACHE, cache_key)
+    if cached is not None:
+        print(f"DEBUG: Correction cache hit for {cache_key}")
+        return json.loads(cached)
+    token = store.cache.token()
+    result = lookup_correction_in_store(store, document_id, block_type, block_index, sentence_index)
+    if "error" not in result:
+        store.cache.set(document_store.CORRECTION_CACHE, cache_key, json.dumps(result), scope=document_id, since=token)
+    return result
+
+def lookup_correction_in_store(store, document_id, block_type, block_index, sentence_index):
+    try:
+        found = store.get_sentence(document_id, sentence_index)
+        if found is None:
+            print(f"DEBUG: No sentence {sentence_index} in document {document_id}")
+            return {"error": "Sentence not found", "sentence_index": sentence_index, "document_id": document_id}
+        sentence_entry, correction_entry = found
+        if f"{block_type}_blocks" not in correction_entry:
+            print(f"DEBUG: Block type '{block_type}' not found")
+            return {"error": "Invalid block type", "block_type": block_type}
+        correction_block = store.get_block(document_id, sentence_index, block_type, block_index)
+    except Exception as e:
+        print("DEBUG: Error reading document store:", e)
+        return {"error": "Document store error", "details": str(e)}
+    if not correction_block:
+        print(f"DEBUG: No block found for type {block_type} at index {block_index}")
+        return {"error": f"{block_type.capitalize()} block not found", "block_index": block_index}
+    # Freshly decoded from the store, so no copies are needed.
     return {
         "ocr_sentence": sentence_entry.get("ocr_sentence"),
         "corrected_sentence": sentence_entry.get("corrected_sentence"),
-        "correction_block": copy.deepcopy(correction_block),
-        "correction_entry": copy.deepcopy(correction_entry)
+        "correction_block": correction_block,
+        "correction_entry": correction_entry
     }
 
 def generate_custom_sentence_for_block(correction_entry, correction_block, block_type):
@@ -158,92 +314,16 @@ def generate_custom_sentence_for_block(correction_entry, correction_block, block
     For insert blocks, removes tokens in the clicked range.
     For delete blocks, no further modification is needed.
     Finally, all tokens flagged as delete (from any delete block) are removed.
+    main.py stores the result on each block; this is the fallback for older documents.
     """
-    tokens = list(correction_entry.get("final_sentence_tokens", []))
-    
-    if block_type == "replacement":
-        clicked_block_id = correction_block.get("block_index")
-        # Apply corrections for non-clicked replacement blocks.
-        for block in correction_entry.get("replacement_blocks", []):
-            if block.get("block_index") != clicked_block_id:
-                start = block.get("final_start")
-                corrected_text = block.get("corrected_text", "")
-                replaced_text = block.get("replaced_text", "")
-                original_span = len(replaced_text)
-                print(f"DEBUG: [Tokens] Non-clicked Replacement block (id {block.get('block_index')}): start={start}, corrected_text='{corrected_text}', replaced_text='{replaced_text}'")
-                for i, ch in enumerate(corrected_text):
-                    pos = start + i
-                    if pos < len(tokens):
-                        tokens[pos]["char"] = ch
-                # Clear extra tokens if corrected_text is shorter.
-                for pos in range(start + len(corrected_text), start + original_span):
-                    if pos < len(tokens):
-                        tokens[pos]["char"] = ""
-    
-    elif block_type == "insert":
-        start = correction_block.get("final_start")
-        end = correction_block.get("final_end")
-        print(f"DEBUG: [Tokens] Insert block: Removing tokens from index {start} to {end} (inclusive)")
-        tokens = [token for i, token in enumerate(tokens) if not (i >= start and i <= end)]
-    
-    elif block_type == "delete":
-        print("DEBUG: [Tokens] Delete block: No additional token modification needed")
-    
-    # Remove all tokens flagged as delete to reduce noise.
-    tokens = [token for token in tokens if token.get("type") != "delete"]
-    
-    custom_sentence = "".join(token["char"] for token in tokens)
-    # Trim extra spaces that may occur.
-    custom_sentence = " ".join(custom_sentence.split())
-    print("DEBUG: [Tokens] Custom sentence after all modifications:", custom_sentence)
-    return custom_sentence
+    custom = custom_sentence.custom_sentence_for_block(correction_entry, correction_block, block_type)
+    print("DEBUG: [Tokens] Custom sentence after all modifications:", custom)
+    return custom
 
 
 # --- For Delete Blocks: Rebuild Without Processing Insert Tokens ---
 def rebuild_sentence_for_delete(correction_entry, clicked_delete_block_id):
-    tokens = correction_entry.get("final_sentence_tokens", [])
-    replacement_blocks = correction_entry.get("replacement_blocks", [])
-    print("\n--- DEBUG: ORIGINAL TOKENS (Ignoring Inserts) ---")
-    for token in tokens:
-        print(f"INDEX {token['index']} | TYPE: {token.get('type','')} | CHAR: '{token['char']}'")
-    
-    tokens_sorted = sorted(tokens, key=lambda t: t.get("index", 0))
-    working_tokens = list(tokens_sorted)
-
-    for rep in replacement_blocks:
-        start = rep.get("final_start")
-        corrected_text = rep.get("corrected_text", "")
-        replaced_text = rep.get("replaced_text", "")
-        original_span = len(replaced_text)
-        print(f"\n--- DEBUG: Processing Replacement Block at index {start} ---")
-        print(f"Corrected text: '{corrected_text}' (len={len(corrected_text)})")
-        print(f"Replaced text:  '{replaced_text}' (len={original_span})")
-        for i, ch in enumerate(corrected_text):
-            pos = start + i
-            if pos < len(working_tokens):
-                print(f"Before: Token at pos {pos} = '{working_tokens[pos]['char']}'")
-                working_tokens[pos]["char"] = ch
-                print(f"After:  Token at pos {pos} = '{working_tokens[pos]['char']}'")
-        for pos in range(start + len(corrected_text), start + original_span):
-            if pos < len(working_tokens):
-                print(f"Blanking out token at pos {pos} (was '{working_tokens[pos]['char']}')")
-                working_tokens[pos]["char"] = ""
-    
-    print("\n--- DEBUG: TOKENS AFTER REPLACEMENT (Ignoring Inserts) ---")
-    for token in working_tokens:
-        print(f"INDEX {token.get('index','?')} | TYPE: {token.get('type','')} | CHAR: '{token.get('char','')}'")
-    
-    clicked_delete_block_id = int(clicked_delete_block_id)
-    final_tokens = [
-        token for token in working_tokens
-        if not (token.get("type") == "delete" and int(token.get("deleteBlockId", -1)) != clicked_delete_block_id)
-    ]
-    
-    print("\n--- DEBUG: FINAL TOKENS (After Filtering Deletes) ---")
-    for token in final_tokens:
-        print(f"INDEX {token.get('index','?')} | TYPE: {token.get('type','')} | CHAR: '{token.get('char','')}'")
-    
-    final_sentence = "".join(token["char"] for token in final_tokens)
+    final_sentence = custom_sentence.sentence_for_delete(correction_entry, clicked_delete_block_id)
     print("\n--- DEBUG: FINAL REBUILT SENTENCE (No Inserts) ---")
     print(final_sentence)
     return final_sentence
@@ -0,0 +1,183 @@
+# explanation_batch.py
+#
+# Explanations for many blocks in one request (POST /highlight_batch, or
+# /highlight_batch/stream as server-sent events), e.g. every correction in a sentence or
+# in a whole essay for the teacher view, instead of one /highlight_click per block.
+#
+# correction_service.get_correction_explanations resolves the blocks with one lookup per
+# sentence. Then, per block:
+# - cached and rule-based explanations are answered at once, without an LLM call;
+# - blocks whose prompts would be identical (the same edit in the same sentence context)
+#   share one generation;
+# - a hover prefetch still running for a block is joined (see explanation_prefetch);
+# - the rest are generated BATCH_CONCURRENCY at a time.
+# Every explanation is cached under the same key as /highlight_click, so a later click on
+# any block of the batch is a cache hit.
+#
+# Blocks are not merged into one multi-block prompt per sentence: the answer for a block
+# would then depend on which other blocks were asked for with it, and could not be shared
+# with single clicks through the explanation cache.
+
+import asyncio
+import contextvars
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import explanation_prefetch
+import shared_cache
+from correction_service import get_correction_explanations
+from generate_explanation import (
+    agenerate_correction_explanation_cached,
+    cached_explanation,
+    explanation_cache_key,
+    generate_correction_explanation_cached,
+    rule_based_explanation,
+    run_off_loop
+)
+
+BATCH_CONCURRENCY = int(os.getenv("HW_HERO_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_BLOCKS = int(os.getenv("HW_HERO_MAX_BATCH_BLOCKS", "300"))
+
+
+def resolve_batch(data):
+    """
+    The blocks of a batch request ({batch_key: correction info or error}), or {"error": ...}
+    if the request is invalid or asks for more than MAX_BATCH_BLOCKS blocks.
+    """
+    resolved = get_correction_explanations(data)
+    if "error" in resolved:
+        return resolved
+    if len(resolved) > MAX_BATCH_BLOCKS:
+        return {"error": f"At most {MAX_BATCH_BLOCKS} blocks per batch", "blocks": len(resolved)}
+    return resolved
+
+
+def plan_batch(resolved, cache):
+    """
+    Split resolved blocks into answers available now ({batch_key: result}) and the
+    generations still needed ({explanation cache key: (args, [batch_key, ...])}).
+    """
+    answers, jobs = {}, {}
+    counts = Counter(blocks=len(resolved), rule_based=0, cached=0, deduped=0, generated=0, errors=0)
+    for key, info in resolved.items():
+        if "error" in info:
+            answers[key] = info
+            counts["errors"] += 1
+            continue
+        args = (info["block_type"], info["ocr_sentence"], info["corrected_sentence"],
+                info["correction_block"], info["correction_entry"])
+        explanation = rule_based_explanation(args[0], args[3])
+        if explanation is not None:
+            answers[key] = {"explanation": explanation}
+            counts["rule_based"] += 1
+            continue
+        cache_key = explanation_cache_key(*args)
+        if cache_key in jobs:
+            jobs[cache_key][1].append(key)
+            counts["deduped"] += 1
+            continue
+        explanation = cached_explanation(cache_key, cache)
+        if explanation is not None:
+            answers[key] = {"explanation": explanation}
+            counts["cached"] += 1
+            continue
+        jobs[cache_key] = (args, [key])
+    counts["generated"] = len(jobs)
+    return answers, jobs, counts
+
+
+def explain(args, cache):
+    return explanation_prefetch.get_prefetcher().join(*args) or generate_correction_explanation_cached(*args, cache=cache)
+
+
+def iter_batch_explanations(resolved, cache=None, concurrency=BATCH_CONCURRENCY):
+    """
+    Yield ("block", {"key", "explanation" or "error"}) for each block as soon as it is
+    ready, cached and rule-based ones first, then ("done", stats).
+    """
+    started = time.perf_counter()
+    cache = cache or shared_cache.get_cache()
+    answers, jobs, counts = plan_batch(resolved, cache)
+    for key, result in answers.items():
+        yield "block", dict(result, key=key)
+    if jobs:
+        with ThreadPoolExecutor(min(concurrency, len(jobs)), thread_name_prefix="batch") as pool:
+            # Each thread runs in a copy of this context, so its LLM calls join the request's trace.
+            futures = {pool.submit(contextvars.copy_context().run, explain, args, cache): keys
+                       for args, keys in jobs.values()}
+            for future in as_completed(futures):
+                try:
+                    result = {"explanation": future.result()}
+                except Exception as e:
+                    print("[ERROR] Batch explanation failed:", str(e))
+                    result = {"error": "Explanation failed", "details": str(e)}
+                    counts["errors"] += len(futures[future])
+                for key in futures[future]:
+                    yield "block", dict(result, key=key)
+    yield "done", dict(counts, seconds=round(time.perf_counter() - started, 3))
+
+
+async def aexplain(args, cache, semaphore):
+    async with semaphore:
+        return (await explanation_prefetch.get_prefetcher().ajoin(*args)
+                or await agenerate_correction_explanation_cached(*args, cache=cache))
+
+
+async def aiter_batch_explanations(resolved, cache=None, concurrency=BATCH_CONCURRENCY):
+    """
+    Async version of iter_batch_explanations; the generations are awaited concurrently.
+    """
+    started = time.perf_counter()
+    cache = cache or shared_cache.get_cache()
+    answers, jobs, counts = await run_off_loop(plan_batch, resolved, cache)
+    for key, result in answers.items():
+        yield "block", dict(result, key=key)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(args, keys):
+        try:
+            return keys, {"explanation": await aexplain(args, cache, semaphore)}
+        except Exception as e:
+            print("[ERROR] Batch explanation failed:", str(e))
+            counts["errors"] += len(keys)
+            return keys, {"error": "Explanation failed", "details": str(e)}
+
+    for next_done in asyncio.as_completed([run(args, keys) for args, keys in jobs.values()]):
+        keys, result = await next_done
+        for key in keys:
+            yield "block", dict(result, key=key)
+    yield "done", dict(counts, seconds=round(time.perf_counter() - started, 3))
+
+
+def collect(resolved, events):
+    """
+    {"explanations": {batch_key: result}, "stats": ...} in request order, from the events.
+    """
+    explanations = dict.fromkeys(resolved)
+    stats = {}
+    for event, payload in events:
+        if event == "done":
+            stats = payload
+        else:
+            key = payload.pop("key")
+            explanations[key] = payload
+    return {"explanations": explanations, "stats": stats}
+
+
+def batch_explanations(resolved, cache=None, concurrency=BATCH_CONCURRENCY):
+    """
+    All explanations of a resolved batch as one response body (see collect).
+    """
+    return collect(resolved, iter_batch_explanations(resolved, cache, concurrency))
+
+
+async def abatch_explanations(resolved, cache=None, concurrency=BATCH_CONCURRENCY):
+    """
+    Async version of batch_explanations.
+    """
+    return collect(resolved, [item async for item in aiter_batch_explanations(resolved, cache, concurrency)])
@@ -0,0 +1,227 @@
+# explanation_prefetch.py
+#
+# Hover prefetch of explanations (POST /highlight_prefetch). When the student hovers a
+# highlight box the frontend asks for that block's explanation to be generated in the
+# background into the shared explanation cache, so the click that usually follows is a
+# cache hit instead of a multi-second LLM chain.
+#
+# Prefetching is low priority and bounded:
+# - It runs on its own small thread pool (PREFETCH_WORKERS), never in the request, and is
+#   dropped ("busy") when PREFETCH_MAX_PENDING generations are already queued or running.
+# - Each session (X-Client-Id header, else the remote address, as for /jobs) may start at
+#   most PREFETCH_BUDGET generations per PREFETCH_WINDOW_SECONDS. Cached, rule-based and
+#   already pending blocks are free.
+# - Dedupe: a block already being generated in this process is joined, not restarted. A
+#   claim entry in the shared cache does the same across gunicorn workers, so a hover
+#   served by one worker and the click served by another make one set of LLM calls.
+#
+# A click on a block whose prefetch is still running waits for it (join/ajoin) instead of
+# generating the explanation a second time.
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shared_cache
+from generate_explanation import (
+    EXPLANATION_CACHE,
+    explanation_cache_key,
+    generate_correction_explanation_single
+)
+from rule_based_explanation import explain_trivial_edit
+
+PREFETCH_WORKERS = int(os.getenv("HW_HERO_PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("HW_HERO_PREFETCH_MAX_PENDING", "8"))
+PREFETCH_BUDGET = int(os.getenv("HW_HERO_PREFETCH_BUDGET", "30"))
+PREFETCH_WINDOW_SECONDS = float(os.getenv("HW_HERO_PREFETCH_WINDOW_SECONDS", "600"))
+# How long a click waits for a pending prefetch, and how long a claim by another worker
+# is trusted (a worker that died mid-generation leaves its claim behind).
+PREFETCH_WAIT_SECONDS = float(os.getenv("HW_HERO_PREFETCH_WAIT_SECONDS", "30"))
+# Claims live in the shared cache too, scoped by explanation key so they can be dropped one by one.
+CLAIM_CACHE = "explanation_claims"
+CLAIM_POLL_SECONDS = 0.1
+MAX_SESSIONS = 10000  # Budget windows kept before idle ones are forgotten
+
+
+class Prefetcher:
+    """
+    Background explanation generation with dedupe and per-session budgets.
+    """
+    def __init__(self, workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING, budget=PREFETCH_BUDGET,
+                 window_seconds=PREFETCH_WINDOW_SECONDS, wait_seconds=PREFETCH_WAIT_SECONDS, cache=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.budget = budget
+        self.window_seconds = window_seconds
+        self.wait_seconds = wait_seconds
+        self.cache = cache
+        self._pool = None  # Started on the first prefetch (after gunicorn has forked)
+        self._lock = threading.Lock()
+        self._pending = {}  # explanation key -> Future
+        self._spent = {}  # session -> deque of start times within the window
+        self.counts = Counter()
+
+    def get_cache(self):
+        return self.cache or shared_cache.get_cache()
+
+    def remaining(self, session, now=None):
+        """
+        Prefetches session may still start in the current window.
+        """
+        with self._lock:
+            return self.budget - len(self._window(session, now or time.monotonic()))
+
+    def _window(self, session, now):
+        # Caller holds self._lock.
+        spent = self._spent.get(session)
+        if spent is None:
+            if len(self._spent) >= MAX_SESSIONS:
+                self._forget_idle_sessions(now)
+            spent = self._spent[session] = deque()
+        while spent and now - spent[0] >= self.window_seconds:
+            spent.popleft()
+        return spent
+
+    def _forget_idle_sessions(self, now):
+        for session in [s for s, spent in self._spent.items() if not spent or now - spent[-1] >= self.window_seconds]:
+            del self._spent[session]
+
+    def prefetch(self, session, block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        """
+        Start generating the explanation in the background unless it is not needed or not allowed.
+        Returns the status: "cached", "rule_based", "pending", "queued", "over_budget" or "busy".
+        """
+        if explain_trivial_edit(block_type, correction_block) is not None:
+            return self._count("rule_based")
+        cache = self.get_cache()
+        key = explanation_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry)
+        if cache.get(EXPLANATION_CACHE, key) is not None:
+            return self._count("cached")
+        now = time.monotonic()
+        with self._lock:
+            if key in self._pending or self._claimed_elsewhere(cache, key):
+                return self._count("pending", locked=True)
+            spent = self._window(session, now)
+            if len(spent) >= self.budget:
+                return self._count("over_budget", locked=True)
+            if len(self._pending) >= self.max_pending:
+                return self._count("busy", locked=True)
+            spent.append(now)
+            cache.set(CLAIM_CACHE, key, str(time.time()), scope=key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="prefetch")
+            args = (block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry)
+            self._pending[key] = self._pool.submit(self._generate, cache, key, args)
+            return self._count("queued", locked=True)
+
+    def _count(self, status, locked=False):
+        if locked:
+            self.counts[status] += 1
+        else:
+            with self._lock:
+                self.counts[status] += 1
+        return status
+
+    def _claimed_elsewhere(self, cache, key):
+        claimed_at = cache.get(CLAIM_CACHE, key)
+        return claimed_at is not None and time.time() - float(claimed_at) < self.wait_seconds
+
+    def _generate(self, cache, key, args):
+        try:
+            token = cache.token()
+            explanation = generate_correction_explanation_single(*args)
+            cache.set(EXPLANATION_CACHE, key, explanation, since=token)
+            return explanation
+        except Exception as e:
+            print(f"[WARN] Explanation prefetch failed for {key[:12]}: {e}")
+            with self._lock:
+                self.counts["failed"] += 1
+            return None
+        finally:
+            cache.invalidate(CLAIM_CACHE, scope=key)
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def join(self, block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        """
+        If the block is being prefetched (here or in another worker), wait up to wait_seconds
+        for it. Returns the explanation, or None if there is none to wait for (or it failed,
+        or the edit is rule-based): then the caller's cached generation runs.
+        """
+        if explain_trivial_edit(block_type, correction_block) is not None:
+            return None  # Never prefetched: answered from a template
+        key = explanation_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            self._count("joined")
+            try:
+                return future.result(self.wait_seconds)
+            except FutureTimeoutError:
+                return None
+        cache = self.get_cache()
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while self._claimed_elsewhere(cache, key) and time.monotonic() < deadline:
+            waited = True
+            time.sleep(CLAIM_POLL_SECONDS)
+        if not waited:
+            return None
+        explanation = cache.get(EXPLANATION_CACHE, key)  # The claim is dropped once the result is stored
+        if explanation is not None:
+            self._count("joined")
+        return explanation
+
+    async def ajoin(self, block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        """
+        Async version of join; waits without blocking the event loop.
+        """
+        if explain_trivial_edit(block_type, correction_block) is not None:
+            return None  # Never prefetched: answered from a template
+        key = explanation_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            self._count("joined")
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_seconds)
+            except asyncio.TimeoutError:
+                return None
+        cache = self.get_cache()
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while self._claimed_elsewhere(cache, key) and time.monotonic() < deadline:
+            waited = True
+            await asyncio.sleep(CLAIM_POLL_SECONDS)
+        if not waited:
+            return None
+        explanation = cache.get(EXPLANATION_CACHE, key)  # The claim is dropped once the result is stored
+        if explanation is not None:
+            self._count("joined")
+        return explanation
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "sessions": len(self._spent), "budget": self.budget,
+                    "window_seconds": self.window_seconds, "counts": dict(self.counts)}
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """
+    Return the process-wide Prefetcher, created on first use.
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
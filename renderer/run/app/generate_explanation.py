@@ -1,115 +1,229 @@
-import openai
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import os
+import sys
 import time  # For generating a unique nonce
+
+# llm_client lives in renderer/run (same path setup as app.py)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# llm_client (openai, aiohttp, requests) is imported by the functions that call the model,
+# so serving documents, cache hits and rule-based answers never load it.
+import llm_metrics
+import shared_cache
 from correction_service import (
     get_correction_explanation,
     generate_custom_sentence_for_block,
     get_ocr_sentence_if_isolated,
     rebuild_sentence_for_delete
 )
+from rule_based_explanation import explain_trivial_edit
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-def build_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence):
+def build_replacement_base_prompt(before_text, after_text, custom_sentence, corrected_sentence):
     """
-    Build and display the chain-of-thought for a replacement correction.
-    Prints each prompt (in uppercase) and its corresponding output exactly once.
+    Build the shared context used by every step of the replacement chain.
     Appends a unique nonce to avoid caching issues.
-    Returns the natural summary of the correction.
     """
-    import time
-    import openai
-
-    # BASE CONTEXT FOR THE PROMPT.
     nonce = str(int(time.time() * 1000))  # Unique identifier based on timestamp
-    base_prompt = (
+    return (
         f"Correction explanation:\n\n"
         f"Before:\nSentence: \"{custom_sentence}\"\nWord/Phrase: \"{before_text}\"\n\n"
         f"After:\nSentence: \"{corrected_sentence}\"\nWord/Phrase: \"{after_text}\"\n\n"
         f"NONCE: {nonce}\n\n"
     )
-    print("\n--- BASE PROMPT ---")
-    print(base_prompt.upper())
-    
-    # STEP 1: GENERATE MINIMAL BULLET POINTS.
-    bullet_prompt = (
+
+def build_bullet_prompt(base_prompt, before_text, after_text):
+    """
+    Step 1: ask for minimal bullet points about the usage change.
+    """
+    return (
         base_prompt +
         f"List 3-5 very brief bullet points (max 5 words each) that explain the usage change when replacing "
         f"'{before_text}' with '{after_text}'. Mention if the replacement is effectively expressing the same thing or if it is a structural change where the sentence was reworded."
     )
-    print("\n--- BULLET PROMPT ---")
-    print(bullet_prompt.upper())
-    
-    bullet_response = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": bullet_prompt}],
-        temperature=0.7,
-        max_tokens=200,
-    )
-    bullet_points = bullet_response.choices[0].message["content"].strip()
-    print("\n--- BULLET RESPONSE ---")
-    print(bullet_points)
-    
-    # STEP 2: GENERATE A DRAFT EXPLANATION USING THE BULLET POINTS.
-    draft_prompt = (
+
+def build_draft_prompt(base_prompt, before_text, after_text, bullet_points):
+    """
+    Step 2: turn the bullet points into a one-sentence draft explanation.
+    """
+    return (
         base_prompt +
         f"Using the bullet points below, write one clear sentence that explains why "
         f"'{before_text}' was replaced by '{after_text}' and, if it is a structural change, what was changed around in the sentence. "
         "Do not include any extra commentary.\n\n"
         f"Bullet Points:\n{bullet_points}"
     )
-    print("\n--- DRAFT PROMPT ---")
-    print(draft_prompt.upper())
-    
-    draft_response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": draft_prompt}],
-        temperature=0.7,
-        max_tokens=200,
-    )
-    draft_explanation = draft_response.choices[0].message["content"].strip()
-    print("\n--- DRAFT RESPONSE ---")
-    print(draft_explanation)
-    
-    # STEP 3: POLISH THE DRAFT INTO A FINAL ANSWER.
-    polish_prompt = (
+
+def build_polish_prompt(draft_explanation):
+    """
+    Step 3: polish the draft into what matters most for the learner.
+    """
+    return (
         f"\n\nWhat is most important for the English learner to take note of in the following explanation?\n"
         f"{draft_explanation}"
     )
-    print("\n--- POLISHED PROMPT ---")
-    print(polish_prompt.upper())
-    
-    polish_response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": polish_prompt}],
-        temperature=0.7,
-        max_tokens=200,
-    )
-    final_answer = polish_response.choices[0].message["content"].strip()
-    print("\n--- FINAL ANSWER ---")
-    print(final_answer)
-    
-    # STEP 4: ADDITIONAL NATURAL SUMMARIZATION PROMPT.
-    summary_prompt = (
+
+def build_summary_prompt(before_text, after_text, custom_sentence, corrected_sentence, final_answer):
+    """
+    Step 4: additional natural summarization of the polished answer.
+    """
+    return (
         f"Below are the correction details and the final explanation:\n\n"
         f"Before:\nSentence: \"{custom_sentence}\"\nWord/Phrase: \"{before_text}\"\n\n"
         f"After:\nSentence: \"{corrected_sentence}\"\nWord/Phrase: \"{after_text}\"\n\n"
         f"Final Explanation:\n\"{final_answer}\"\n\n"
         "Please provide a natural, intuitive answer that emphasis the bigger picture of why '{before_text}' what was changed to '{after_text}' and consider if they were intedning something else and we the corrector are misinterperating them? Be consice and matter of fact."
     )
-    print("\n--- SUMMARY PROMPT ---")
-    print(summary_prompt.upper())
-    
-    summary_response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": summary_prompt}],
-        temperature=0.7,
-        max_tokens=200,
+
+# Model settings for each step of the replacement chain: (label, model).
+REPLACEMENT_CHAIN_STEPS = [
+    ("BULLET", "gpt-4o"),
+    ("DRAFT", "gpt-4o-mini"),
+    ("POLISHED", "gpt-4o-mini"),
+    ("SUMMARY", "gpt-4o-mini"),
+]
+
+def chat_completion(model, prompt, temperature, max_tokens, step=None):
+    """
+    Run a single-message ChatCompletion and return the stripped content.
+    Slow calls are hedged when llm_client.HEDGE_ENABLED is set.
+    """
+    import llm_client
+    response = llm_client.chat_completion_hedged(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        step=step,
     )
-    summary = summary_response.choices[0].message["content"].strip()
-    print("\n--- SUMMARY RESPONSE ---")
+    return response.choices[0].message["content"].strip()
+
+async def achat_completion(model, prompt, temperature, max_tokens, step=None):
+    """
+    Non-blocking version of chat_completion for the asyncio server.
+    """
+    import llm_client
+    response = await llm_client.achat_completion_hedged(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        step=step,
+    )
+    return response.choices[0].message["content"].strip()
+
+def chat_completion_stream(model, prompt, temperature, max_tokens, step=None):
+    """
+    Streaming version of chat_completion: yields content deltas as the model produces them.
+    """
+    import llm_client
+    response = llm_client.chat_completion(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        step=step,
+    )
+    for chunk in response:
+        delta = chunk.choices[0].delta.get("content")
+        if delta:
+            yield delta
+
+async def achat_completion_stream(model, prompt, temperature, max_tokens, step=None):
+    """
+    Async streaming version of chat_completion.
+    """
+    import llm_client
+    response = await llm_client.achat_completion(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        step=step,
+    )
+    async for chunk in response:
+        delta = chunk.choices[0].delta.get("content")
+        if delta:
+            yield delta
+
+def build_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence):
+    """
+    Build and display the chain-of-thought for a replacement correction.
+    Prints each prompt (in uppercase) and its corresponding output exactly once.
+    Appends a unique nonce to avoid caching issues.
+    Returns the natural summary of the correction.
+    """
+    # BASE CONTEXT FOR THE PROMPT.
+    base_prompt = build_replacement_base_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+    print("\n--- BASE PROMPT ---")
+    print(base_prompt.upper())
+
+    (bullet_label, bullet_model), (draft_label, draft_model), \
+        (polish_label, polish_model), (summary_label, summary_model) = REPLACEMENT_CHAIN_STEPS
+
+    # STEP 1: GENERATE MINIMAL BULLET POINTS.
+    bullet_prompt = build_bullet_prompt(base_prompt, before_text, after_text)
+    print(f"\n--- {bullet_label} PROMPT ---")
+    print(bullet_prompt.upper())
+    bullet_points = chat_completion(bullet_model, bullet_prompt, temperature=0.7, max_tokens=200, step=bullet_label)
+    print(f"\n--- {bullet_label} RESPONSE ---")
+    print(bullet_points)
+
+    # STEP 2: GENERATE A DRAFT EXPLANATION USING THE BULLET POINTS.
+    draft_prompt = build_draft_prompt(base_prompt, before_text, after_text, bullet_points)
+    print(f"\n--- {draft_label} PROMPT ---")
+    print(draft_prompt.upper())
+    draft_explanation = chat_completion(draft_model, draft_prompt, temperature=0.7, max_tokens=200, step=draft_label)
+    print(f"\n--- {draft_label} RESPONSE ---")
+    print(draft_explanation)
+
+    # STEP 3: POLISH THE DRAFT INTO A FINAL ANSWER.
+    polish_prompt = build_polish_prompt(draft_explanation)
+    print(f"\n--- {polish_label} PROMPT ---")
+    print(polish_prompt.upper())
+    final_answer = chat_completion(polish_model, polish_prompt, temperature=0.7, max_tokens=200, step=polish_label)
+    print("\n--- FINAL ANSWER ---")
+    print(final_answer)
+
+    # STEP 4: ADDITIONAL NATURAL SUMMARIZATION PROMPT.
+    summary_prompt = build_summary_prompt(before_text, after_text, custom_sentence, corrected_sentence, final_answer)
+    print(f"\n--- {summary_label} PROMPT ---")
+    print(summary_prompt.upper())
+    summary = chat_completion(summary_model, summary_prompt, temperature=0.7, max_tokens=200, step=summary_label)
+    print(f"\n--- {summary_label} RESPONSE ---")
+    print(summary)
+
+    return summary
+
+async def abuild_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence):
+    """
+    Async version of build_replacement_prompt.
+    The four steps still run in sequence, but the event loop is free while each one is pending.
+    """
+    base_prompt = build_replacement_base_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+    (bullet_label, bullet_model), (draft_label, draft_model), \
+        (polish_label, polish_model), (summary_label, summary_model) = REPLACEMENT_CHAIN_STEPS
+
+    bullet_points = await achat_completion(
+        bullet_model, build_bullet_prompt(base_prompt, before_text, after_text),
+        temperature=0.7, max_tokens=200, step=bullet_label)
+    draft_explanation = await achat_completion(
+        draft_model, build_draft_prompt(base_prompt, before_text, after_text, bullet_points),
+        temperature=0.7, max_tokens=200, step=draft_label)
+    final_answer = await achat_completion(
+        polish_model, build_polish_prompt(draft_explanation),
+        temperature=0.7, max_tokens=200, step=polish_label)
+    summary = await achat_completion(
+        summary_model,
+        build_summary_prompt(before_text, after_text, custom_sentence, corrected_sentence, final_answer),
+        temperature=0.7, max_tokens=200, step=summary_label)
+    print("\n--- ASYNC SUMMARY RESPONSE ---")
     print(summary)
-    
     return summary
 
 def build_deletion_prompt(original_snippet, custom_sentence, corrected_sentence):
@@ -140,16 +254,21 @@ def build_insertion_prompt(inserted_text, custom_sentence, corrected_sentence):
     )
     return base_prompt + instructions
 
-def generate_correction_explanation_single(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+def resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry=None, ocr_sentence=None):
     """
-    Generate the final correction explanation.
-    For 'replacement' blocks, uses the output from build_replacement_prompt directly.
-    For 'delete' and 'insert', builds the appropriate prompt and shows its output.
+    Rebuild the sentence the student sees for the clicked block (the "custom" sentence).
+    For 'delete' blocks, uses the OCR sentence for isolated punctuation, otherwise rebuilds without inserts.
+    For 'replacement' and 'insert', reverts only the clicked correction.
+    Blocks rendered by the current main.py carry the result as 'custom_sentence' already.
     """
+    precomputed = correction_block.get("custom_sentence")
+    if precomputed is not None:
+        print("DEBUG: USING PRECOMPUTED CUSTOM SENTENCE.")
+        return precomputed
     if block_type == "delete":
         if correction_entry is not None:
             clicked_delete_block_id = correction_block.get("delete_block_index")
-            ocr_from_mapping = get_ocr_sentence_if_isolated(correction_entry, clicked_delete_block_id)
+            ocr_from_mapping = get_ocr_sentence_if_isolated(correction_entry, clicked_delete_block_id, ocr_sentence)
             if ocr_from_mapping is not None:
                 print("DEBUG: DETECTED ISOLATED PUNCTUATION; USING OCR SENTENCE.")
                 custom_sentence = ocr_from_mapping
@@ -168,45 +287,336 @@ def generate_correction_explanation_single(block_type, ocr_sentence, corrected_s
         custom_sentence = generate_custom_sentence_for_block(correction_entry, correction_block, block_type)
     else:
         raise ValueError(f"UNSUPPORTED BLOCK TYPE: {block_type}")
+    return custom_sentence
+
+def build_single_step_prompt(block_type, correction_block, custom_sentence, corrected_sentence):
+    """
+    Build the one-call prompt used for 'delete' and 'insert' blocks.
+    """
+    if block_type == "delete":
+        original_snippet = correction_block.get("delete_text", "")
+        return build_deletion_prompt(original_snippet, custom_sentence, corrected_sentence)
+    if block_type == "insert":
+        inserted_text = correction_block.get("insert_text", "")
+        return build_insertion_prompt(inserted_text, custom_sentence, corrected_sentence)
+    raise ValueError(f"UNSUPPORTED BLOCK TYPE: {block_type}")
+
+def single_step_label(block_type):
+    """
+    Step label recorded in llm_metrics for the one-call delete/insert explanations.
+    """
+    return "DELETION" if block_type == "delete" else "INSERTION"
+
+def rule_based_explanation(block_type, correction_block):
+    """
+    explain_trivial_edit, recorded in llm_metrics as a rule-based answer (not a call or cache hit).
+    """
+    explanation = explain_trivial_edit(block_type, correction_block)
+    if explanation is not None:
+        llm_metrics.record_call(None, step="RULE", rule_based=True)
+    return explanation
+
+def generate_correction_explanation_single(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    Generate the final correction explanation.
+    For 'replacement' blocks, uses the output from build_replacement_prompt directly.
+    For 'delete' and 'insert', builds the appropriate prompt and shows its output.
+    Trivial edits (punctuation, capitalization, articles, -s endings) are answered
+    from templates without any LLM call.
+    """
+    rule_explanation = rule_based_explanation(block_type, correction_block)
+    if rule_explanation is not None:
+        return rule_explanation
+
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
 
     if block_type == "replacement":
         before_text = correction_block.get("replaced_text", "")
         after_text = correction_block.get("corrected_text", "")
         # For replacement blocks, directly use build_replacement_prompt's output.
-        explanation = build_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence)
-    elif block_type == "delete":
-        original_snippet = correction_block.get("delete_text", "")
-        final_prompt = build_deletion_prompt(original_snippet, custom_sentence, corrected_sentence)
-        print("\n--- FINAL DELETION PROMPT ---")
-        print(final_prompt.upper())
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": final_prompt}],
-            temperature=0,
-            max_tokens=100
-        )
-        explanation = response.choices[0].message["content"].strip()
-        print("\n--- FINAL DELETION RESPONSE ---")
-        print(explanation)
-    elif block_type == "insert":
-        inserted_text = correction_block.get("insert_text", "")
-        final_prompt = build_insertion_prompt(inserted_text, custom_sentence, corrected_sentence)
-        print("\n--- FINAL INSERTION PROMPT ---")
-        print(final_prompt.upper())
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": final_prompt}],
-            temperature=0,
-            max_tokens=100
-        )
-        explanation = response.choices[0].message["content"].strip()
-        print("\n--- FINAL INSERTION RESPONSE ---")
-        print(explanation)
+        return build_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+
+    label = single_step_label(block_type)
+    final_prompt = build_single_step_prompt(block_type, correction_block, custom_sentence, corrected_sentence)
+    print(f"\n--- FINAL {label} PROMPT ---")
+    print(final_prompt.upper())
+    explanation = chat_completion("gpt-4o-mini", final_prompt, temperature=0, max_tokens=100, step=label)
+    print(f"\n--- FINAL {label} RESPONSE ---")
+    print(explanation)
+    return explanation
+
+async def agenerate_correction_explanation_single(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    Async version of generate_correction_explanation_single, used by the asyncio server.
+    Sentence reconstruction is local and cheap; only the LLM calls are awaited.
+    """
+    rule_explanation = rule_based_explanation(block_type, correction_block)
+    if rule_explanation is not None:
+        return rule_explanation
+
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
+
+    if block_type == "replacement":
+        before_text = correction_block.get("replaced_text", "")
+        after_text = correction_block.get("corrected_text", "")
+        return await abuild_replacement_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+
+    final_prompt = build_single_step_prompt(block_type, correction_block, custom_sentence, corrected_sentence)
+    explanation = await achat_completion("gpt-4o-mini", final_prompt, temperature=0, max_tokens=100,
+                                         step=single_step_label(block_type))
+    print(f"\n--- ASYNC {block_type.upper()} RESPONSE ---")
+    print(explanation)
+    return explanation
+
+# --- Streaming (server-sent events) ---
+
+# Status messages shown while the non-streamed steps of the replacement chain run.
+REPLACEMENT_CHAIN_STATUS = {
+    "BULLET": "Looking at what changed...",
+    "DRAFT": "Drafting an explanation...",
+    "POLISHED": "Picking out the key point...",
+    "SUMMARY": "Writing the final explanation...",
+}
+
+def format_sse(event, data):
+    """
+    Format one server-sent event. Data is JSON-encoded so newlines in tokens survive.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_correction_explanation(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    Streaming version of generate_correction_explanation_single.
+    Yields (event, data) tuples:
+      - ("status", message) before each intermediate step of the replacement chain
+      - ("token", text) for each piece of the final explanation
+      - ("done", full_explanation) at the end
+    """
+    rule_explanation = rule_based_explanation(block_type, correction_block)
+    if rule_explanation is not None:
+        yield "done", rule_explanation
+        return
+
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
+
+    if block_type == "replacement":
+        before_text = correction_block.get("replaced_text", "")
+        after_text = correction_block.get("corrected_text", "")
+        base_prompt = build_replacement_base_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+        (bullet_label, bullet_model), (draft_label, draft_model), \
+            (polish_label, polish_model), (summary_label, summary_model) = REPLACEMENT_CHAIN_STEPS
+
+        yield "status", REPLACEMENT_CHAIN_STATUS[bullet_label]
+        bullet_points = chat_completion(
+            bullet_model, build_bullet_prompt(base_prompt, before_text, after_text),
+            temperature=0.7, max_tokens=200, step=bullet_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[draft_label]
+        draft_explanation = chat_completion(
+            draft_model, build_draft_prompt(base_prompt, before_text, after_text, bullet_points),
+            temperature=0.7, max_tokens=200, step=draft_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[polish_label]
+        final_answer = chat_completion(
+            polish_model, build_polish_prompt(draft_explanation),
+            temperature=0.7, max_tokens=200, step=polish_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[summary_label]
+        final_model, final_label = summary_model, summary_label
+        final_prompt = build_summary_prompt(before_text, after_text, custom_sentence, corrected_sentence, final_answer)
+        temperature, max_tokens = 0.7, 200
     else:
-        raise ValueError(f"UNSUPPORTED BLOCK TYPE: {block_type}")
+        final_model, final_label = "gpt-4o-mini", single_step_label(block_type)
+        final_prompt = build_single_step_prompt(block_type, correction_block, custom_sentence, corrected_sentence)
+        temperature, max_tokens = 0, 100
 
+    pieces = []
+    for delta in chat_completion_stream(final_model, final_prompt, temperature=temperature,
+                                       max_tokens=max_tokens, step=final_label):
+        pieces.append(delta)
+        yield "token", delta
+    yield "done", "".join(pieces).strip()
+
+async def astream_correction_explanation(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    Async version of stream_correction_explanation, used by the asyncio server.
+    """
+    rule_explanation = rule_based_explanation(block_type, correction_block)
+    if rule_explanation is not None:
+        yield "done", rule_explanation
+        return
+
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
+
+    if block_type == "replacement":
+        before_text = correction_block.get("replaced_text", "")
+        after_text = correction_block.get("corrected_text", "")
+        base_prompt = build_replacement_base_prompt(before_text, after_text, custom_sentence, corrected_sentence)
+        (bullet_label, bullet_model), (draft_label, draft_model), \
+            (polish_label, polish_model), (summary_label, summary_model) = REPLACEMENT_CHAIN_STEPS
+
+        yield "status", REPLACEMENT_CHAIN_STATUS[bullet_label]
+        bullet_points = await achat_completion(
+            bullet_model, build_bullet_prompt(base_prompt, before_text, after_text),
+            temperature=0.7, max_tokens=200, step=bullet_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[draft_label]
+        draft_explanation = await achat_completion(
+            draft_model, build_draft_prompt(base_prompt, before_text, after_text, bullet_points),
+            temperature=0.7, max_tokens=200, step=draft_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[polish_label]
+        final_answer = await achat_completion(
+            polish_model, build_polish_prompt(draft_explanation),
+            temperature=0.7, max_tokens=200, step=polish_label)
+        yield "status", REPLACEMENT_CHAIN_STATUS[summary_label]
+        final_model, final_label = summary_model, summary_label
+        final_prompt = build_summary_prompt(before_text, after_text, custom_sentence, corrected_sentence, final_answer)
+        temperature, max_tokens = 0.7, 200
+    else:
+        final_model, final_label = "gpt-4o-mini", single_step_label(block_type)
+        final_prompt = build_single_step_prompt(block_type, correction_block, custom_sentence, corrected_sentence)
+        temperature, max_tokens = 0, 100
+
+    pieces = []
+    async for delta in achat_completion_stream(final_model, final_prompt, temperature=temperature,
+                                               max_tokens=max_tokens, step=final_label):
+        pieces.append(delta)
+        yield "token", delta
+    yield "done", "".join(pieces).strip()
+
+# --- Cached explanations (shared by all workers, see shared_cache) ---
+
+EXPLANATION_CACHE = "explanations"
+# Bump when the prompts change, so explanations from the old prompts are not served.
+EXPLANATION_PROMPT_VERSION = 1
+
+def explanation_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    Key on what the prompts are built from (block type and texts, custom and corrected
+    sentence, models), not on the document: the same correction in another essay, or in
+    a re-rendered copy, is served from the cache too.
+    """
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
+    texts = [correction_block.get(field) for field in ("replaced_text", "corrected_text", "delete_text", "insert_text")]
+    material = [EXPLANATION_PROMPT_VERSION, REPLACEMENT_CHAIN_STEPS, block_type, custom_sentence, corrected_sentence, texts]
+    return hashlib.sha256(json.dumps(material).encode("utf-8")).hexdigest()
+
+def with_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+    """
+    (cache key, block) for an explanation to look up or generate. The block carries the
+    resolved custom sentence, so the generation on a miss does not rebuild it.
+    """
+    custom_sentence = resolve_custom_sentence(block_type, corrected_sentence, correction_block, correction_entry,
+                                              ocr_sentence)
+    correction_block = dict(correction_block, custom_sentence=custom_sentence)
+    return explanation_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block), correction_block
+
+def cached_explanation(cache_key, cache=None):
+    """
+    The cached explanation for cache_key, recorded in llm_metrics as a cache hit; or None.
+    """
+    explanation = (cache or shared_cache.get_cache()).get(EXPLANATION_CACHE, cache_key)
+    if explanation is not None:
+        llm_metrics.record_call("cache", step="CACHE", cache_hit=True)
+    return explanation
+
+async def run_off_loop(func, *args, **kwargs):
+    """
+    Run a blocking cache call (an SQLite read, or a write that may wait on another
+    worker's lock) in the default executor, in a copy of the caller's context so
+    llm_metrics still records into the request's trace.
+    """
+    call = functools.partial(func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, call)
+
+def generate_correction_explanation_cached(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                           correction_entry=None, cache=None):
+    """
+    generate_correction_explanation_single through the shared explanation cache.
+    Rule-based answers are returned as they are: they cost nothing and are not cached.
+    """
+    explanation = rule_based_explanation(block_type, correction_block)
+    if explanation is not None:
+        return explanation
+    cache = cache or shared_cache.get_cache()
+    cache_key, correction_block = with_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                 correction_entry)
+    explanation = cached_explanation(cache_key, cache)
+    if explanation is None:
+        token = cache.token()
+        explanation = generate_correction_explanation_single(block_type, ocr_sentence, corrected_sentence,
+                                                             correction_block, correction_entry)
+        cache.set(EXPLANATION_CACHE, cache_key, explanation, since=token)
+    return explanation
+
+async def agenerate_correction_explanation_cached(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                  correction_entry=None, cache=None):
+    """
+    Async version of generate_correction_explanation_cached; the cache calls run off the event loop.
+    """
+    explanation = rule_based_explanation(block_type, correction_block)
+    if explanation is not None:
+        return explanation
+    cache = cache or shared_cache.get_cache()
+    cache_key, correction_block = with_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                 correction_entry)
+    explanation = await run_off_loop(cached_explanation, cache_key, cache)
+    if explanation is None:
+        token = await run_off_loop(cache.token)
+        explanation = await agenerate_correction_explanation_single(block_type, ocr_sentence, corrected_sentence,
+                                                                    correction_block, correction_entry)
+        await run_off_loop(cache.set, EXPLANATION_CACHE, cache_key, explanation, since=token)
     return explanation
 
+def stream_correction_explanation_cached(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                         correction_entry=None, cache=None):
+    """
+    stream_correction_explanation through the explanation cache: a hit is a single
+    ("done", explanation) event; on a miss the finished explanation is cached. Rule-based
+    answers are a single ("done", explanation) event too, and are not cached.
+    """
+    explanation = rule_based_explanation(block_type, correction_block)
+    if explanation is not None:
+        yield "done", explanation
+        return
+    cache = cache or shared_cache.get_cache()
+    cache_key, correction_block = with_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                 correction_entry)
+    explanation = cached_explanation(cache_key, cache)
+    if explanation is not None:
+        yield "done", explanation
+        return
+    token = cache.token()
+    for event, payload in stream_correction_explanation(block_type, ocr_sentence, corrected_sentence,
+                                                        correction_block, correction_entry):
+        if event == "done":
+            cache.set(EXPLANATION_CACHE, cache_key, payload, since=token)
+        yield event, payload
+
+async def astream_correction_explanation_cached(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                correction_entry=None, cache=None):
+    """
+    Async version of stream_correction_explanation_cached; the cache calls run off the event loop.
+    """
+    explanation = rule_based_explanation(block_type, correction_block)
+    if explanation is not None:
+        yield "done", explanation
+        return
+    cache = cache or shared_cache.get_cache()
+    cache_key, correction_block = with_cache_key(block_type, ocr_sentence, corrected_sentence, correction_block,
+                                                 correction_entry)
+    explanation = await run_off_loop(cached_explanation, cache_key, cache)
+    if explanation is not None:
+        yield "done", explanation
+        return
+    token = await run_off_loop(cache.token)
+    async for event, payload in astream_correction_explanation(block_type, ocr_sentence, corrected_sentence,
+                                                               correction_block, correction_entry):
+        if event == "done":
+            await run_off_loop(cache.set, EXPLANATION_CACHE, cache_key, payload, since=token)
+        yield event, payload
+
 # --- Example Test Harness (Adjust for your own usage) ---
 if __name__ == "__main__":
     test_data = {"blockType": "replacement", "blockIndex": 0, "sentenceIndex": 0}
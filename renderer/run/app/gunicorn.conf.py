@@ -0,0 +1,40 @@
+# gunicorn.conf.py
+#
+# gunicorn -c gunicorn.conf.py app:app        (or async_app:app with the aiohttp worker class)
+#
+# With preloading (the default; HW_HERO_PRELOAD=0 turns it off) the master imports the app
+# once and preload.warm() loads what workers would otherwise each load on their first
+# requests: output.json serialized for /data.json, the mmapped sentence indexes and the
+# rule tables. gc.freeze() then moves all of it out of the collector's reach, so the
+# forked workers share those pages copy-on-write instead of each holding a copy.
+# Code changes need a full restart (not HUP) when preloaded.
+#
+# Each worker starts its upload job pollers once booted, so a job queued by one worker
+# is run by whichever worker has a free slot (see job_queue.py).
+
+import gc
+import os
+import time
+
+bind = os.getenv("HW_HERO_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+preload_app = os.getenv("HW_HERO_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the (pre)loaded app, before any worker is forked.
+    if preload_app:
+        import preload
+        preload.warm()
+        gc.freeze()
+        server.log.info("Preloaded app; %d objects frozen for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.3fs", worker.pid, time.monotonic() - worker.forked_at)
+    import job_queue
+    job_queue.get_job_queue().start()
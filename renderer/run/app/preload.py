@@ -0,0 +1,42 @@
+# preload.py
+#
+# What the gunicorn master loads once before forking the workers when the app is preloaded
+# (see gunicorn.conf.py). Everything here is read-only afterwards: output.json as one
+# immutable JSON string in the cache's LRU (a worker serving /data.json touches only that
+# string's header, not a tree of dicts whose refcounts would dirty every page), and the
+# sentence indexes as file-backed mmaps, which are shared between processes anyway.
+# The OpenAI client and Pillow are imported lazily by the app (so scripts and tests that
+# never call the API start fast), but in a preloaded master they are imported here so the
+# workers share them instead of each importing them on its first explanation request.
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import correction_service
+import document_store
+import image_preprocessing
+from sentence_index import IndexUnavailable, get_reader
+
+OUTPUT_JSON = "output.json"  # Relative to the working directory, like app.py
+
+
+def warm(output_json=OUTPUT_JSON):
+    """
+    Load the shared read-only state. Safe to call in a worker too (it just warms that process).
+    """
+    try:
+        document_store.file_document_json(output_json)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Could not preload {output_json}: {e}")
+    for path in (output_json, correction_service.OUTPUT_JSON_PATH, correction_service.SENTENCE_MAPPING_PATH):
+        try:
+            get_reader(path).records()
+        except IndexUnavailable as e:
+            print(f"[INFO] {e}; workers will parse it on demand")
+    try:
+        import llm_client  # noqa: F401
+    except ImportError as e:
+        print(f"[WARN] Could not preload the LLM client: {e}")
+    image_preprocessing.pillow()
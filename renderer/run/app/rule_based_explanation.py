@@ -0,0 +1,135 @@
+import correction_service
+
+# Set to False to always send blocks to the LLM.
+USE_RULE_EXPLANATIONS = True
+
+ARTICLES = {"a", "an", "the"}
+
+# Short words whose "-s" form is a different word rather than an ending (it/its, hi/his).
+S_ENDING_MIN_LENGTH = 3
+
+# Pronouns, determiners and other function words whose "-s" form is another word (her/hers,
+# our/ours, other/others), and nouns whose "-s" form means something else (new/news).
+# Edits of these go to the LLM.
+S_ENDING_STOPLIST = {
+    "her", "his", "our", "your", "their", "its", "my", "mine", "yours", "hers", "ours", "theirs",
+    "this", "that", "these", "those", "other", "another", "one", "each", "every", "either", "neither",
+    "some", "any", "all", "both", "none", "what", "which", "who", "whose", "us", "was", "is", "has", "does",
+    "new", "good", "custom", "manner",
+}
+
+# The "-es" ending follows these; after anything else the ending is a plain "-s".
+ES_ENDINGS = ("s", "x", "z", "ch", "sh", "o")
+VOWELS = "aeiou"
+
+# Templates for each trivial-edit category. Quoted words are highlighted by the frontend.
+EXPLANATION_TEMPLATES = {
+    "punctuation_delete": "The '{before}' is not needed here, so it was removed.",
+    "punctuation_insert": "A '{after}' is needed here to separate the parts of the sentence correctly.",
+    "punctuation_replace": "'{after}' is the right punctuation mark here instead of '{before}'.",
+    "capitalize": "'{after}' needs a capital letter here (for example at the start of a sentence or in a name).",
+    "lowercase": "'{before}' does not need a capital letter here, so it should be written '{after}'.",
+    "article_insert": "An article is needed before the noun here, so '{after}' was added.",
+    "article_delete": "The article '{before}' is not needed here, so it was removed.",
+    "article_a_an": "Use 'an' before a vowel sound and 'a' before a consonant sound, so '{after}' is correct here.",
+    "add_s_ending": "The word needs the '-s' ending here: '{after}' instead of '{before}'. "
+                    "This usually means the noun is plural (more than one), or the verb agrees with a singular subject like he, she or it.",
+    "remove_s_ending": "The word should not have the '-s' ending here: '{after}' instead of '{before}'. "
+                       "This usually means the noun refers to just one thing, or the verb follows a plural subject or a helper verb.",
+}
+
+def get_block_texts(block_type, correction_block):
+    """
+    Return the (before, after) text for a block, stripped of surrounding spaces.
+    """
+    if block_type == "replacement":
+        before = correction_block.get("replaced_text", "")
+        after = correction_block.get("corrected_text", "")
+    elif block_type == "insert":
+        before, after = "", correction_block.get("insert_text", "")
+    elif block_type == "delete":
+        before, after = correction_block.get("delete_text", ""), ""
+    else:
+        return None, None
+    return before.strip(), after.strip()
+
+def is_punctuation_only(text):
+    """
+    True if text is non-empty and made only of punctuation (using the configurable
+    isolated-punctuation rules in correction_service) and spaces.
+    """
+    return bool(text) and all(
+        c in correction_service.CUSTOM_ISOLATED_PUNCTUATION or c.isspace() for c in text
+    )
+
+def _is_word(text):
+    return bool(text) and all(c.isalpha() or c in "'-" for c in text)
+
+def _has_s_ending(base, plural):
+    """
+    True if plural is base with the regular '-s' ending as it is spelled for base
+    ('-s', '-es' after s/x/z/ch/sh/o, or consonant + 'y' -> 'ies'). Only plain words
+    qualify: not S_ENDING_STOPLIST, so cloth -> clothes or her -> hers is not an ending.
+    """
+    base, plural = base.lower(), plural.lower()
+    if len(base) < S_ENDING_MIN_LENGTH or not base.isalpha() or base in S_ENDING_STOPLIST:
+        return False
+    if base.endswith("y") and base[-2] not in VOWELS:
+        return plural == base[:-1] + "ies"
+    if plural == base + "es":
+        return base.endswith(ES_ENDINGS)
+    return plural == base + "s" and (base.endswith("o") or not base.endswith(ES_ENDINGS))
+
+def classify_edit(before, after):
+    """
+    Classify a block's before/after text into a trivial-edit category.
+    Returns a key of EXPLANATION_TEMPLATES, or None if the edit needs the LLM.
+    """
+    if before == after:
+        return None
+    if not before and is_punctuation_only(after):
+        return "punctuation_insert"
+    if not after and is_punctuation_only(before):
+        return "punctuation_delete"
+    if is_punctuation_only(before) and is_punctuation_only(after):
+        return "punctuation_replace"
+    if not before and after.lower() in ARTICLES:
+        return "article_insert"
+    if not after and before.lower() in ARTICLES:
+        return "article_delete"
+    if {before.lower(), after.lower()} == {"a", "an"}:
+        return "article_a_an"
+    if before and before.lower() == after.lower():
+        return "capitalize" if after[:1].isupper() and not before[:1].isupper() else "lowercase"
+    if _is_word(before) and _is_word(after):
+        if _has_s_ending(before, after):
+            return "add_s_ending"
+        if _has_s_ending(after, before):
+            return "remove_s_ending"
+    return None
+
+def explain_trivial_edit(block_type, correction_block):
+    """
+    Answer trivial edits (punctuation, capitalization, articles, -s endings) from templates.
+    Returns the explanation string, or None to escalate to the LLM.
+    """
+    if not USE_RULE_EXPLANATIONS or not correction_block:
+        return None
+    before, after = get_block_texts(block_type, correction_block)
+    if before is None:
+        return None
+    category = classify_edit(before, after)
+    if category is None:
+        return None
+    return EXPLANATION_TEMPLATES[category].format(before=before, after=after)
+
+if __name__ == "__main__":
+    examples = [
+        ("replacement", {"replaced_text": "singer", "corrected_text": "singers"}),
+        ("replacement", {"replaced_text": "korean", "corrected_text": "Korean"}),
+        ("insert", {"insert_text": "the "}),
+        ("delete", {"delete_text": ","}),
+        ("replacement", {"replaced_text": "affected by", "corrected_text": "influenced by"}),
+    ]
+    for block_type, block in examples:
+        print(block_type, block, "->", explain_trivial_edit(block_type, block))
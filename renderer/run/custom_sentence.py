@@ -0,0 +1,122 @@
+# custom_sentence.py
+#
+# The "custom" sentence for a correction block: the corrected sentence with only that
+# block's correction reverted, which the explanation prompts show the student. It is
+# deterministic from the pipeline output, so main.py computes it for every block once
+# (materialize_custom_sentences) and the click path just reads block["custom_sentence"].
+# correction_service keeps the same functions for documents rendered before this existed.
+
+import string
+
+# Punctuation that counts as "isolated" when deleted (see is_isolated_punctuation).
+ISOLATED_PUNCTUATION = frozenset(string.punctuation)
+# Sequences that count as isolated wherever they appear around the token (e.g. double periods).
+ISOLATED_SEQUENCES = frozenset({("..",), ("...",)})
+
+
+def is_isolated_punctuation(token, token_list, punctuation=ISOLATED_PUNCTUATION, sequences=ISOLATED_SEQUENCES):
+    """
+    A token is isolated punctuation if its character is punctuation and both neighbours
+    (if any) are punctuation or spaces, or if it is part of one of the sequences.
+    """
+    index = token["index"]
+    if token["char"] not in punctuation:
+        return False
+    prev_token = token_list[index - 1] if index > 0 else None
+    next_token = token_list[index + 1] if index + 1 < len(token_list) else None
+    prev_ok = prev_token is None or prev_token["char"] in punctuation or prev_token["char"] == " "
+    next_ok = next_token is None or next_token["char"] in punctuation or next_token["char"] == " "
+    surrounding = "".join(token_list[i]["char"] for i in range(max(0, index - 1), min(len(token_list), index + 2)))
+    sequence_found = any("".join(seq) in surrounding for seq in sequences)
+    return (prev_ok and next_ok) or sequence_found
+
+
+def delete_is_isolated_punctuation(correction_entry, delete_block_id, punctuation=ISOLATED_PUNCTUATION,
+                                   sequences=ISOLATED_SEQUENCES):
+    """
+    True if any token of the delete block is isolated punctuation; for those blocks the
+    OCR sentence is shown instead of a rebuilt one.
+    """
+    tokens = correction_entry.get("final_sentence_tokens", [])
+    for token in tokens:
+        if token.get("type") == "delete" and int(token.get("deleteBlockId", -1)) == int(delete_block_id):
+            if is_isolated_punctuation(token, tokens, punctuation, sequences):
+                return True
+    return False
+
+
+def _apply_replacements(chars, replacement_blocks, skip_block_index=None):
+    # Write each block's corrected text over its span, blanking the rest of the span.
+    for block in replacement_blocks:
+        if skip_block_index is not None and block.get("block_index") == skip_block_index:
+            continue
+        start = block.get("final_start")
+        corrected_text = block.get("corrected_text", "")
+        original_span = len(block.get("replaced_text", ""))
+        for i, ch in enumerate(corrected_text):
+            if start + i < len(chars):
+                chars[start + i] = ch
+        for pos in range(start + len(corrected_text), start + original_span):
+            if pos < len(chars):
+                chars[pos] = ""
+
+
+# The functions below work on a copy of the token characters, never on the tokens
+# themselves, so one entry can be used for all of its blocks.
+
+def custom_sentence_for_block(correction_entry, correction_block, block_type):
+    """
+    Replacement blocks: apply every other replacement, leaving the clicked block's error.
+    Insert blocks: drop the inserted tokens. Then drop all deleted tokens and tidy spaces.
+    """
+    tokens = correction_entry.get("final_sentence_tokens", [])
+    chars = [token["char"] for token in tokens]
+    if block_type == "replacement":
+        _apply_replacements(chars, correction_entry.get("replacement_blocks", []),
+                            skip_block_index=correction_block.get("block_index"))
+    start, end = (correction_block.get("final_start"), correction_block.get("final_end")) \
+        if block_type == "insert" else (None, None)
+    kept = "".join(
+        ch for i, (ch, token) in enumerate(zip(chars, tokens))
+        if token.get("type") != "delete" and not (start is not None and start <= i <= end)
+    )
+    return " ".join(kept.split())
+
+
+def sentence_for_delete(correction_entry, delete_block_id):
+    """
+    Delete blocks: apply all replacements, ignore inserts, and keep only the clicked
+    block's deleted tokens.
+    """
+    tokens = sorted(correction_entry.get("final_sentence_tokens", []), key=lambda t: t.get("index", 0))
+    chars = [token["char"] for token in tokens]
+    _apply_replacements(chars, correction_entry.get("replacement_blocks", []))
+    delete_block_id = int(delete_block_id)
+    return "".join(
+        ch for ch, token in zip(chars, tokens)
+        if not (token.get("type") == "delete" and int(token.get("deleteBlockId", -1)) != delete_block_id)
+    )
+
+
+def materialize_custom_sentences(output_data, sentence_mapping):
+    """
+    Store "custom_sentence" on every block of output_data (in place), and
+    "isolated_punctuation" on delete blocks. Delete blocks of isolated punctuation use the
+    OCR sentence from sentence_mapping; if the sentence has no mapping entry they are left
+    without a custom sentence and the click path rebuilds it as before.
+    """
+    ocr_sentences = {s.get("sentence_index"): s.get("ocr_sentence") for s in sentence_mapping.get("sentences", [])}
+    for entry in output_data.get("sentences", []):
+        for block in entry.get("replacement_blocks", []):
+            block["custom_sentence"] = custom_sentence_for_block(entry, block, "replacement")
+        for block in entry.get("insert_blocks", []):
+            block["custom_sentence"] = custom_sentence_for_block(entry, block, "insert")
+        for block in entry.get("delete_blocks", []):
+            block_id = block.get("delete_block_index")
+            isolated = delete_is_isolated_punctuation(entry, block_id)
+            block["isolated_punctuation"] = isolated
+            if not isolated:
+                block["custom_sentence"] = sentence_for_delete(entry, block_id)
+            elif ocr_sentences.get(entry.get("sentence_index")) is not None:
+                block["custom_sentence"] = ocr_sentences[entry.get("sentence_index")]
+    return output_data
@@ -0,0 +1,327 @@
+# document_store.py
+#
+# SQLite store for rendered documents, so the app can serve many essays at once.
+# Each document keeps its sentence mapping (OCR/corrected pairs), its rendered
+# sentences (the entries of output.json) and one row per correction block, indexed by
+# (document, sentence) and (document, sentence, block type, block index), so a click
+# reads one sentence and one block instead of parsing whole JSON files.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import shared_cache
+from sentence_index import IndexUnavailable, get_reader
+
+DB_PATH = os.getenv("HW_HERO_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents.db"))
+
+# Block list key in a rendered sentence entry -> (block type used by the app, index field).
+BLOCK_KINDS = {
+    "replacement_blocks": ("replacement", "block_index"),
+    "insert_blocks": ("insert", "insert_block_index"),
+    "delete_blocks": ("delete", "delete_block_index"),
+}
+
+# shared_cache namespaces derived from a stored document, all scoped by document id and
+# invalidated when it is saved again or deleted. "corrections" is filled by correction_service.
+DOCUMENT_CACHE = "documents"
+CORRECTION_CACHE = "corrections"
+
+# Largest range /sentences serves in one response.
+MAX_RANGE_SENTENCES = 200
+# json.dumps({"sentences": [...]}) starts with this; records follow, separated by ", ".
+DOCUMENT_PREFIX = '{"sentences": ['
+RECORD_SEPARATOR = ", "
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    source TEXT,
+    sentence_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    sentence_index INTEGER NOT NULL,
+    ocr_sentence TEXT,
+    corrected_sentence TEXT,
+    rendered TEXT NOT NULL,
+    PRIMARY KEY (document_id, sentence_index)
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    sentence_index INTEGER NOT NULL,
+    block_type TEXT NOT NULL,
+    block_index INTEGER NOT NULL,
+    block TEXT NOT NULL,
+    PRIMARY KEY (document_id, sentence_index, block_type, block_index)
+);
+"""
+
+
+def new_document_id():
+    return uuid.uuid4().hex
+
+
+def document_index(record_sizes):
+    """
+    Build the document index from (sentence_index, record size in bytes) pairs in order.
+    Offsets are into the document as json.dumps serializes it, so the client can size its
+    page requests (and a record can be cut out of the full JSON by offset).
+    """
+    sentences = []
+    offset = len(DOCUMENT_PREFIX)
+    for sentence_index, size in record_sizes:
+        sentences.append({"sentence_index": sentence_index, "offset": offset, "bytes": size})
+        offset += size + len(RECORD_SEPARATOR)
+    total = offset - (len(RECORD_SEPARATOR) if sentences else 0) + len("]}")
+    return {"sentence_count": len(sentences), "total_bytes": total, "sentences": sentences}
+
+
+def sentence_range(sentences, start, count):
+    """
+    Slice an in-memory document (e.g. output.json) the way DocumentStore.get_sentence_range does.
+    """
+    count = min(count, MAX_RANGE_SENTENCES)
+    return {"sentence_count": len(sentences), "start": start, "sentences": sentences[start:start + count]}
+
+
+def file_sentence_range(path, start, count):
+    """
+    sentence_range for a JSON file such as output.json: through its .idx sidecar when it
+    has an up-to-date one (only the requested records are decoded), otherwise parsed whole.
+    """
+    count = min(count, MAX_RANGE_SENTENCES)
+    try:
+        sentences, total = get_reader(path).get_range(start, count)
+        return {"sentence_count": total, "start": start, "sentences": sentences}
+    except IndexUnavailable:
+        with open(path, "r", encoding="utf-8") as f:
+            return sentence_range(json.load(f)["sentences"], start, count)
+
+
+def file_document_json(path, cache=None):
+    """
+    The JSON file at path, re-serialized compactly (the body /data.json serves), from the
+    shared cache when this version of the file (size and mtime) was served before.
+    """
+    cache = cache or shared_cache.get_cache()
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.dumps(json.load(f))
+
+    return cache.get_or_compute(DOCUMENT_CACHE, f"{path}:{stat.st_size}:{stat.st_mtime_ns}", load, scope=path)
+
+
+def file_document_index(path):
+    """
+    document_index for a JSON file. With an up-to-date .idx sidecar the offsets are the
+    records' positions in the file itself; without one the file is parsed and indexed as
+    json.dumps would serialize it.
+    """
+    try:
+        records = get_reader(path).records()
+    except IndexUnavailable:
+        with open(path, "r", encoding="utf-8") as f:
+            sentences = json.load(f)["sentences"]
+        return document_index((entry["sentence_index"], len(json.dumps(entry).encode("utf-8"))) for entry in sentences)
+    return {
+        "sentence_count": len(records),
+        "total_bytes": os.path.getsize(path),
+        "sentences": [{"sentence_index": index, "offset": offset, "bytes": length} for index, offset, length in records],
+    }
+
+
+class DocumentStore:
+    """
+    Thread-safe: each thread gets its own connection. WAL mode lets readers (the web
+    workers) run while a writer (main.py or a job worker) saves a document.
+    Serialized documents are cached in the shared_cache at the same path unless another
+    cache is given.
+    """
+    def __init__(self, path=DB_PATH, cache=None):
+        self.path = path
+        self._local = threading.local()
+        self.cache = cache or shared_cache.get_cache(path)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+        shared_cache.close_before_fork(self)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """
+        Close this thread's connection (the next call opens a new one).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def save_document(self, output_data, sentence_mapping, document_id=None, source=None):
+        """
+        Store (or replace) a document from the structures main.py writes to output.json and
+        sentence_mapping.json. Returns the document id.
+        """
+        document_id = document_id or new_document_id()
+        mapping_by_index = {s.get("sentence_index"): s for s in sentence_mapping.get("sentences", [])}
+        sentences = output_data.get("sentences", [])
+        now = time.time()
+
+        sentence_rows = []
+        block_rows = []
+        for entry in sentences:
+            index = entry.get("sentence_index")
+            mapping = mapping_by_index.get(index, {})
+            sentence_rows.append((document_id, index, mapping.get("ocr_sentence"),
+                                  mapping.get("corrected_sentence"), json.dumps(entry)))
+            for key, (block_type, index_field) in BLOCK_KINDS.items():
+                for block in entry.get(key, []):
+                    block_rows.append((document_id, index, block_type, block.get(index_field, -1), json.dumps(block)))
+
+        with self.connection() as conn:
+            created = conn.execute("SELECT created_at FROM documents WHERE id = ?", (document_id,)).fetchone()
+            conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            conn.execute(
+                "INSERT INTO documents (id, source, sentence_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (document_id, source, len(sentences), created[0] if created else now, now),
+            )
+            conn.executemany("INSERT INTO sentences VALUES (?, ?, ?, ?, ?)", sentence_rows)
+            conn.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)", block_rows)
+        if created:
+            self.invalidate_cached(document_id)
+        return document_id
+
+    def invalidate_cached(self, document_id):
+        """
+        Drop everything cached from this document, in every worker.
+        """
+        for namespace in (DOCUMENT_CACHE, CORRECTION_CACHE):
+            self.cache.invalidate(namespace, document_id)
+
+    def get_document(self, document_id):
+        """
+        Return the document in the output.json shape ({"sentences": [...]}), or None.
+        """
+        conn = self.connection()
+        if conn.execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone() is None:
+            return None
+        rows = conn.execute(
+            "SELECT rendered FROM sentences WHERE document_id = ? ORDER BY sentence_index", (document_id,)
+        ).fetchall()
+        return {"sentences": [json.loads(row[0]) for row in rows]}
+
+    def get_document_json(self, document_id):
+        """
+        get_document serialized with json.dumps, through the cache; None if not found.
+        """
+        def load():
+            document = self.get_document(document_id)
+            return json.dumps(document) if document is not None else None
+
+        return self.cache.get_or_compute(DOCUMENT_CACHE, document_id, load, scope=document_id)
+
+    def get_sentence(self, document_id, sentence_index):
+        """
+        Return (sentence mapping entry, rendered sentence entry), or None if not found.
+        """
+        row = self.connection().execute(
+            "SELECT ocr_sentence, corrected_sentence, rendered FROM sentences "
+            "WHERE document_id = ? AND sentence_index = ?",
+            (document_id, sentence_index),
+        ).fetchone()
+        if row is None:
+            return None
+        mapping = {"sentence_index": sentence_index, "ocr_sentence": row[0], "corrected_sentence": row[1]}
+        return mapping, json.loads(row[2])
+
+    def get_sentence_range(self, document_id, start, count):
+        """
+        Return {"sentence_count", "start", "sentences"} for sentences start..start+count-1
+        (at most MAX_RANGE_SENTENCES), or None if the document doesn't exist.
+        """
+        conn = self.connection()
+        row = conn.execute("SELECT sentence_count FROM documents WHERE id = ?", (document_id,)).fetchone()
+        if row is None:
+            return None
+        count = min(count, MAX_RANGE_SENTENCES)
+        rows = conn.execute(
+            "SELECT rendered FROM sentences WHERE document_id = ? ORDER BY sentence_index LIMIT ? OFFSET ?",
+            (document_id, count, start),
+        ).fetchall()
+        return {"sentence_count": row[0], "start": start, "sentences": [json.loads(r[0]) for r in rows]}
+
+    def get_document_index(self, document_id):
+        """
+        Return the document index (sentence count, per-sentence byte offsets), or None.
+        """
+        conn = self.connection()
+        if conn.execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone() is None:
+            return None
+        rows = conn.execute(
+            "SELECT sentence_index, length(CAST(rendered AS BLOB)) FROM sentences "
+            "WHERE document_id = ? ORDER BY sentence_index",
+            (document_id,),
+        ).fetchall()
+        return document_index(rows)
+
+    def get_block(self, document_id, sentence_index, block_type, block_index):
+        row = self.connection().execute(
+            "SELECT block FROM blocks WHERE document_id = ? AND sentence_index = ? AND block_type = ? AND block_index = ?",
+            (document_id, sentence_index, block_type, block_index),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_documents(self, limit=100):
+        rows = self.connection().execute(
+            "SELECT id, source, sentence_count, created_at, updated_at FROM documents ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [dict(zip(("id", "source", "sentence_count", "created_at", "updated_at"), row)) for row in rows]
+
+    def delete_document(self, document_id):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+        self.invalidate_cached(document_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Return the process-wide store at DB_PATH (created on first use).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore(DB_PATH)
+        return _store
+
+
+if __name__ == "__main__":
+    import sys
+    # Import an existing output.json + sentence_mapping.json pair.
+    output_path, mapping_path = sys.argv[1], sys.argv[2]
+    with open(output_path, "r", encoding="utf-8") as f:
+        output_data = json.load(f)
+    with open(mapping_path, "r", encoding="utf-8") as f:
+        sentence_mapping = json.load(f)
+    document_id = get_store().save_document(output_data, sentence_mapping, source=output_path)
+    print(f"Stored {len(output_data.get('sentences', []))} sentences as document {document_id}")
@@ -0,0 +1,132 @@
+# edit_list_correction.py
+
+import json
+from typing import List, Tuple, Dict
+from diff_lib_refactor import highlight_changes
+from utils import apply_colors
+
+
+def parse_edit_list(response_text: str) -> List[Dict]:
+    """
+    Parse the model's JSON edit list: {"edits": [{"sentence_index", "original", "replacement"}, ...]}.
+    Malformed entries are dropped rather than failing the whole document.
+    """
+    try:
+        data = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        print(f"[WARN] Could not parse edit list: {e}")
+        return []
+    edits = data.get("edits", []) if isinstance(data, dict) else data
+    valid_edits = []
+    for edit in edits or []:
+        if not isinstance(edit, dict):
+            continue
+        try:
+            valid_edits.append({
+                "sentence_index": int(edit["sentence_index"]),
+                "original": str(edit.get("original", "")),
+                "replacement": str(edit.get("replacement", "")),
+            })
+        except (KeyError, TypeError, ValueError):
+            print(f"[WARN] Skipping malformed edit: {edit}")
+    return valid_edits
+
+
+def apply_sentence_edits(sentence: str, edits: List[Dict], dropped: List[Dict] = None) -> Tuple[str, List[Dict[str, str]]]:
+    """
+    Apply (original span -> replacement) edits to one sentence, in order of their spans'
+    position in the sentence (the model does not always list them that way).
+    Returns the corrected sentence and the typed, character-level tokens that
+    highlight_changes would have produced, but only diffing the edited spans.
+    Edits with an empty span, or whose span can't be found after the previous edit
+    (e.g. overlapping edits), are skipped with a warning and appended to dropped.
+    """
+    corrected_parts = []
+    tokens = []
+    cursor = 0
+    if dropped is None:
+        dropped = []
+
+    def add_equal(text):
+        for c in text:
+            tokens.append({'char': c, 'type': 'equal'})
+
+    def position(edit):
+        start = sentence.find(edit["original"]) if edit["original"] else -1
+        return len(sentence) if start == -1 else start
+
+    # sorted is stable: edits of the same span (e.g. a repeated word) keep their order.
+    for edit in sorted(edits, key=position):
+        original = edit["original"]
+        replacement = edit["replacement"]
+        if not original:
+            print(f"[WARN] Skipping edit with empty span: {edit}")
+            dropped.append(edit)
+            continue
+        start = sentence.find(original, cursor)
+        if start == -1:
+            print(f"[WARN] Edit span '{original}' not found in: {sentence}")
+            dropped.append(edit)
+            continue
+        end = start + len(original)
+
+        unchanged = sentence[cursor:start]
+        corrected_parts.append(unchanged)
+        add_equal(unchanged)
+
+        corrected_parts.append(replacement)
+        tokens.extend({'char': t['char'], 'type': t['type']} for t in highlight_changes(original, replacement))
+        cursor = end
+
+    corrected_parts.append(sentence[cursor:])
+    add_equal(sentence[cursor:])
+
+    for i, token in enumerate(tokens):
+        token['index'] = i
+    return "".join(corrected_parts), tokens
+
+
+def build_edit_list_output(ocr_sentences: List[str], edits: List[Dict]):
+    """
+    Build the outputs that align_sentences + generate_report would have produced.
+
+    Returns:
+        matches: list of (ocr_sentence, corrected_sentence), one per OCR sentence.
+        report: colored report for display.
+        tokenized_output: list of token lists, one per sentence.
+    """
+    edits_by_sentence = {}
+    for edit in edits:
+        edits_by_sentence.setdefault(edit["sentence_index"], []).append(edit)
+
+    matches = []
+    tokenized_output = []
+    report_lines = []
+    dropped = [edit for edit in edits if not 0 <= edit["sentence_index"] < len(ocr_sentences)]
+    for edit in dropped:
+        print(f"[WARN] Edit for missing sentence {edit['sentence_index']}: {edit}")
+    for num, sentence in enumerate(ocr_sentences):
+        corrected, tokens = apply_sentence_edits(sentence, edits_by_sentence.get(num, []), dropped)
+        matches.append((sentence, corrected))
+        tokenized_output.append(tokens)
+        report_lines.append(f"Sentence {num + 1}:\n{apply_colors(tokens)}")
+    if dropped:
+        print(f"[WARN] Dropped {len(dropped)} of {len(edits)} edits that could not be applied")
+
+    return matches, "\n\n".join(report_lines), tokenized_output
+
+
+if __name__ == "__main__":
+    sentences = ["Recently, there are many music and K-pop singer coming out.",
+                 "In my life, I'm having hard time due to the homework."]
+    edits = [
+        {"sentence_index": 0, "original": "there are", "replacement": "there have been"},
+        {"sentence_index": 0, "original": "singer", "replacement": "singers"},
+        {"sentence_index": 1, "original": "having hard", "replacement": "having a hard"},
+        {"sentence_index": 1, "original": "due to the homework", "replacement": "with homework"},
+    ]
+    matches, report, tokenized_output = build_edit_list_output(sentences, edits)
+    for ocr_sentence, corrected_sentence in matches:
+        print(f"OCR Sentence: {ocr_sentence}")
+        print(f"Corrected Sentence: {corrected_sentence}")
+    print(report)
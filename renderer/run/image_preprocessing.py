@@ -0,0 +1,181 @@
+# image_preprocessing.py
+
+import base64
+import io
+
+_pillow = None
+
+# The vision model scales high-detail images to fit 2048x2048 and then to 768px on the
+# shortest side, so anything larger is uploaded only to be thrown away.
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+GRAYSCALE = True  # Handwriting OCR doesn't need color
+JPEG_QUALITY = 80
+
+# Read size for streaming base64 encoding; a multiple of 3 so chunks encode without padding.
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def pillow():
+    """
+    Return Pillow's (Image, ImageOps), or (None, None) if it isn't installed: Pillow is
+    optional, and without it images are sent as-is. Imported on first use, since the web
+    app imports this module for sniff_mime_type alone.
+    """
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image, ImageOps
+            _pillow = (Image, ImageOps)
+        except ImportError:
+            _pillow = (None, None)
+    return _pillow
+
+
+def sniff_mime_type(header):
+    """
+    Return the image MIME type for the first bytes of a file, or None if it isn't a known image format.
+    """
+    for magic, mime_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def detect_mime_type(header):
+    """
+    Detect the image MIME type from the first bytes of the file.
+    """
+    return sniff_mime_type(header) or "image/jpeg"  # Previous behavior: assume JPEG
+
+
+def target_size(width, height, max_long_side=MAX_LONG_SIDE, max_short_side=MAX_SHORT_SIDE):
+    """
+    Return the (width, height) the model would downscale to; never upscales.
+    """
+    scale = min(1.0, max_long_side / max(width, height))
+    scale = min(scale, max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def b64encode_stream(file_obj, chunk_size=ENCODE_CHUNK_SIZE, prefix=""):
+    """
+    Return prefix (e.g. "data:image/jpeg;base64,") followed by the base64 of a file
+    object. The file is read chunk by chunk, so its raw bytes are never held in full,
+    and prefix and chunks go into one buffer instead of being concatenated afterwards.
+    """
+    out = io.StringIO()
+    out.write(prefix)
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        out.write(base64.b64encode(chunk).decode("ascii"))
+    return out.getvalue()
+
+
+def preprocess_errors():
+    """
+    Exceptions meaning Pillow could not read or re-encode an image: the original file
+    is sent instead. Besides OSError, Pillow raises DecompressionBombError for huge images,
+    ValueError for bad modes or sizes and SyntaxError for some corrupt files.
+    """
+    Image, _ = pillow()
+    return (OSError, ValueError, SyntaxError) + ((Image.DecompressionBombError,) if Image else ())
+
+
+def encode_jpeg(img, grayscale=GRAYSCALE, quality=JPEG_QUALITY):
+    """
+    Downsample an already-oriented image to the model's working resolution, optionally
+    convert to grayscale and re-encode as JPEG. Returns an in-memory JPEG file object.
+    """
+    Image, _ = pillow()
+    img = img.convert("L" if grayscale else "RGB")
+    size = target_size(*img.size)
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    buffer.seek(0)
+    return buffer
+
+
+def preprocess_image(image_path, grayscale=GRAYSCALE, quality=JPEG_QUALITY):
+    """
+    Auto-orient, downsample to the model's working resolution, optionally convert to grayscale
+    and re-encode as JPEG. Returns an in-memory JPEG file object.
+    """
+    Image, ImageOps = pillow()
+    with Image.open(image_path) as img:
+        # For JPEGs, decode directly at a reduced scale instead of decoding the full photo.
+        img.draft("L" if grayscale else "RGB", target_size(*img.size))
+        img = ImageOps.exif_transpose(img)
+        return encode_jpeg(img, grayscale, quality)
+
+
+def encode_image_data_url(image_path, preprocess=True):
+    """
+    Return a data URL for the image, preprocessed if Pillow is available,
+    otherwise the original file with its real MIME type.
+    """
+    if preprocess and pillow()[0] is not None:
+        try:
+            return b64encode_stream(preprocess_image(image_path), prefix="data:image/jpeg;base64,")
+        except preprocess_errors() as e:
+            print(f"[WARN] Could not preprocess {image_path}, sending original: {e}")
+    with open(image_path, "rb") as image_file:
+        mime_type = detect_mime_type(image_file.read(16))
+        image_file.seek(0)
+        return b64encode_stream(image_file, prefix=f"data:{mime_type};base64,")
+
+
+# Band height as a fraction of the page width, and how much consecutive bands overlap.
+# A portrait page becomes ~3 landscape bands, each sent at up to twice the resolution
+# the whole page would get.
+BAND_ASPECT = 0.5
+BAND_OVERLAP = 0.15
+
+
+def encode_image_bands(image_path, band_aspect=BAND_ASPECT, overlap=BAND_OVERLAP):
+    """
+    Split a tall image into overlapping horizontal bands, top to bottom, and return a
+    data URL for each. Images short enough for one band (or without Pillow) give one URL.
+    """
+    Image, ImageOps = pillow()
+    if Image is None:
+        return [encode_image_data_url(image_path)]
+    try:
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+            band_height = max(1, int(width * band_aspect))
+            if height <= band_height * (1 + overlap):
+                return [encode_image_data_url(image_path)]
+            step = max(1, int(band_height * (1 - overlap)))
+            tops = list(range(0, height - band_height, step)) + [height - band_height]
+            return [
+                b64encode_stream(encode_jpeg(img.crop((0, top, width, top + band_height))),
+                                 prefix="data:image/jpeg;base64,")
+                for top in tops
+            ]
+    except preprocess_errors() as e:
+        print(f"[WARN] Could not split {image_path} into bands, sending original: {e}")
+        return [encode_image_data_url(image_path, preprocess=False)]
+
+
+if __name__ == "__main__":
+    import sys
+    import os
+    for path in sys.argv[1:]:
+        original = os.path.getsize(path)
+        url = encode_image_data_url(path)
+        print(f"{path}: {original} bytes on disk -> {len(url)} bytes in data URL ({url[:url.index(';')]})")
@@ -0,0 +1,469 @@
+# job_queue.py
+#
+# Runs the main.py pipeline (OCR -> correction -> render) for uploaded images on a
+# small worker pool, so the web app can take uploads without blocking a request.
+#
+# Job state lives in a "jobs" table next to the documents (document_store.DB_PATH), so
+# any gunicorn worker can answer a status poll; the finished document is stored under
+# the job id. Admission is checked against the table too: a burst of uploads beyond
+# MAX_QUEUE_DEPTH waiting jobs, or more than MAX_JOBS_PER_CLIENT unfinished jobs from
+# one client, is rejected with QueueFull (HTTP 429 + Retry-After) instead of piling up.
+#
+# The table is also the queue: worker threads in every process claim the oldest queued
+# job from it (see JobQueue._claim), so a job is picked up by whichever gunicorn worker
+# is idle, not only by the one that took the upload. At most MAX_RUNNING_JOBS run at
+# once across all processes. A process polls every JOB_POLL_SECONDS for jobs queued
+# elsewhere; gunicorn.conf.py starts the pollers in each worker. Uploaded pages are kept
+# in UPLOAD_DIR, which all processes must share, until their job has run.
+
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+
+import document_store
+import stage_profiler
+from image_preprocessing import sniff_mime_type
+
+JOB_WORKERS = int(os.getenv("HW_HERO_JOB_WORKERS", "2"))  # Worker threads per process
+MAX_RUNNING_JOBS = int(os.getenv("HW_HERO_MAX_RUNNING_JOBS", str(JOB_WORKERS)))  # Across all processes
+JOB_POLL_SECONDS = float(os.getenv("HW_HERO_JOB_POLL_SECONDS", "1.0"))
+MAX_QUEUE_DEPTH = int(os.getenv("HW_HERO_MAX_QUEUE_DEPTH", "20"))
+MAX_JOBS_PER_CLIENT = int(os.getenv("HW_HERO_MAX_JOBS_PER_CLIENT", "3"))
+MAX_UPLOAD_BYTES = int(os.getenv("HW_HERO_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_PAGES = 10
+UPLOAD_DIR = os.getenv("HW_HERO_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+# Run jobs on main.py's built-in sample texts instead of calling the API (offline demos).
+JOB_USE_TEST_DATA = os.getenv("HW_HERO_JOB_TEST_DATA", "0") == "1"
+JOB_CORRECTION_MODES = ("full_text", "edit_list", "chunked")
+DEFAULT_JOB_SECONDS = 30  # Retry-After estimate before any job has finished
+
+# Progress is reported per job stage; each main.py stage counts towards one (or two) of them.
+JOB_STAGES = ["ocr", "correction", "align", "diff", "render", "store"]
+PIPELINE_STAGES = {
+    "ocr": ("ocr",),
+    "correction": ("correction",),
+    "ocr_correction": ("ocr", "correction"),
+    "split": ("align",),
+    "align": ("align",),
+    "diff": ("diff",),
+    "blocks": ("render",),
+    "render": ("render",),
+    "cleanup": ("render",),
+    "overhang": ("render",),
+    "block_detection": ("render",),
+    "json": ("render",),
+    "custom_sentences": ("render",),
+    "write": ("store",),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client TEXT,
+    status TEXT NOT NULL,
+    correction_mode TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    progress TEXT NOT NULL,
+    error TEXT,
+    pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, client);
+"""
+JOB_FIELDS = ("id", "client", "status", "correction_mode", "pages", "progress", "error",
+              "created_at", "started_at", "finished_at")
+UNFINISHED = ("queued", "running")
+
+
+class JobError(ValueError):
+    """
+    The upload was rejected (not an image, too large, bad options). HTTP 400/413.
+    """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class QueueFull(Exception):
+    """
+    Backpressure: the queue (or this client's share of it) is full. HTTP 429.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def new_progress():
+    return {"stage": None, "stages": {name: {"status": "pending", "seconds": 0.0} for name in JOB_STAGES}}
+
+
+def run_pipeline(job_id, image_paths, correction_mode, use_test_data=JOB_USE_TEST_DATA):
+    """
+    Default job runner: main.main() with the document saved under the job id.
+    main is imported here so the web app doesn't load the pipeline until the first job.
+    """
+    import main
+    main.main(use_test_data=use_test_data, correction_mode=correction_mode, image_paths=image_paths,
+              document_id=job_id, write_files=False)
+
+
+class JobProgress:
+    """
+    stage_profiler observer for one job: tracks which job stage is running and how long
+    each took, and saves the progress whenever the current stage changes.
+    """
+    def __init__(self, progress, save):
+        self.progress = progress
+        self.save = save
+        self.started = {}
+
+    def __call__(self, pipeline_stage, event):
+        now = time.perf_counter()
+        changed = False
+        for name in PIPELINE_STAGES.get(pipeline_stage, ()):
+            entry = self.progress["stages"][name]
+            if event == "start":
+                self.started[name] = now
+                if entry["status"] != "running":
+                    # Pipeline stages run in order, so starting one finishes whatever was running.
+                    for other in self.progress["stages"].values():
+                        if other["status"] == "running":
+                            other["status"] = "done"
+                    entry["status"] = "running"
+                    self.progress["stage"] = name
+                    changed = True
+            elif name in self.started:
+                entry["seconds"] = round(entry["seconds"] + now - self.started.pop(name), 3)
+        if changed:
+            self.save(self.progress)
+
+    def finish(self):
+        for entry in self.progress["stages"].values():
+            if entry["status"] == "running":
+                entry["status"] = "done"
+            elif entry["status"] == "pending":
+                entry["status"] = "skipped"  # e.g. align in edit_list mode
+        self.progress["stage"] = None
+
+
+class JobQueue:
+    """
+    Worker threads are started by start() or on the first submit, so importing the app
+    (or forking gunicorn workers) doesn't start any. runner(job_id, image_paths,
+    correction_mode) runs one job and must store the document under job_id.
+    """
+    def __init__(self, store=None, workers=JOB_WORKERS, max_queue_depth=MAX_QUEUE_DEPTH,
+                 max_jobs_per_client=MAX_JOBS_PER_CLIENT, upload_dir=UPLOAD_DIR, runner=run_pipeline,
+                 max_running=MAX_RUNNING_JOBS, poll_seconds=JOB_POLL_SECONDS):
+        self.store = store or document_store.get_store()
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.max_jobs_per_client = max_jobs_per_client
+        self.upload_dir = upload_dir
+        self.runner = runner
+        self.max_running = max_running
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._submitted = set()  # Job ids submitted here, for wait()
+        self._threads = []
+        self._lock = threading.Lock()
+        with self.store.connection() as conn:
+            conn.executescript(SCHEMA)
+        self.fail_orphaned_jobs()
+
+    def fail_orphaned_jobs(self):
+        """
+        Mark running jobs of processes that no longer exist as failed (a restart lost them).
+        Queued jobs stay queued: any process can still run them.
+        """
+        conn = self.store.connection()
+        with conn:
+            self._fail_orphans(conn)
+
+    def _fail_orphans(self, conn):
+        rows = conn.execute("SELECT id, pid FROM jobs WHERE status = 'running'").fetchall()
+        orphaned = [job_id for job_id, pid in rows if pid != os.getpid() and not _process_alive(pid)]
+        conn.executemany(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', finished_at = ? WHERE id = ?",
+            [(time.time(), job_id) for job_id in orphaned],
+        )
+
+    def submit(self, pages, client=None, correction_mode="full_text"):
+        """
+        Queue a job for the uploaded pages, a list of (filename, bytes) in reading order.
+        Returns the job status dict. Raises JobError for a bad upload and QueueFull under backpressure.
+        """
+        if correction_mode not in JOB_CORRECTION_MODES:
+            raise JobError(f"correction_mode must be one of {', '.join(JOB_CORRECTION_MODES)}")
+        if not pages:
+            raise JobError("No image uploaded")
+        if len(pages) > MAX_PAGES:
+            raise JobError(f"At most {MAX_PAGES} pages per job")
+        for filename, data in pages:
+            if len(data) > MAX_UPLOAD_BYTES:
+                raise JobError(f"{filename} is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MiB", status=413)
+            if sniff_mime_type(data[:16]) is None:
+                raise JobError(f"{filename} is not a JPEG, PNG, GIF or WebP image")
+
+        job_id = document_store.new_document_id()
+        # Pages are saved first: once the job row exists, any process may claim it.
+        self._save_pages(job_id, pages)
+        try:
+            self._admit(job_id, client, correction_mode, len(pages))
+        except BaseException:
+            shutil.rmtree(os.path.join(self.upload_dir, job_id), ignore_errors=True)
+            raise
+        with self._lock:
+            self._submitted.add(job_id)
+        self.start()
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def _admit(self, job_id, client, correction_mode, pages):
+        # BEGIN IMMEDIATE takes the write lock before counting, so two workers admitting
+        # at once can't both see the last free slot.
+        conn = self.store.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queue_depth:
+                raise QueueFull("The job queue is full, try again later", self.retry_after(queued))
+            if client is not None:
+                unfinished = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN (?, ?)", (client,) + UNFINISHED
+                ).fetchone()[0]
+                if unfinished >= self.max_jobs_per_client:
+                    raise QueueFull(f"At most {self.max_jobs_per_client} unfinished jobs per client",
+                                    self.retry_after(queued))
+            conn.execute(
+                "INSERT INTO jobs (id, client, status, correction_mode, pages, progress, pid, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, client, correction_mode, pages, json.dumps(new_progress()), os.getpid(), time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def retry_after(self, queued):
+        """
+        Seconds until a slot is likely free: the recent average job time for each queued job
+        per running slot (max_running, shared by all processes).
+        """
+        row = self.store.connection().execute(
+            "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM jobs "
+            "WHERE status = 'done' ORDER BY finished_at DESC LIMIT 20)"
+        ).fetchone()
+        average = row[0] or DEFAULT_JOB_SECONDS
+        return max(1, int(average * max(1, queued) / max(1, self.max_running)))
+
+    def _save_pages(self, job_id, pages):
+        job_dir = os.path.join(self.upload_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        image_paths = []
+        for number, (filename, data) in enumerate(pages, 1):
+            extension = os.path.splitext(filename or "")[1].lower() or ".jpg"
+            path = os.path.join(job_dir, f"page-{number}{extension}")
+            with open(path, "wb") as f:
+                f.write(data)
+            image_paths.append(path)
+        return image_paths
+
+    def _page_paths(self, job_id):
+        job_dir = os.path.join(self.upload_dir, job_id)
+        names = os.listdir(job_dir) if os.path.isdir(job_dir) else []
+        names.sort(key=lambda name: int(os.path.splitext(name)[0].split("-")[1]))  # page-<number><ext>
+        return [os.path.join(job_dir, name) for name in names]
+
+    def start(self):
+        """
+        Start this process's worker threads (idempotent); they poll the jobs table.
+        """
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            self._wakeup.clear()
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                continue
+            self._run(*job)
+            self._wakeup.set()  # A running slot is free again
+
+    def _claim(self):
+        """
+        Move the oldest queued job to running for this process, unless none is queued or
+        max_running jobs are already running anywhere. Returns (job_id, image_paths,
+        correction_mode) or None.
+        """
+        conn = self.store.connection()
+        if conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+            return None  # Polling is a read; the write lock is only taken when there is work
+        # As in _admit, BEGIN IMMEDIATE makes count-then-claim atomic across processes.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._fail_orphans(conn)  # A dead worker's jobs would hold running slots forever
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            row = None
+            if running < self.max_running:
+                row = conn.execute(
+                    "SELECT id, correction_mode FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ?, pid = ? WHERE id = ?",
+                             (time.time(), os.getpid(), row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], self._page_paths(row[0]), row[1]
+
+    def _run(self, job_id, image_paths, correction_mode):
+        progress = JobProgress(new_progress(), lambda p: self._save_progress(job_id, p))
+        try:
+            with stage_profiler.observe(progress):
+                self.runner(job_id, image_paths, correction_mode)
+            stored = self.store.connection().execute("SELECT 1 FROM documents WHERE id = ?", (job_id,)).fetchone()
+            if stored is None:
+                raise RuntimeError("The pipeline finished without storing a document")
+            progress.finish()
+            self._finish(job_id, "done", progress.progress)
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} failed:", str(e))
+            traceback.print_exc()
+            self._finish(job_id, "failed", progress.progress, str(e))
+        finally:
+            shutil.rmtree(os.path.join(self.upload_dir, job_id), ignore_errors=True)
+
+    def _save_progress(self, job_id, progress):
+        with self.store.connection() as conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def _finish(self, job_id, status, progress, error=None):
+        with self.store.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(progress), error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        """
+        Return the job status dict (with queue position while queued), or None.
+        """
+        conn = self.store.connection()
+        row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        job["progress"] = json.loads(job["progress"])
+        if job["status"] == "queued":
+            job["queue_position"] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= ?", (job["created_at"],)
+            ).fetchone()[0]
+        if job["status"] == "done":
+            job["document_id"] = job_id
+        return job
+
+    def list_jobs(self, limit=50):
+        conn = self.store.connection()
+        rows = conn.execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(zip(JOB_FIELDS, row))
+            job["progress"] = json.loads(job["progress"])
+            jobs.append(job)
+        return jobs
+
+    def depth(self):
+        """
+        Queued and running job counts across all processes sharing the database.
+        """
+        rows = self.store.connection().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", UNFINISHED
+        ).fetchall()
+        counts = dict(rows)
+        return {"queued": counts.get("queued", 0), "running": counts.get("running", 0),
+                "max_queue_depth": self.max_queue_depth, "max_running": self.max_running,
+                "workers": self.workers}
+
+    def wait(self, poll_seconds=0.05):
+        """
+        Block until every job submitted to this process has finished, wherever it ran (tests, scripts).
+        """
+        while True:
+            with self._lock:
+                pending = list(self._submitted)
+            for job_id in pending:
+                job = self.get(job_id)
+                if job is None or job["status"] not in UNFINISHED:
+                    with self._lock:
+                        self._submitted.discard(job_id)
+            with self._lock:
+                if not self._submitted:
+                    return
+            time.sleep(poll_seconds)
+
+
+def with_links(job):
+    """
+    The job status dict as returned by the web API, with the URLs a client polls and fetches.
+    """
+    job = dict(job, status_url=f"/jobs/{job['id']}", result_url=f"/jobs/{job['id']}/result")
+    if job["status"] == "done":
+        job["view_url"] = f"/?document={job['id']}"
+    return job
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide job queue (created on first use).
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+if __name__ == "__main__":
+    import sys
+    # Run one job in this process and print its progress: python job_queue.py IMAGE [IMAGE ...]
+    pages = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            pages.append((os.path.basename(path), f.read()))
+    job = get_job_queue().submit(pages)
+    print(f"Queued job {job['id']}")
+    get_job_queue().wait()
+    print(json.dumps(get_job_queue().get(job["id"]), indent=4))
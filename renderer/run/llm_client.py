@@ -0,0 +1,463 @@
+# llm_client.py
+#
+# Single entry point for every ChatCompletion call (pipeline and web app).
+# Adds pooled HTTP connections, per-model token-bucket rate limiting, bounded
+# concurrency, per-call timeouts and jittered exponential backoff on 429/5xx.
+# Every call is recorded in llm_metrics (tokens, cost, latency, retries).
+
+import asyncio
+import collections
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import aiohttp
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+import llm_metrics
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# --- Configuration ---
+
+# Requests and tokens per minute for each model; match these to the account's rate limits.
+MODEL_RATE_LIMITS = {
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+}
+DEFAULT_RATE_LIMIT = {"rpm": 500, "tpm": 30000}
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("HW_HERO_LLM_CONCURRENCY", "16"))
+DEFAULT_TIMEOUT = 60  # seconds, per attempt
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 30.0  # seconds
+
+# Hedging: if a call hasn't answered by the HEDGE_PERCENTILE latency seen for that model,
+# fire a duplicate and take whichever answers first. Hedges are capped at
+# HEDGE_BUDGET_RATIO of all calls (plus a small burst) so they can't multiply spend.
+HEDGE_ENABLED = os.getenv("HW_HERO_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 5.0  # seconds, until enough latencies are recorded
+HEDGE_BUDGET_RATIO = 0.1
+HEDGE_BUDGET_BURST = 3
+
+# Rough token estimates for the limiter: ~4 characters per token, and a fixed cost per image.
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1000
+
+
+# --- Rate limiting ---
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth.
+    Thread-safe; callers sleep (or await) for the time reserve() returns.
+    """
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take `amount` tokens (going negative if needed) and return how long to wait
+        before using them. Reserving up front keeps waiting callers in arrival order.
+        """
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _get_buckets(model):
+    with _buckets_lock:
+        if model not in _buckets:
+            limits = MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+            _buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return _buckets[model]
+
+def configure_rate_limit(model, rpm, tpm):
+    """
+    Set the rate limits for a model (replaces its buckets).
+    """
+    MODEL_RATE_LIMITS[model] = {"rpm": rpm, "tpm": tpm}
+    with _buckets_lock:
+        _buckets.pop(model, None)
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Estimate the tokens a request counts against the TPM limit (prompt + max completion).
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            total += len(content) // CHARS_PER_TOKEN
+        else:
+            for part in content:
+                if part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+                else:
+                    total += len(part.get("text", "")) // CHARS_PER_TOKEN
+    return total + (max_tokens or 0)
+
+def _rate_limit_delay(model, messages, max_tokens):
+    request_bucket, token_bucket = _get_buckets(model)
+    return max(request_bucket.reserve(1), token_bucket.reserve(estimate_tokens(messages, max_tokens)))
+
+
+# --- Retries ---
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+
+def backoff_delay(attempt, error=None):
+    """
+    Full-jitter exponential backoff; honors Retry-After when the server sends it.
+    """
+    retry_after = getattr(error, "headers", {}).get("retry-after") if error is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# --- Connection pooling and concurrency ---
+
+_sync_semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+def _sync_slot_free():
+    # threading semaphores have no public counter; _value is the number of free slots.
+    return _sync_semaphore._value > 0
+
+def _make_requests_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# One shared, pooled session for all sync calls (instead of one per thread).
+openai.requestssession = _make_requests_session()
+
+# aiohttp sessions and semaphores are bound to an event loop, so keep one of each per loop.
+_async_state = weakref.WeakKeyDictionary()
+
+def _get_async_state():
+    loop = asyncio.get_running_loop()
+    state = _async_state.get(loop)
+    if state is None or state["session"].closed:
+        state = {
+            "session": aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS)),
+            "semaphore": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS),
+        }
+        _async_state[loop] = state
+    return state
+
+async def aclose():
+    """
+    Close the current event loop's pooled aiohttp session (call on server shutdown).
+    """
+    state = _async_state.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state["session"].close()
+
+
+# --- Latency tracking and hedging budget ---
+
+LATENCY_WINDOW = 200
+_latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+_hedge_stats = {"calls": 0, "hedges": 0}
+_hedge_lock = threading.Lock()
+
+def record_latency(model, seconds):
+    with _hedge_lock:
+        _latencies[model].append(seconds)
+
+def latency_percentile(model, percentile=HEDGE_PERCENTILE):
+    """
+    Return the given percentile of recent successful latencies for a model, or None if too few samples.
+    """
+    with _hedge_lock:
+        samples = sorted(_latencies[model])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+    return samples[index]
+
+def hedge_delay(model):
+    delay = latency_percentile(model)
+    return HEDGE_DEFAULT_DELAY if delay is None else delay
+
+def _count_call():
+    with _hedge_lock:
+        _hedge_stats["calls"] += 1
+
+def _take_hedge_budget():
+    """
+    Claim one hedge if the budget allows it.
+    """
+    with _hedge_lock:
+        allowed = _hedge_stats["calls"] * HEDGE_BUDGET_RATIO + HEDGE_BUDGET_BURST
+        if _hedge_stats["hedges"] + 1 > allowed:
+            return False
+        _hedge_stats["hedges"] += 1
+        return True
+
+def hedge_stats():
+    with _hedge_lock:
+        return dict(_hedge_stats)
+
+_hedge_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="llm-hedge")
+
+# --- Instrumentation ---
+
+def _record_response(model, step, messages, response, start, retries):
+    usage = llm_metrics.response_usage(response)
+    if usage is None:
+        usage, estimated = (estimate_tokens(messages, 0), 0), True
+    else:
+        estimated = False
+    llm_metrics.record_call(model, step, usage[0], usage[1], time.monotonic() - start,
+                            retries=retries, estimated=estimated)
+
+def _record_error(model, step, messages, error, start, retries):
+    llm_metrics.record_call(model, step, estimate_tokens(messages, 0), 0, time.monotonic() - start,
+                            retries=retries, error=type(error).__name__, estimated=True)
+
+def _stream_recorder(model, step, messages, start, retries):
+    """
+    Return (on_chunk, finish) callbacks that count a streamed answer's content and record
+    the call when the stream ends. Streams carry no usage, so tokens are estimated.
+    """
+    pieces = []
+
+    def on_chunk(chunk):
+        delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+        if delta:
+            pieces.append(delta)
+
+    def finish():
+        llm_metrics.record_call(model, step, estimate_tokens(messages, 0),
+                                len("".join(pieces)) // CHARS_PER_TOKEN, time.monotonic() - start,
+                                retries=retries, estimated=True)
+    return on_chunk, finish
+
+def _release_once(release):
+    lock = threading.Lock()
+    released = []
+
+    def once():
+        with lock:
+            if released:
+                return
+            released.append(True)
+        release()
+    return once
+
+def _hold_until_closed(stream, release):
+    """
+    Return stream; its concurrency slot is released when the stream ends or is closed, or
+    when it is garbage collected without ever being iterated (its finally never runs then).
+    """
+    weakref.finalize(stream, release)
+    return stream
+
+def _instrument_stream(response, model, step, messages, start, retries, release):
+    on_chunk, finish = _stream_recorder(model, step, messages, start, retries)
+    try:
+        for chunk in response:
+            on_chunk(chunk)
+            yield chunk
+    finally:
+        release()
+        finish()
+
+async def _ainstrument_stream(response, model, step, messages, start, retries, release):
+    on_chunk, finish = _stream_recorder(model, step, messages, start, retries)
+    try:
+        async for chunk in response:
+            on_chunk(chunk)
+            yield chunk
+    finally:
+        release()
+        finish()
+
+# --- Public API ---
+
+def chat_completion(model, messages, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES, step=None,
+                    on_dispatch=None, **kwargs):
+    """
+    openai.ChatCompletion.create with rate limiting, bounded concurrency, a per-attempt
+    timeout and retries. Returns the raw response (a generator when stream=True; only
+    opening the stream is retried, and the stream holds its concurrency slot until it
+    ends or is closed). `step` labels the call in llm_metrics. on_dispatch, if given, is
+    called once a concurrency slot is held and the request is about to be sent.
+    """
+    attempt = 0
+    call_start = time.monotonic()
+    while True:
+        time.sleep(_rate_limit_delay(model, messages, kwargs.get("max_tokens")))
+        try:
+            _sync_semaphore.acquire()
+            release = _release_once(_sync_semaphore.release)
+            try:
+                if on_dispatch is not None:
+                    on_dispatch()
+                start = time.monotonic()
+                response = openai.ChatCompletion.create(
+                    model=model, messages=messages, request_timeout=timeout, **kwargs
+                )
+                record_latency(model, time.monotonic() - start)
+            except BaseException:
+                release()
+                raise
+            if kwargs.get("stream"):
+                return _hold_until_closed(
+                    _instrument_stream(response, model, step, messages, call_start, attempt, release), release)
+            release()
+            _record_response(model, step, messages, response, call_start, attempt)
+            return response
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                _record_error(model, step, messages, e, call_start, attempt)
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"[WARN] {model} call failed ({type(e).__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+async def achat_completion(model, messages, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES, step=None,
+                           on_dispatch=None, **kwargs):
+    """
+    Async version of chat_completion (openai.ChatCompletion.acreate over a pooled aiohttp session).
+    """
+    state = _get_async_state()
+    openai.aiosession.set(state["session"])
+    attempt = 0
+    call_start = time.monotonic()
+    while True:
+        await asyncio.sleep(_rate_limit_delay(model, messages, kwargs.get("max_tokens")))
+        try:
+            await state["semaphore"].acquire()
+            release = _release_once(state["semaphore"].release)
+            try:
+                if on_dispatch is not None:
+                    on_dispatch()
+                start = time.monotonic()
+                response = await openai.ChatCompletion.acreate(
+                    model=model, messages=messages, request_timeout=timeout, **kwargs
+                )
+                record_latency(model, time.monotonic() - start)
+            except BaseException:
+                release()
+                raise
+            if kwargs.get("stream"):
+                return _hold_until_closed(
+                    _ainstrument_stream(response, model, step, messages, call_start, attempt, release), release)
+            release()
+            _record_response(model, step, messages, response, call_start, attempt)
+            return response
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                _record_error(model, step, messages, e, call_start, attempt)
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"[WARN] {model} call failed ({type(e).__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def chat_completion_hedged(model, messages, hedge=None, **kwargs):
+    """
+    chat_completion with optional hedging (see HEDGE_ENABLED). If no answer arrives within
+    hedge_delay(model) of the request being sent, one duplicate is sent and the first answer
+    wins. Time spent waiting for a thread or a concurrency slot doesn't count, and no
+    duplicate is sent while all slots are busy: it would only queue behind the others.
+    A thread can't be interrupted, so the losing call finishes in the background and its
+    result is dropped. Not for stream=True.
+    """
+    if hedge is None:
+        hedge = HEDGE_ENABLED
+    _count_call()
+    if not hedge:
+        return chat_completion(model, messages, **kwargs)
+
+    dispatched = threading.Event()
+    primary = _hedge_executor.submit(llm_metrics.bind_trace(chat_completion), model, messages,
+                                     on_dispatch=dispatched.set, **kwargs)
+    primary.add_done_callback(lambda _: dispatched.set())  # Failed before it was sent
+    dispatched.wait()
+    done, _ = wait([primary], timeout=hedge_delay(model))
+    if done or not _sync_slot_free() or not _take_hedge_budget():
+        return primary.result()
+    print(f"[INFO] Hedging slow {model} call")
+    backup = _hedge_executor.submit(llm_metrics.bind_trace(chat_completion), model, messages, **kwargs)
+    done, pending = wait([primary, backup], return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    if winner.exception() is not None and pending:
+        # The first one to finish failed; fall back to the other.
+        return next(iter(pending)).result()
+    for future in pending:
+        future.cancel()
+    return winner.result()
+
+async def achat_completion_hedged(model, messages, hedge=None, **kwargs):
+    """
+    Async version of chat_completion_hedged (the same dispatch and free-slot rules); the
+    losing request is cancelled.
+    """
+    if hedge is None:
+        hedge = HEDGE_ENABLED
+    _count_call()
+    if not hedge:
+        return await achat_completion(model, messages, **kwargs)
+
+    dispatched = asyncio.Event()
+    primary = asyncio.ensure_future(achat_completion(model, messages, on_dispatch=dispatched.set, **kwargs))
+    primary.add_done_callback(lambda _: dispatched.set())
+    await dispatched.wait()
+    done, _ = await asyncio.wait([primary], timeout=hedge_delay(model))
+    if done or _get_async_state()["semaphore"].locked() or not _take_hedge_budget():
+        return await primary
+    print(f"[INFO] Hedging slow {model} call")
+    backup = asyncio.ensure_future(achat_completion(model, messages, **kwargs))
+    done, pending = await asyncio.wait([primary, backup], return_when=asyncio.FIRST_COMPLETED)
+    winner = next(iter(done))
+    if winner.exception() is not None and pending:
+        return await next(iter(pending))
+    for task in pending:
+        task.cancel()
+    return winner.result()
+
+def completion_text(response):
+    """
+    Return the message content of a non-streamed response.
+    """
+    return response.choices[0].message["content"]
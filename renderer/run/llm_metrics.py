@@ -0,0 +1,204 @@
+# llm_metrics.py
+#
+# Per-call instrumentation for llm_client: model, pipeline step, prompt/completion tokens,
+# cost, wall latency, retry count and cache-hit status for every ChatCompletion call.
+# Explanations answered from a template (rule_based_explanation) are recorded too, with
+# rule_based=True and no model, so they show up per request without counting as calls
+# or cache hits.
+# Calls are grouped into per-request traces (one /highlight_click, one main.py run) and
+# aggregated into latency histograms per (step, model).
+
+import collections
+import contextlib
+import contextvars
+import itertools
+import json
+import threading
+import time
+
+# USD per million (prompt, completion) tokens; keep in line with the provider's price list.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+MAX_CALLS = 5000  # recent call records kept for the histograms
+MAX_TRACES = 200  # recent per-request traces kept
+
+_current_trace = contextvars.ContextVar("llm_trace", default=None)
+_trace_ids = itertools.count(1)
+_calls = collections.deque(maxlen=MAX_CALLS)
+_traces = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_call(model, step=None, prompt_tokens=0, completion_tokens=0, latency=0.0,
+                retries=0, cache_hit=False, error=None, estimated=False, rule_based=False):
+    """
+    Record one LLM call against the current trace, or one answer served without a call:
+    from a cache (cache_hit=True) or from a template (rule_based=True). Returns the record.
+    """
+    record = {
+        "trace": _current_trace.get(),
+        "step": step or "unlabeled",
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": call_cost(model, prompt_tokens, completion_tokens),
+        "latency": round(latency, 4),
+        "retries": retries,
+        "cache_hit": cache_hit,
+        "rule_based": rule_based,
+        "error": error,
+        "estimated_tokens": estimated,
+        "time": time.time(),
+    }
+    with _lock:
+        _calls.append(record)
+        if record["trace"] in _traces:
+            _traces[record["trace"]]["calls"].append(record)
+    return record
+
+
+def response_usage(response):
+    """
+    Return (prompt_tokens, completion_tokens) from a non-streamed response, or None.
+    """
+    usage = getattr(response, "usage", None) or (response.get("usage") if isinstance(response, dict) else None)
+    if not usage:
+        return None
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """
+    Group the LLM calls made inside the block (in this thread or task) into one trace.
+    Yields the trace dict; it stays readable after the block ends.
+    """
+    trace_id = next(_trace_ids)
+    entry = {"id": trace_id, "name": name, "attributes": attributes,
+             "start": time.time(), "duration": None, "calls": []}
+    with _lock:
+        _traces[trace_id] = entry
+        while len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+    token = _current_trace.set(trace_id)
+    start = time.monotonic()
+    try:
+        yield entry
+    finally:
+        entry["duration"] = round(time.monotonic() - start, 4)
+        _current_trace.reset(token)
+
+
+def bind_trace(func):
+    """
+    Wrap func so it records into the caller's current trace when run on another thread
+    (ThreadPoolExecutor workers don't inherit context variables).
+    """
+    trace_id = _current_trace.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current_trace.set(trace_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return wrapper
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))]
+
+
+def summarize(calls):
+    """
+    Aggregate call records per (step, model): counts, tokens, cost, retries, cache hits,
+    rule-based answers, latency percentiles and a latency histogram. "calls" counts
+    only the records that were LLM calls or cache hits.
+    """
+    groups = collections.OrderedDict()
+    for record in calls:
+        groups.setdefault(f"{record['step']}|{record['model']}", []).append(record)
+
+    summary = {}
+    for key, records in groups.items():
+        latencies = sorted(r["latency"] for r in records if not r["cache_hit"] and not r["rule_based"])
+        histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in latencies:
+            histogram[next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))] += 1
+        summary[key] = {
+            "step": records[0]["step"],
+            "model": records[0]["model"],
+            "calls": sum(1 for r in records if not r["rule_based"]),
+            "errors": sum(1 for r in records if r["error"]),
+            "retries": sum(r["retries"] for r in records),
+            "cache_hits": sum(1 for r in records if r["cache_hit"]),
+            "rule_based": sum(1 for r in records if r["rule_based"]),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+            "completion_tokens": sum(r["completion_tokens"] for r in records),
+            "cost_usd": round(sum(r["cost_usd"] for r in records), 6),
+            "latency_total": round(sum(latencies), 4),
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p95": _percentile(latencies, 95),
+            "latency_max": latencies[-1] if latencies else None,
+            "histogram": {"le": list(LATENCY_BUCKETS) + ["inf"], "counts": histogram},
+        }
+    return summary
+
+
+def get_stats(traces=10):
+    """
+    Return the aggregated histograms over recent calls plus the most recent traces.
+    """
+    with _lock:
+        calls = list(_calls)
+        recent = list(_traces.values())[-traces:] if traces else []
+    return {"summary": summarize(calls), "traces": [dict(t, calls=list(t["calls"])) for t in recent]}
+
+
+def get_trace(trace_id):
+    with _lock:
+        return _traces.get(trace_id)
+
+
+def dump(path, traces=MAX_TRACES):
+    """
+    Write get_stats() to a JSON file (for main.py runs and benchmarks).
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(get_stats(traces), f, indent=2)
+    print(f"LLM call stats written to {path}")
+
+
+def print_summary(calls=None):
+    """
+    Print a per-step table of call counts, latency and cost.
+    """
+    if calls is None:
+        with _lock:
+            calls = list(_calls)
+    print(f"{'step':<14}{'model':<14}{'calls':>6}{'p50 s':>8}{'p95 s':>8}{'total s':>9}{'tokens':>9}{'cost $':>10}")
+    for row in summarize(calls).values():
+        tokens = row["prompt_tokens"] + row["completion_tokens"]
+        p50 = row["latency_p50"] or 0.0
+        p95 = row["latency_p95"] or 0.0
+        print(f"{row['step']:<14}{str(row['model']):<14}{row['calls']:>6}{p50:>8.2f}{p95:>8.2f}"
+              f"{row['latency_total']:>9.2f}{tokens:>9}{row['cost_usd']:>10.4f}")
+
+
+def reset():
+    with _lock:
+        _calls.clear()
+        _traces.clear()
@@ -1,10 +1,15 @@
-import pickle
-import json
-from openai_api_call import perform_ocr, correct_text
-from seq_alignment_reverse import align_sentences, clean_aligned_pairs, create_sentence_mapping
+import argparse
+import llm_metrics
+import document_store
+import stage_profiler
+from stage_profiler import stage
+from sentence_index import write_indexed_json
+from custom_sentence import materialize_custom_sentences
+# openai_api_call and multi_page_ocr (openai, aiohttp, requests, Pillow) are imported where
+# the API is called, so --use-test-data and the job queue's test runs never load them.
+from seq_alignment_reverse import align_split_sentences, clean_aligned_pairs, create_sentence_mapping, split_into_sentences
 from diff_lib_refactor import generate_report # type: ignore
 from block_creation import create_blocks
-from data_loader import DataLoader
 from renderer import process_sentences, save_renderer_output
 from annotated_line_space_cleanup import post_process
 from align_overhang import finalize_transformation
@@ -20,6 +25,13 @@ from prepare_tokenized_output import (
 
 use_test_data = False
 
+# "full_text": the model rewrites the whole essay and we rediscover edits by alignment + diff.
+# "edit_list": the model returns sentence-indexed edits that we apply locally (skips align + diff).
+# "chunked": like full_text, but paragraphs are corrected concurrently (for long essays).
+# "pipelined": OCR is streamed and each paragraph is corrected and rendered as soon as it's transcribed.
+CORRECTION_MODES = ("full_text", "edit_list", "chunked", "pipelined")
+correction_mode = "full_text"
+
 test_ocr_text = """Recently, there are many music and K-pop singer coming out. Also, many people including youth are enjoying and affected by it. As the world keeps affected by K-pop, some people are concerned about K-pop music's bad influence because it can have the bad effect. But, for my opinion, I strongly believe that K-pop has more positive effect than harm on the youth.
 
 Firstly, it can inspire confidence and hope. In my life, I'm having hard time due to the homework and school test. But, I sometimes get rested by hearing K-pop music and getting hope by it. Also, during COVID-19 pandemic, I was having hard time by its regulation. But when BTS's song named 'Permission to Dance', I can feel the hope to end the pandemic.
@@ -37,65 +49,210 @@ Secondly, it can make the whole culture more interesting to young people. In my
 Lastly, it can make Korean youth rethink their traditional culture and feel proud of it. Recently, I've heard a lot about Pusion.
 """
 image_path = "/home/keithuncouth/Downloads/IMG_1819.jpg"
+SENTENCE_MAPPING_PATH = "sentence_mapping.json"
+OUTPUT_JSON_PATH = "/home/keithuncouth/hw_hero/renderer/run/app/output.json"
+
+def main(use_test_data=use_test_data, correction_mode=correction_mode, image_paths=None, tiled_ocr=False,
+         document_id=None, write_files=True):
+    """
+    Run the pipeline and return the output.json data. The document is always saved to the
+    document store; write_files=False skips output.json, sentence_mapping.json and the
+    renderer pickle (the job queue runs several documents at once and only uses the store).
+    """
+    if correction_mode not in CORRECTION_MODES:
+        raise ValueError(f"Unknown correction mode: {correction_mode}")
+    if image_paths is None:
+        image_paths = [image_path]
+    # Several pages or tiling go through the concurrent multi-page OCR front end.
+    multi_page = len(image_paths) > 1 or tiled_ocr
+    if multi_page and correction_mode == "pipelined":
+        raise ValueError("Pipelined mode streams a single image; it can't be combined with multi-page or tiled OCR")
+    if correction_mode == "pipelined" and not use_test_data:
+        return main_pipelined(image_paths[0], document_id=document_id, write_files=write_files)
 
-def main():
     # Steps 1 & 2: OCR and correct
     if use_test_data:
         ocr_output = test_ocr_text
         corrected_text = test_corrected_text
+        correction_mode = "full_text"  # The sample data is a full corrected text
     else:
-        ocr_output = perform_ocr(image_path)
+        from openai_api_call import perform_ocr, correct_text, ocr_and_correct, correct_text_edits, correct_text_chunked
+        if multi_page:
+            from multi_page_ocr import ocr_pages
+            with stage("ocr"):
+                ocr_output = ocr_pages(image_paths, tile=tiled_ocr)
+            if correction_mode == "full_text":
+                with stage("correction"):
+                    corrected_text = correct_text(ocr_output)
+        elif correction_mode == "full_text":
+            # One combined call or two sequential ones (see openai_api_call.USE_COMBINED_OCR_CORRECTION)
+            with stage("ocr_correction"):
+                ocr_output, corrected_text = ocr_and_correct(image_paths[0])
+        else:
+            with stage("ocr"):
+                ocr_output = perform_ocr(image_paths[0])
         print("OCR Output:")
         print(ocr_output)
-        corrected_text = correct_text(ocr_output)
-        print("\nCorrected Text:")
-        print(corrected_text)
-
-    # Step 3: Align sentences
-    matches = align_sentences(ocr_output, corrected_text)
-    print("\nAligned Sentences:")
-    for ocr_sentence, corrected_sentence in matches:
-        print(f"OCR Sentence: {ocr_sentence}")
-        print(f"Corrected Sentence: {corrected_sentence}")
-    
-    cleaned_pairs = clean_aligned_pairs(matches)
-    sentence_mapping = create_sentence_mapping(cleaned_pairs)
-    sentence_mapping_path = "sentence_mapping.json"
-    with open(sentence_mapping_path, "w", encoding="utf-8") as f:
-        json.dump(sentence_mapping, f, indent=4, ensure_ascii=False)
-    print(f"Sentence mapping saved to {sentence_mapping_path}")
+        if correction_mode == "edit_list":
+            from edit_list_correction import parse_edit_list
+            with stage("split"):
+                ocr_sentences = split_into_sentences(ocr_output)
+            with stage("correction"):
+                edits = parse_edit_list(correct_text_edits(ocr_sentences))
+            print("\nEdits:")
+            for edit in edits:
+                print(edit)
+        else:
+            if correction_mode == "chunked":
+                with stage("correction"):
+                    corrected_text = correct_text_chunked(ocr_output)
+            print("\nCorrected Text:")
+            print(corrected_text)
+
+    if correction_mode == "edit_list":
+        from edit_list_correction import build_edit_list_output
+        # Steps 3 & 4: Apply edits locally; sentences are already paired and tokenized
+        with stage("diff"):
+            matches, report, tokenized_output = build_edit_list_output(ocr_sentences, edits)
+        cleaned_pairs = matches
+    else:
+        # Steps 3 & 4: Align sentences and generate a report
+        matches, cleaned_pairs, report, tokenized_output = align_and_diff(ocr_output, corrected_text)
+
+    with stage("align"):
+        sentence_mapping = create_sentence_mapping(cleaned_pairs)
+    if write_files:
+        with stage("write"):
+            write_sentence_mapping(sentence_mapping)
 
-    # Step 4: Generate a report
-    report, tokenized_output = generate_report(matches)
     print("\nGenerated Report:")
     print(report)
 
+    output_data = render_document(tokenized_output, save_debug_output=write_files)
+    with stage("custom_sentences"):
+        materialize_custom_sentences(output_data, sentence_mapping)
+    with stage("write"):
+        if write_files:
+            write_output_json(output_data)
+        save_document(output_data, sentence_mapping, document_id,
+                      source="test_data" if use_test_data else ", ".join(image_paths))
+    return output_data
+
+def main_pipelined(image_path=image_path, document_id=None, write_files=True):
+    """
+    Pipelined mode: paragraphs are aligned and rendered as soon as their correction is back,
+    while OCR of later paragraphs is still running. output.json, sentence_mapping.json and the
+    stored document are rewritten after each paragraph, so the app can show the essay as it fills in.
+    """
+    from openai_api_call import ocr_and_correct_pipelined
+    document_id = document_id or document_store.new_document_id()
+    sentence_mapping = {"sentences": []}
+    output_data = {"sentences": []}
+
+    for ocr_paragraph, corrected_paragraph in ocr_and_correct_pipelined(image_path):
+        print("OCR Paragraph:")
+        print(ocr_paragraph)
+        print("Corrected Paragraph:")
+        print(corrected_paragraph)
+
+        offset = len(output_data["sentences"])
+        matches, cleaned_pairs, report, tokenized_output = align_and_diff(
+            ocr_paragraph, corrected_paragraph, verbose=False
+        )
+        with stage("align"):
+            paragraph_mapping = create_sentence_mapping(cleaned_pairs, start_index=offset)
+            sentence_mapping["sentences"].extend(paragraph_mapping["sentences"])
+        paragraph_output = render_document(tokenized_output, sentence_index_offset=offset,
+                                           save_debug_output=write_files)
+        with stage("custom_sentences"):
+            materialize_custom_sentences(paragraph_output, paragraph_mapping)
+        output_data["sentences"].extend(paragraph_output["sentences"])
+
+        with stage("write"):
+            if write_files:
+                write_sentence_mapping(sentence_mapping)
+                write_output_json(output_data)
+            save_document(output_data, sentence_mapping, document_id, source=image_path)
+    return output_data
+
+def align_and_diff(ocr_text, corrected_text, verbose=True):
+    """
+    Steps 3 & 4: split both texts into sentences, align them and diff each pair.
+    Returns (matches, cleaned_pairs, report, tokenized_output).
+    """
+    with stage("split"):
+        ocr_sentences = split_into_sentences(ocr_text)
+        corrected_sentences = split_into_sentences(corrected_text)
+    with stage("align"):
+        matches = align_split_sentences(ocr_sentences, corrected_sentences)
+        if verbose:
+            print("\nAligned Sentences:")
+            for ocr_sentence, corrected_sentence in matches:
+                print(f"OCR Sentence: {ocr_sentence}")
+                print(f"Corrected Sentence: {corrected_sentence}")
+        cleaned_pairs = clean_aligned_pairs(matches)
+    with stage("diff"):
+        report, tokenized_output = generate_report(matches)
+    return matches, cleaned_pairs, report, tokenized_output
+
+def render_document(tokenized_output, sentence_index_offset=0, save_debug_output=True):
+    """
+    Steps 5-10: blocks, render, post-process, final transformation, block detection and JSON.
+    Takes one token list per sentence; sentence indices in the output start at sentence_index_offset.
+    save_debug_output=False skips renderer_output.pkl in the working directory.
+    """
     # Step 5: Create blocks
-    final_tokens_by_sentence = []
-    blocks_by_sentence = []
-    for sentence_tokens in tokenized_output:
-        blocks = create_blocks(sentence_tokens)
-        final_tokens_by_sentence.append(sentence_tokens)
-        blocks_by_sentence.append(blocks)
+    with stage("blocks"):
+        final_tokens_by_sentence = []
+        blocks_by_sentence = []
+        for sentence_tokens in tokenized_output:
+            blocks = create_blocks(sentence_tokens)
+            final_tokens_by_sentence.append(sentence_tokens)
+            blocks_by_sentence.append(blocks)
 
     # Step 6: Render and capture the returned lines
-    all_annotated_lines, all_final_sentences = process_sentences(
-        final_tokens_by_sentence, blocks_by_sentence
-    )
-    annotated_lines = all_annotated_lines
-    final_sentences = all_final_sentences
+    with stage("render"):
+        all_annotated_lines, all_final_sentences = process_sentences(
+            final_tokens_by_sentence, blocks_by_sentence, save_output=save_debug_output
+        )
+        annotated_lines = all_annotated_lines
+        final_sentences = all_final_sentences
 
     # Step 7: Post-process
-    annotated_lines, final_sentences, blocks_by_sentence = post_process(
-        annotated_lines, final_sentences, blocks_by_sentence
-    )
-    save_renderer_output(annotated_lines, final_sentences, blocks_by_sentence)
+    with stage("cleanup"):
+        annotated_lines, final_sentences, blocks_by_sentence = post_process(
+            annotated_lines, final_sentences, blocks_by_sentence
+        )
+        if save_debug_output:
+            save_renderer_output(annotated_lines, final_sentences, blocks_by_sentence)
 
     # Step 8: Final transformation
     print("\nRunning Final Transformation Stage...")
-    annotated_lines, final_sentences = finalize_transformation(annotated_lines, final_sentences)
+    with stage("overhang"):
+        annotated_lines, final_sentences = finalize_transformation(annotated_lines, final_sentences)
 
+    with stage("block_detection"):
+        replacement_ann_blocks_all, replacement_fin_blocks_all, insert_blocks_all, delete_blocks_all = \
+            detect_sentence_blocks(annotated_lines, final_sentences)
 
+    # 5) Prepare final JSON
+    with stage("json"):
+        output_data = prepare_json_output(
+            replacement_ann_blocks_all,
+            replacement_fin_blocks_all,
+            insert_blocks_all,
+            delete_blocks_all,
+            final_sentences,
+            annotated_lines,
+            sentence_index_offset=sentence_index_offset
+        )
+    return output_data
+
+def detect_sentence_blocks(annotated_lines, final_sentences):
+    """
+    Steps 9-10: detect and index the blocks in each annotated and final line.
+    Returns (replacement annotated blocks, replacement final blocks, insert blocks, delete blocks), one list per sentence.
+    """
     annotated_blocks_all = []
     for ann_line in annotated_lines:
         ann_blocks = detect_blocks_by_type(ann_line, valid_types={"corrected"})
@@ -146,22 +303,63 @@ def main():
     #):
         #print_sentence_debug(idx, final_line, ann_blocks, fin_blocks, annotated_line)
 
-    # 5) Prepare final JSON
-    output_data = prepare_json_output(
-        replacement_ann_blocks_all,
-        replacement_fin_blocks_all,
-        insert_blocks_all,
-        delete_blocks_all,
-        final_sentences,
-        annotated_lines
-    )
-
-    # 6) Write output.json
-    json_path = "/home/keithuncouth/hw_hero/renderer/run/app/output.json"
-    with open(json_path, "w") as f:
-        json.dump(output_data, f, indent=4)
+    return replacement_ann_blocks_all, replacement_fin_blocks_all, insert_blocks_all, delete_blocks_all
 
+# Both files are written as json.dump(indent=4) would, plus a <path>.idx sidecar of per-sentence
+# byte offsets, so the app can read one sentence without parsing the whole file.
+def write_sentence_mapping(sentence_mapping, sentence_mapping_path=SENTENCE_MAPPING_PATH):
+    write_indexed_json(sentence_mapping, sentence_mapping_path, ensure_ascii=False)
+    print(f"Sentence mapping saved to {sentence_mapping_path}")
+
+def write_output_json(output_data, json_path=OUTPUT_JSON_PATH):
+    write_indexed_json(output_data, json_path)
     print(f"\n[INFO] Wrote {json_path} successfully.")
 
+def save_document(output_data, sentence_mapping, document_id=None, source=None):
+    """
+    Store the document in the document store (the app serves it at /?document=<id>).
+    """
+    document_id = document_store.get_store().save_document(output_data, sentence_mapping, document_id, source)
+    print(f"[INFO] Stored document {document_id} in {document_store.get_store().path}")
+    return document_id
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the OCR -> correction -> render pipeline.")
+    parser.add_argument("--use-test-data", action="store_true", default=use_test_data,
+                        help="Use the built-in sample texts instead of calling the API.")
+    parser.add_argument("--correction-mode", choices=CORRECTION_MODES, default=correction_mode,
+                        help="How the model returns corrections (default: %(default)s).")
+    parser.add_argument("--images", nargs="+", metavar="IMAGE",
+                        help="Page images in reading order (default: the built-in image_path).")
+    parser.add_argument("--tiled-ocr", action="store_true",
+                        help="Split each page into overlapping bands and OCR them concurrently.")
+    parser.add_argument("--document-id",
+                        help="Id to store the document under (default: a new random id; an existing id is replaced).")
+    parser.add_argument("--llm-stats", metavar="PATH",
+                        help="Write per-call LLM latency, token and cost stats to PATH (JSON).")
+    parser.add_argument("--profile", nargs="?", const=stage_profiler.PROFILE_REPORT_PATH, metavar="PATH",
+                        help="Write per-stage wall/CPU time and peak allocations to PATH "
+                             "(default: %(const)s; also enabled by HW_HERO_PROFILE=1).")
+    parser.add_argument("--profile-cprofile", metavar="DIR",
+                        help="With --profile, also dump a cProfile <stage>.prof per stage into DIR.")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.profile or args.profile_cprofile:
+        stage_profiler.enable(cprofile_dir=args.profile_cprofile or stage_profiler.PROFILE_CPROFILE_DIR)
+    with llm_metrics.trace("main", correction_mode=args.correction_mode):
+        output_data = main(use_test_data=args.use_test_data, correction_mode=args.correction_mode,
+                           image_paths=args.images, tiled_ocr=args.tiled_ocr, document_id=args.document_id)
+    profiler = stage_profiler.active_profiler
+    if profiler is not None:
+        profiler.print_summary()
+        profiler.write_report(
+            args.profile or stage_profiler.PROFILE_REPORT_PATH,
+            images="test_data" if args.use_test_data else (args.images or [image_path]),
+            correction_mode=args.correction_mode,
+            sentences=len(output_data["sentences"]) if output_data else None,
+        )
+    if args.llm_stats:
+        llm_metrics.print_summary()
+        llm_metrics.dump(args.llm_stats)
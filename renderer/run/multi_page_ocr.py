@@ -0,0 +1,100 @@
+# multi_page_ocr.py
+
+import re
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+import llm_metrics
+from image_preprocessing import encode_image_data_url, encode_image_bands
+from openai_api_call import perform_ocr_url
+
+OCR_MAX_WORKERS = 4
+# Per-piece cap; a single page or band is much less text than a whole essay.
+PIECE_MAX_TOKENS = 1000
+PIECE_PROMPT = (
+    "Extract the handwritten text from the image below. "
+    "It may be part of a longer page: transcribe every line you can see, including partial lines "
+    "at the top and bottom, and nothing else. Separate paragraphs with a blank line."
+)
+
+# How far into each band to look for the repeated overlap, and the shortest run of
+# words that counts as a real overlap rather than a coincidence.
+OVERLAP_SEARCH_WORDS = 60
+MIN_OVERLAP_WORDS = 3
+
+SENTENCE_END = re.compile(r'[.!?]["\')\]]?\s*$')
+
+
+def _words(text):
+    """
+    Return (start, end, normalized word) for each word in text.
+    """
+    return [(m.start(), m.end(), re.sub(r'\W', '', m.group()).lower()) for m in re.finditer(r'\S+', text)]
+
+
+def merge_overlapping_text(previous, current, search_words=OVERLAP_SEARCH_WORDS, min_overlap=MIN_OVERLAP_WORDS):
+    """
+    Join the OCR text of two vertically overlapping bands, keeping the repeated lines once.
+    The longest run of words shared by the end of `previous` and the start of `current`
+    is taken as the overlap; the text is cut there so the lower band supplies the overlap
+    (a line cut in half at the bottom of the upper band is read whole by the lower band).
+    """
+    prev_words = _words(previous)[-search_words:]
+    curr_words = _words(current)[:search_words]
+    matcher = difflib.SequenceMatcher(None, [w[2] for w in prev_words], [w[2] for w in curr_words], autojunk=False)
+    match = matcher.find_longest_match(0, len(prev_words), 0, len(curr_words))
+    if match.size < min_overlap:
+        return join_pages(previous, current)
+    cut_previous = prev_words[match.a][0]
+    cut_current = curr_words[match.b][0]
+    return previous[:cut_previous] + current[cut_current:]
+
+
+def join_pages(previous, current):
+    """
+    Join the text of consecutive pages. A page that ends mid-sentence continues the
+    same paragraph on the next page; otherwise the pages are separate paragraphs.
+    """
+    previous, current = previous.rstrip(), current.lstrip()
+    if not previous:
+        return current
+    if SENTENCE_END.search(previous):
+        return previous + "\n\n" + current
+    return previous + " " + current
+
+
+def ocr_pages(image_paths, tile=False, max_workers=OCR_MAX_WORKERS):
+    """
+    OCR an ordered list of page images concurrently and return the stitched text.
+    With tile=True each page is split into overlapping bands (see image_preprocessing.encode_image_bands)
+    that are also OCR'd concurrently and merged with overlap de-duplication.
+    """
+    # One list of image URLs per page, in reading order.
+    if tile:
+        pages = [encode_image_bands(path) for path in image_paths]
+    else:
+        pages = [[encode_image_data_url(path)] for path in image_paths]
+
+    pieces = [url for page in pages for url in page]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        texts = list(executor.map(llm_metrics.bind_trace(
+            lambda url: perform_ocr_url(url, max_tokens=PIECE_MAX_TOKENS, prompt=PIECE_PROMPT)), pieces
+        ))
+
+    document = ""
+    position = 0
+    for page in pages:
+        page_texts = texts[position:position + len(page)]
+        position += len(page)
+        page_text = page_texts[0]
+        for band_text in page_texts[1:]:
+            page_text = merge_overlapping_text(page_text, band_text)
+        document = join_pages(document, page_text)
+    return document
+
+
+if __name__ == "__main__":
+    upper = "I like music. My favorite singer is\nBTS because their songs give me"
+    lower = "BTS because their songs give me hope.\n\nSecondly, it can make the culture"
+    print(merge_overlapping_text(upper, lower))
+    print("---")
+    print(join_pages("The end of page one is", "the start of page two."))
@@ -1,11 +1,17 @@
 import base64
-import openai
+import json
+import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import llm_client
+import llm_metrics
+from image_preprocessing import encode_image_data_url
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-# Function to encode the image
+# Function to encode the image (raw bytes; the API calls below use encode_image_data_url,
+# which downsamples and detects the real MIME type)
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
@@ -15,20 +21,25 @@ def perform_ocr(image_path):
     """
     Extract text from an image using OpenAI's GPT-4 vision capabilities.
     """
-    base64_image = encode_image(image_path)
+    return perform_ocr_url(encode_image_data_url(image_path))
 
-    response = openai.ChatCompletion.create(
+def perform_ocr_url(image_url, max_tokens=300, prompt="Extract the handwritten text from the image below."):
+    """
+    OCR an already-encoded image (data URL), e.g. one page or one band of a page.
+    """
+    response = llm_client.chat_completion(
         model="gpt-4o",  # Use the correct vision model
         messages=[
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": "Extract the handwritten text from the image below."},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}}
                 ]
             }
         ],
-        max_tokens=300
+        max_tokens=max_tokens,
+        step="OCR"
     )
     return response.choices[0].message["content"]
 
@@ -41,7 +52,7 @@ def correct_text(ocr_text):
         f"Correct the following text for grammar and naturalness:\n\n{ocr_text}"
     )
 
-    response = openai.ChatCompletion.create(
+    response = llm_client.chat_completion(
         model="gpt-4o",
         messages=[
             {
@@ -50,6 +61,221 @@ def correct_text(ocr_text):
             }
         ],
         temperature=0,
-        max_tokens=300
+        max_tokens=300,
+        step="CORRECTION"
     )
     return response.choices[0].message["content"]
+
+# --- Combined single-call OCR + correction ---
+
+# When True, ocr_and_correct asks the vision model for the transcription and the
+# corrected text in one structured response instead of two sequential round trips.
+USE_COMBINED_OCR_CORRECTION = os.getenv("HW_HERO_COMBINED_OCR", "0") == "1"
+
+def perform_ocr_and_correct(image_path):
+    """
+    Transcribe and correct the handwritten text in one call.
+    Returns (ocr_text, corrected_text).
+    """
+    image_url = encode_image_data_url(image_path)
+
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": (
+                        "Extract the handwritten text from the image below, then correct it for grammar and naturalness. "
+                        'Return JSON: {"transcription": "...", "corrected": "..."}. '
+                        "'transcription' must be verbatim, keeping the writer's mistakes. "
+                        "Keep paragraph breaks as blank lines in both."
+                    )},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }
+        ],
+        temperature=0,
+        max_tokens=1500,
+        response_format={"type": "json_object"},
+        step="OCR_CORRECTION"
+    )
+    data = json.loads(response.choices[0].message["content"])
+    return data.get("transcription", ""), data.get("corrected", "")
+
+def ocr_and_correct(image_path, combined=None):
+    """
+    Return (ocr_text, corrected_text), using one combined call or perform_ocr + correct_text
+    depending on USE_COMBINED_OCR_CORRECTION (or the explicit combined argument).
+    """
+    if combined is None:
+        combined = USE_COMBINED_OCR_CORRECTION
+    if combined:
+        return perform_ocr_and_correct(image_path)
+    ocr_text = perform_ocr(image_path)
+    return ocr_text, correct_text(ocr_text)
+
+# Correct Text as an edit list
+def correct_text_edits(ocr_sentences):
+    """
+    Ask for sentence-indexed edits instead of the whole corrected essay.
+    Returns the raw JSON text: {"edits": [{"sentence_index", "original", "replacement"}, ...]}.
+    The output is only as long as the corrections, so long essays aren't truncated.
+    """
+    numbered = "\n".join(f"[{i}] {sentence}" for i, sentence in enumerate(ocr_sentences))
+    prompt = (
+        "Correct the following sentences for grammar and naturalness. "
+        "Do not rewrite the text. Instead return JSON of the form "
+        '{"edits": [{"sentence_index": 0, "original": "...", "replacement": "..."}]}. '
+        "'original' must be copied exactly from that sentence and be as short as possible, "
+        "but never empty: for an insertion, include the neighbouring word in both 'original' and 'replacement'. "
+        "List edits in the order they appear. Sentences that need no change get no edits.\n\n"
+        f"{numbered}"
+    )
+
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=0,
+        max_tokens=2000,
+        response_format={"type": "json_object"},
+        step="EDIT_LIST"
+    )
+    return response.choices[0].message["content"]
+
+# --- Paragraph-chunked correction for long essays ---
+
+# How many paragraphs are corrected at once, and how many preceding paragraphs
+# are sent along (read-only) so each chunk keeps the essay's context.
+CHUNK_MAX_WORKERS = 4
+CHUNK_CONTEXT_PARAGRAPHS = 1
+
+def split_into_paragraphs(text):
+    """
+    Split text on blank lines, dropping empty paragraphs.
+    """
+    return [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+
+def correct_paragraph(paragraph, context=""):
+    """
+    Correct one paragraph. The context is shown to the model but must not be returned.
+    """
+    prompt = f"Correct the following text for grammar and naturalness:\n\n{paragraph}"
+    if context:
+        prompt = (
+            "The text below continues from this earlier part of the essay. "
+            "Use it only as context; do not correct it or include it in your answer.\n\n"
+            f"Earlier text:\n{context}\n\n"
+            "Return only the corrected version of the following text.\n\n" + prompt
+        )
+
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=0,
+        # Roughly 4 characters per token; leave room for the rewrite to grow.
+        max_tokens=max(300, len(paragraph) // 2),
+        step="PARAGRAPH_CORRECTION"
+    )
+    return response.choices[0].message["content"].strip()
+
+def correct_text_chunked(ocr_text, max_workers=CHUNK_MAX_WORKERS, context_paragraphs=CHUNK_CONTEXT_PARAGRAPHS):
+    """
+    Correct each paragraph concurrently (at most max_workers requests in flight)
+    and stitch the results back together in order, separated by blank lines,
+    so align_sentences sees the same shape of text as with correct_text.
+    """
+    paragraphs = split_into_paragraphs(ocr_text)
+    if len(paragraphs) <= 1:
+        return correct_text(ocr_text)
+
+    contexts = [
+        "\n\n".join(paragraphs[max(0, i - context_paragraphs):i])
+        for i in range(len(paragraphs))
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        corrected = list(executor.map(llm_metrics.bind_trace(correct_paragraph), paragraphs, contexts))
+    return "\n\n".join(corrected)
+
+# --- Pipelined OCR -> correction ---
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+# Room for a whole handwritten page (as PIECE_MAX_TOKENS in multi_page_ocr); the stream feeds
+# every paragraph to correction, so a cut-off transcription silently drops the essay's end.
+OCR_STREAM_MAX_TOKENS = int(os.getenv("HW_HERO_OCR_STREAM_MAX_TOKENS", "1500"))
+
+def perform_ocr_stream(image_path, max_tokens=OCR_STREAM_MAX_TOKENS):
+    """
+    Streaming version of perform_ocr: yields the transcription in pieces as the model produces it.
+    """
+    image_url = encode_image_data_url(image_path)
+
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Extract the handwritten text from the image below. Separate paragraphs with a blank line."},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }
+        ],
+        max_tokens=max_tokens,
+        stream=True,
+        step="OCR_STREAM"
+    )
+    for chunk in response:
+        delta = chunk.choices[0].delta.get("content")
+        if delta:
+            yield delta
+
+def iter_completed_paragraphs(text_pieces):
+    """
+    Yield each paragraph as soon as the blank line after it arrives; the last one at end of stream.
+    """
+    buffer = ""
+    for piece in text_pieces:
+        buffer += piece
+        parts = PARAGRAPH_BREAK.split(buffer)
+        # Everything but the last part is followed by a paragraph break, so it's complete.
+        for paragraph in parts[:-1]:
+            if paragraph.strip():
+                yield paragraph.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+def ocr_and_correct_pipelined(image_path, max_workers=CHUNK_MAX_WORKERS, context_paragraphs=CHUNK_CONTEXT_PARAGRAPHS):
+    """
+    Stream OCR and send each completed paragraph to correction while the transcription continues.
+    Yields (ocr_paragraph, corrected_paragraph) pairs in document order, as early as possible.
+    """
+    return _pipeline_paragraphs(iter_completed_paragraphs(perform_ocr_stream(image_path)),
+                                max_workers, context_paragraphs)
+
+def _pipeline_paragraphs(paragraphs, max_workers, context_paragraphs):
+    seen = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for paragraph in paragraphs:
+            context = "\n\n".join(seen[max(0, len(seen) - context_paragraphs):])
+            seen.append(paragraph)
+            pending.append((paragraph, executor.submit(llm_metrics.bind_trace(correct_paragraph), paragraph, context)))
+            # Hand back finished corrections without waiting, keeping document order.
+            while pending and pending[0][1].done():
+                ocr_paragraph, future = pending.popleft()
+                yield ocr_paragraph, future.result()
+        while pending:
+            ocr_paragraph, future = pending.popleft()
+            yield ocr_paragraph, future.result()
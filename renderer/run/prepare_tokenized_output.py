@@ -2,6 +2,8 @@ import json
 import pickle
 import re
 
+from sentence_index import write_indexed_json
+
 def replace_double_quotes_in_tokens(tokens):
     """
     Replace double quotes used as apostrophes with single quotes in a list of tokens.
@@ -194,10 +196,11 @@ def extend_final_tokens(final_tokens, up_to_index):
             final_tokens.append({"index": idx, "char": " ", "type": "equal"})
     return final_tokens
 
-def prepare_json_output(replacement_ann_blocks_all, replacement_fin_blocks_all, insert_blocks_all, delete_blocks_all, final_sentences, annotated_lines):
+def prepare_json_output(replacement_ann_blocks_all, replacement_fin_blocks_all, insert_blocks_all, delete_blocks_all, final_sentences, annotated_lines, sentence_index_offset=0):
     """
     Return final JSON structure with container_length and embed block metadata directly
     into both the final sentence tokens and the annotated tokens.
+    sentence_index_offset shifts the sentence indices (used when a document is built in parts).
     """
     sentences_data = []
     for sentence_index in range(len(final_sentences)):
@@ -272,7 +275,7 @@ def prepare_json_output(replacement_ann_blocks_all, replacement_fin_blocks_all,
                                                          end_key="annotated_end")
         
         sentences_data.append({
-            "sentence_index": sentence_index,
+            "sentence_index": sentence_index + sentence_index_offset,
             "final_sentence_tokens": final_sentence,
             "annotated_tokens": annotated_tokens,
             "replacement_blocks": replacement_blocks,
@@ -327,7 +330,7 @@ if __name__ == "__main__":
         annotated_lines
     )
     
-    with open("output.json", "w") as f:
-        json.dump(output_data, f, indent=4)
+    # Same bytes as json.dump(indent=4), plus output.json.idx for per-sentence reads
+    write_indexed_json(output_data, "output.json")
     
     print("\n[INFO] Wrote output.json successfully")
\ No newline at end of file
@@ -106,7 +106,7 @@ def save_renderer_output(annotated_lines, final_sentences, blocks_by_sentence):
             "blocks_by_sentence": blocks_by_sentence
         }, f)
 
-def process_sentences(final_tokens_by_sentence, blocks_by_sentence):
+def process_sentences(final_tokens_by_sentence, blocks_by_sentence, save_output=True):
     sentence_count = 1
     all_annotated_lines = []
     all_final_sentences = []
@@ -133,7 +133,8 @@ def process_sentences(final_tokens_by_sentence, blocks_by_sentence):
         sentence_count += 1
 
     # Cache the outputs for post-processing
-    save_renderer_output(all_annotated_lines, all_final_sentences, all_blocks)
+    if save_output:
+        save_renderer_output(all_annotated_lines, all_final_sentences, all_blocks)
 
     print("All sentences processed and cached.")
     return all_annotated_lines, all_final_sentences
@@ -0,0 +1,224 @@
+# sentence_index.py
+#
+# Random access into output.json and sentence_mapping.json without parsing them whole.
+#
+# write_indexed_json() writes {"sentences": [...]} exactly as json.dump(data, f, indent=4)
+# would, and next to it a sidecar "<path>.idx" holding the byte offset and length of each
+# sentence record. read_record() mmaps both files and decodes only the requested record,
+# so a click costs O(sentence) I/O however long the document is.
+#
+# Sidecar layout (little-endian):
+#     header:  magic b"HWSIDX01", data file size, data file mtime_ns, record count   (<8sQqQ)
+#     records: sentence_index, offset, length, one per sentence in file order          (<QQQ)
+# The size and mtime tie the sidecar to one version of the data file; if the data file
+# was rewritten by something else (an older main.py, a text editor) the index is stale and
+# readers raise IndexUnavailable so callers fall back to a full parse.
+
+import json
+import mmap
+import os
+import struct
+import threading
+
+INDEX_SUFFIX = ".idx"
+MAGIC = b"HWSIDX01"
+HEADER = struct.Struct("<8sQqQ")
+RECORD = struct.Struct("<QQQ")
+INDENT = 4
+
+
+class IndexUnavailable(Exception):
+    """
+    There is no usable sidecar index for the data file (missing, stale or corrupt).
+    """
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def write_indexed_json(data, path, ensure_ascii=True):
+    """
+    Write data to path as json.dump(data, f, indent=4, ensure_ascii=...) does, plus the
+    sidecar index of its "sentences" records. Returns [(sentence_index, offset, length)].
+    Anything but a non-empty "sentences" list is written without an index.
+
+    Both files are written to temporaries and renamed into place, so a reader that has the
+    previous version mmapped keeps a consistent (old) view instead of a truncated file.
+    """
+    tmp_path = path + ".tmp"
+    records = []
+    if list(data) != ["sentences"] or not data["sentences"]:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=INDENT, ensure_ascii=ensure_ascii)
+        os.replace(tmp_path, path)
+        _remove(index_path(path))
+        return records
+
+    # json.dump nests each record two levels deep: indent every line of it by 8 spaces.
+    record_indent = " " * (2 * INDENT)
+    head = ("{\n" + " " * INDENT + '"sentences": [\n').encode("utf-8")
+    separator = b",\n"
+    with open(tmp_path, "wb") as f:
+        f.write(head)
+        offset = len(head)
+        for position, entry in enumerate(data["sentences"]):
+            if position:
+                f.write(separator)
+                offset += len(separator)
+            encoded = (record_indent + json.dumps(entry, indent=INDENT, ensure_ascii=ensure_ascii)
+                       .replace("\n", "\n" + record_indent)).encode("utf-8")
+            f.write(encoded)
+            records.append((entry.get("sentence_index", position), offset, len(encoded)))
+            offset += len(encoded)
+        f.write(("\n" + " " * INDENT + "]\n}").encode("utf-8"))
+    # The index records the temporary's size and mtime, which the rename keeps. Until the
+    # index is renamed too, readers see a stale index and fall back to parsing the file.
+    index_tmp_path = write_index(tmp_path, records, index_path(path) + ".tmp")
+    os.replace(tmp_path, path)
+    os.replace(index_tmp_path, index_path(path))
+    return records
+
+
+def write_index(path, records, destination=None):
+    """
+    Write the sidecar for the complete data file at path (to destination, default <path>.idx).
+    Returns the sidecar path.
+    """
+    destination = destination or index_path(path)
+    stat = os.stat(path)
+    with open(destination, "wb") as f:
+        f.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return destination
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class IndexedJsonReader:
+    """
+    mmap view of one data file and its sidecar. Reopens both when the data file changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+        self._index = None
+        self._count = 0
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            raise IndexUnavailable(f"{self.path} does not exist")
+        with f:
+            # fstat the open file, so the version checked is the version mapped.
+            stat = os.fstat(f.fileno())
+            version = (stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                if version == self._version:
+                    return self._data, self._index, self._count
+                try:
+                    with open(index_path(self.path), "rb") as index_file:
+                        index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (FileNotFoundError, ValueError):  # ValueError: empty file
+                    raise IndexUnavailable(f"No index for {self.path}")
+                if len(index) < HEADER.size:
+                    raise IndexUnavailable(f"Corrupt index for {self.path}")
+                magic, size, mtime_ns, count = HEADER.unpack_from(index, 0)
+                if magic != MAGIC or (size, mtime_ns) != version or len(index) != HEADER.size + count * RECORD.size:
+                    raise IndexUnavailable(f"Stale index for {self.path}")
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._version, self._data, self._index, self._count = version, data, index, count
+                return data, index, count
+
+    def records(self):
+        """
+        Return [(sentence_index, offset, length)] in file order.
+        """
+        _, index, count = self._open()
+        return [RECORD.unpack_from(index, HEADER.size + i * RECORD.size) for i in range(count)]
+
+    def _decode(self, data, offset, length):
+        return json.loads(data[offset:offset + length])
+
+    def get(self, sentence_index):
+        """
+        Decode the record for sentence_index, or return None if there is none.
+        """
+        data, index, count = self._open()
+        # Sentence indices normally equal file positions; otherwise binary search (records are sorted).
+        low, high = 0, count
+        if 0 <= sentence_index < count:
+            found, offset, length = RECORD.unpack_from(index, HEADER.size + sentence_index * RECORD.size)
+            if found == sentence_index:
+                return self._decode(data, offset, length)
+        while low < high:
+            middle = (low + high) // 2
+            found, offset, length = RECORD.unpack_from(index, HEADER.size + middle * RECORD.size)
+            if found == sentence_index:
+                return self._decode(data, offset, length)
+            if found < sentence_index:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_range(self, start, count):
+        """
+        Decode the records at file positions start..start+count-1. Returns (records, total count).
+        """
+        data, index, total = self._open()
+        records = []
+        for position in range(max(0, start), min(total, start + count)):
+            _, offset, length = RECORD.unpack_from(index, HEADER.size + position * RECORD.size)
+            records.append(self._decode(data, offset, length))
+        return records, total
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(path):
+    """
+    Return the shared reader for path (one mmap per file per process).
+    """
+    path = os.path.abspath(path)
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None:
+            reader = _readers[path] = IndexedJsonReader(path)
+        return reader
+
+
+def read_record(path, sentence_index):
+    """
+    Decode one sentence record from path via its sidecar index (None if absent).
+    Raises IndexUnavailable when there is no up-to-date index.
+    """
+    return get_reader(path).get(sentence_index)
+
+
+if __name__ == "__main__":
+    import sys
+    # Build the sidecar for an existing file: python sentence_index.py output.json [sentence_index]
+    path = sys.argv[1]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with open(path, "rb") as f:
+        original = f.read()
+    ensure_ascii = original.isascii()
+    if json.dumps(data, indent=INDENT, ensure_ascii=ensure_ascii).encode("utf-8") != original:
+        print(f"{path} is not in json.dump(indent={INDENT}) form; rewriting it")
+    records = write_indexed_json(data, path, ensure_ascii=ensure_ascii)
+    print(f"Indexed {len(records)} records into {index_path(path)}")
+    if len(sys.argv) > 2:
+        print(json.dumps(read_record(path, int(sys.argv[2])), indent=INDENT, ensure_ascii=False))
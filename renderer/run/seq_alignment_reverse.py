@@ -115,6 +115,12 @@ def align_sentences(ocr_text, corrected_text):
     """
     ocr_sentences = split_into_sentences(ocr_text)
     corrected_sentences = split_into_sentences(corrected_text)
+    return align_split_sentences(ocr_sentences, corrected_sentences)
+
+def align_split_sentences(ocr_sentences, corrected_sentences):
+    """
+    align_sentences for texts already split with split_into_sentences.
+    """
     print("Corrected Text Sentences:", corrected_sentences)
     matches = find_best_matches_simplified(ocr_sentences, corrected_sentences, min_score=50)
     return matches
@@ -144,12 +150,13 @@ def clean_aligned_pairs(aligned_pairs, marker=COMBINATION_MARKER):
     return cleaned_pairs
 
 # --- New Function 2: Create Sentence Mapping ---
-def create_sentence_mapping(aligned_pairs):
+def create_sentence_mapping(aligned_pairs, start_index=0):
     """
     Creates a mapping of sentence indexes to OCR and corrected sentences.
     
     Args:
         aligned_pairs (list[tuple[str, str]]): List of tuples (ocr_sentence, corrected_sentence).
+        start_index (int): Index of the first sentence (used when a document is built in parts).
     
     Returns:
         dict: Mapping dictionary in the form:
@@ -161,7 +168,7 @@ def create_sentence_mapping(aligned_pairs):
               }
     """
     mapping = {"sentences": []}
-    for idx, (ocr_sentence, corrected_sentence) in enumerate(aligned_pairs):
+    for idx, (ocr_sentence, corrected_sentence) in enumerate(aligned_pairs, start=start_index):
         mapping["sentences"].append({
             "sentence_index": idx,
             "ocr_sentence": ocr_sentence,
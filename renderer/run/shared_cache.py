@@ -0,0 +1,421 @@
+# shared_cache.py
+#
+# Cache shared by all gunicorn workers on one host.
+#
+# Values are strings (callers store JSON text) under (namespace, key). Every entry also
+# has a scope, e.g. the document it was derived from, so one call can invalidate all
+# entries of a document.
+#
+# TieredCache puts a small in-process LRU in front of a SQLite table (WAL mode) that
+# every worker process opens. A hit in another worker's answer costs one indexed
+# SQLite read instead of a recomputation (or an LLM call), so the hit rate does not
+# drop as workers are added.
+#
+# Invalidation is written to a log table. Each process replays new log rows into its
+# LRU before reading it, so an entry invalidated by one worker (or by main.py saving a
+# document) disappears from all of them.
+#
+# Eviction is least-recently-used within a byte budget, in both tiers.
+#
+# HW_HERO_CACHE selects the backend: "tiered" (default), "local" (LRU only), "shared"
+# (SQLite only) or "off".
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+DB_PATH = os.getenv("HW_HERO_CACHE_DB") or os.getenv(
+    "HW_HERO_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents.db"))
+BACKEND = os.getenv("HW_HERO_CACHE", "tiered")
+LOCAL_MAX_BYTES = int(os.getenv("HW_HERO_CACHE_LOCAL_BYTES", str(64 * 1024 * 1024)))
+SHARED_MAX_BYTES = int(os.getenv("HW_HERO_CACHE_SHARED_BYTES", str(256 * 1024 * 1024)))
+# How long another process's invalidation may go unseen by this process's LRU. 0 checks
+# the log on every read (one indexed query, about 5 us).
+SYNC_SECONDS = float(os.getenv("HW_HERO_CACHE_SYNC_SECONDS", "0"))
+# Invalidation log rows kept; a process that falls further behind clears its LRU.
+INVALIDATION_LOG_ROWS = 10000
+# A shared hit refreshes the entry's LRU timestamp at most this often (it is a write).
+TOUCH_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_scope ON cache_entries (namespace, scope);
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    scope TEXT
+);
+"""
+
+
+# SQLite connections must not be used across a fork (a preloaded gunicorn master forks
+# its workers). Registered owners close the forking thread's connection first; the child
+# opens its own on first use.
+_fork_closers = weakref.WeakSet()
+
+
+def close_before_fork(owner):
+    """
+    Register owner, whose close() closes the calling thread's connection.
+    """
+    _fork_closers.add(owner)
+
+
+def _close_for_fork():
+    for owner in list(_fork_closers):
+        owner.close()
+
+
+os.register_at_fork(before=_close_for_fork)
+
+
+class Cache:
+    """
+    The interface. scope=None in invalidate() means the whole namespace.
+
+    set() takes an optional token from token(), taken before the value was computed: if
+    the entry's namespace and scope were invalidated since, the (possibly stale) value is
+    not stored. set() returns whether it stored the value.
+    """
+    def get(self, namespace, key):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, scope="", since=None):
+        raise NotImplementedError
+
+    def invalidate(self, namespace, scope=None):
+        raise NotImplementedError
+
+    def token(self):
+        return None
+
+    def stats(self):
+        return {}
+
+    def get_or_compute(self, namespace, key, compute, scope=""):
+        """
+        Return the cached value, or compute() it and cache it. None is returned, not cached.
+        """
+        value = self.get(namespace, key)
+        if value is None:
+            token = self.token()
+            value = compute()
+            if value is not None:
+                self.set(namespace, key, value, scope, since=token)
+        return value
+
+
+class NullCache(Cache):
+    def get(self, namespace, key):
+        return None
+
+    def set(self, namespace, key, value, scope="", since=None):
+        return False
+
+    def invalidate(self, namespace, scope=None):
+        pass
+
+
+class LRUCache(Cache):
+    """
+    In-process tier. Evicts least recently used entries beyond max_bytes (counted in
+    characters); a value larger than max_bytes is not stored.
+    """
+    def __init__(self, max_bytes=LOCAL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (namespace, key) -> (value, scope)
+        self._bytes = 0
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return entry[0]
+
+    def set(self, namespace, key, value, scope="", since=None):
+        with self._lock:
+            self._discard((namespace, key))
+            if len(value) > self.max_bytes or (since is not None and since != self._generation):
+                return False
+            self._entries[(namespace, key)] = (value, scope)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+            return (namespace, key) in self._entries
+
+    def _discard(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def invalidate(self, namespace, scope=None):
+        with self._lock:
+            self._generation += 1
+            for entry_key in [k for k, (_, s) in self._entries.items()
+                              if k[0] == namespace and (scope is None or s == scope)]:
+                self._discard(entry_key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def token(self):
+        return self._generation
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SQLiteCache(Cache):
+    """
+    Shared tier: one table that every process on the host opens. Thread-safe like
+    DocumentStore (a connection per thread); WAL lets workers read while one writes.
+    """
+    def __init__(self, path=DB_PATH, max_bytes=SHARED_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.hits = self.misses = self.evictions = 0
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+        close_before_fork(self)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get_entry(self, namespace, key):
+        """
+        Return (value, scope), or None.
+        """
+        conn = self.connection()
+        row = conn.execute("SELECT value, scope, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                           (namespace, key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[2] > TOUCH_SECONDS:
+            with conn:
+                conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                             (now, namespace, key))
+        return row[0], row[1]
+
+    def get(self, namespace, key):
+        entry = self.get_entry(namespace, key)
+        return entry[0] if entry else None
+
+    def set(self, namespace, key, value, scope="", since=None):
+        """
+        Returns the invalidation log position the value was stored at (None if not stored).
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return None
+        conn = self.connection()
+        with conn:
+            # IMMEDIATE: no invalidation can be logged between the check and the insert.
+            conn.execute("BEGIN IMMEDIATE")
+            position = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()[0]
+            if since is not None and conn.execute(
+                "SELECT 1 FROM cache_invalidations WHERE id > ? AND namespace = ? AND (scope IS NULL OR scope = ?)",
+                (since, namespace, scope),
+            ).fetchone():
+                return None
+            conn.execute("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                         (namespace, key, scope, value, size, time.time()))
+            excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0] - self.max_bytes
+            if excess > 0:
+                self._evict(conn, excess)
+        return position
+
+    def _evict(self, conn, excess):
+        victims = []
+        for rowid, size in conn.execute("SELECT rowid, size FROM cache_entries ORDER BY accessed_at"):
+            victims.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM cache_entries WHERE rowid = ?", victims)
+        self.evictions += len(victims)
+
+    def invalidate(self, namespace, scope=None):
+        with self.connection() as conn:
+            if scope is None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            else:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND scope = ?", (namespace, scope))
+            cursor = conn.execute("INSERT INTO cache_invalidations (namespace, scope) VALUES (?, ?)",
+                                  (namespace, scope))
+            conn.execute("DELETE FROM cache_invalidations WHERE id <= ?", (cursor.lastrowid - INVALIDATION_LOG_ROWS,))
+            return cursor.lastrowid
+
+    def invalidations_since(self, last_id):
+        """
+        Return [(id, namespace, scope)] logged after last_id, and whether the log still
+        reaches back to last_id (False: older rows were pruned and some may be missing).
+        """
+        rows = self.connection().execute(
+            "SELECT id, namespace, scope FROM cache_invalidations WHERE id > ? ORDER BY id", (last_id,)
+        ).fetchall()
+        return rows, not rows or rows[0][0] == last_id + 1
+
+    def token(self):
+        """
+        The last invalidation log id.
+        """
+        row = self.connection().execute("SELECT MAX(id) FROM cache_invalidations").fetchone()
+        return row[0] or 0
+
+    def stats(self):
+        entries, size = self.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class TieredCache(Cache):
+    """
+    LRUCache in front of SQLiteCache. Reads try the LRU, then SQLite (and copy the entry
+    into the LRU); writes and invalidations go to both, and other processes' invalidations
+    are replayed into the LRU before it is read.
+    """
+    def __init__(self, local, shared, sync_seconds=SYNC_SECONDS):
+        self.local = local
+        self.shared = shared
+        self.sync_seconds = sync_seconds
+        self._sync_lock = threading.Lock()
+        self._synced_at = time.monotonic()
+        self._last_invalidation = shared.token()
+
+    def sync(self, force=False):
+        """
+        Apply invalidations logged (by any process) since the last sync to the LRU.
+        """
+        with self._sync_lock:
+            now = time.monotonic()
+            if not force and now - self._synced_at < self.sync_seconds:
+                return
+            self._synced_at = now
+            rows, complete = self.shared.invalidations_since(self._last_invalidation)
+            if not complete:
+                print("[INFO] Cache invalidation log was pruned past this process; clearing its LRU")
+                self.local.clear()
+            for row_id, namespace, scope in rows:
+                if complete:
+                    self.local.invalidate(namespace, scope)
+                self._last_invalidation = row_id
+
+    def get(self, namespace, key):
+        self.sync()
+        value = self.local.get(namespace, key)
+        if value is None:
+            replayed = self._last_invalidation
+            entry = self.shared.get_entry(namespace, key)
+            if entry is None:
+                return None
+            value, scope = entry
+            self._set_local(namespace, key, value, scope, replayed)
+        return value
+
+    def _set_local(self, namespace, key, value, scope, position):
+        # Only if no invalidation after position has been replayed meanwhile: it may have
+        # come after the value was read, and would not be replayed again.
+        with self._sync_lock:
+            if self._last_invalidation <= position:
+                self.local.set(namespace, key, value, scope)
+
+    def set(self, namespace, key, value, scope="", since=None):
+        position = self.shared.set(namespace, key, value, scope, since)
+        if position is None:
+            return False
+        self._set_local(namespace, key, value, scope, position)
+        return True
+
+    def token(self):
+        return self.shared.token()
+
+    def invalidate(self, namespace, scope=None):
+        self.shared.invalidate(namespace, scope)
+        # Our own log row is replayed by the next sync too; dropping now keeps this process exact.
+        self.local.invalidate(namespace, scope)
+
+    def stats(self):
+        return {"local": self.local.stats(), "shared": self.shared.stats()}
+
+
+def make_cache(path=DB_PATH, backend=BACKEND):
+    """
+    Build a cache of the given backend ("tiered", "local", "shared" or "off") at path.
+    """
+    if backend == "off":
+        return NullCache()
+    if backend == "local":
+        return LRUCache()
+    if backend == "shared":
+        return SQLiteCache(path)
+    if backend == "tiered":
+        return TieredCache(LRUCache(), SQLiteCache(path))
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path=None):
+    """
+    Return the process-wide cache for path (default DB_PATH), created on first use.
+    """
+    path = os.path.abspath(path or DB_PATH)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = make_cache(path)
+        return cache
+
+
+def get_stats():
+    """
+    Stats of every cache this process has built, by path.
+    """
+    with _caches_lock:
+        caches = dict(_caches)
+    return {path: cache.stats() for path, cache in caches.items()}
@@ -0,0 +1,180 @@
+# stage_profiler.py
+#
+# Wall time, CPU time and peak Python allocations (tracemalloc) for each stage of the
+# render pipeline in main.py, written as one JSON report per document. Optionally
+# keeps a cProfile per stage. Off unless enabled (HW_HERO_PROFILE=1 or main.py --profile);
+# when off, stage() costs one attribute check and one context variable lookup.
+#
+# observe(callback) also reports stage boundaries to a callback for the current context
+# (the job queue uses it for per-stage progress), with or without profiling.
+
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+PROFILE_ENABLED = os.getenv("HW_HERO_PROFILE", "0") == "1"
+PROFILE_REPORT_PATH = os.getenv("HW_HERO_PROFILE_REPORT", "profile_report.json")
+PROFILE_CPROFILE_DIR = os.getenv("HW_HERO_PROFILE_CPROFILE")  # e.g. "profiles/"; unset = no cProfile
+# tracemalloc roughly doubles the run time of allocation-heavy stages; wall/CPU times
+# are only comparable between runs made with the same setting.
+PROFILE_MEMORY = os.getenv("HW_HERO_PROFILE_MEMORY", "1") == "1"
+
+
+class StageProfiler:
+    """
+    Accumulates per-stage measurements. A stage entered several times (e.g. render stages
+    in pipelined mode, once per paragraph) is summed; its peak is the largest seen.
+    """
+    def __init__(self, trace_memory=PROFILE_MEMORY, cprofile_dir=PROFILE_CPROFILE_DIR):
+        self.trace_memory = trace_memory
+        self.cprofile_dir = cprofile_dir
+        self.stages = {}
+        self.profiles = {}
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        profile = None
+        if self.cprofile_dir:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            entry = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_alloc_bytes": None})
+            entry["calls"] += 1
+            entry["wall_s"] += wall
+            entry["cpu_s"] += cpu
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                entry["peak_alloc_bytes"] = max(entry["peak_alloc_bytes"] or 0, peak)
+
+    def report(self, **document):
+        """
+        Return the per-document report: the document fields passed in, totals and per-stage numbers.
+        """
+        total_wall = time.perf_counter() - self.start_wall
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(
+                entry,
+                wall_s=round(entry["wall_s"], 6),
+                cpu_s=round(entry["cpu_s"], 6),
+                share_of_wall=round(entry["wall_s"] / total_wall, 4) if total_wall else None,
+            )
+        return {
+            "document": document,
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "memory_traced": self.trace_memory,
+            "total": {"wall_s": round(total_wall, 6), "cpu_s": round(time.process_time() - self.start_cpu, 6)},
+            "stages": stages,
+        }
+
+    def write_report(self, path=PROFILE_REPORT_PATH, **document):
+        """
+        Write the report as JSON (and one <stage>.prof per stage if cProfile is on).
+        """
+        report = self.report(**document)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        if self.cprofile_dir:
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            for name, profile in self.profiles.items():
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{name}.prof"))
+        print(f"[INFO] Stage profile written to {path}")
+        return report
+
+    def print_summary(self):
+        print(f"\n{'stage':<18}{'calls':>6}{'wall s':>10}{'cpu s':>10}{'peak KiB':>11}")
+        for name, entry in self.stages.items():
+            peak = entry["peak_alloc_bytes"]
+            peak_text = f"{peak / 1024:>11.1f}" if peak is not None else f"{'-':>11}"
+            print(f"{name:<18}{entry['calls']:>6}{entry['wall_s']:>10.4f}{entry['cpu_s']:>10.4f}{peak_text}")
+
+    def close(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# The profiler for the current run, or None when profiling is off.
+active_profiler = None
+
+
+def enable(**options):
+    """
+    Start profiling stages (replaces any previous profiler) and return the profiler.
+    """
+    global active_profiler
+    if active_profiler is not None:
+        active_profiler.close()
+    active_profiler = StageProfiler(**options)
+    return active_profiler
+
+
+def disable():
+    global active_profiler
+    if active_profiler is not None:
+        active_profiler.close()
+    active_profiler = None
+
+
+# callback(stage_name, event) for stages entered in the current context; event is "start" or "end".
+_stage_observer = contextvars.ContextVar("stage_observer", default=None)
+
+
+@contextlib.contextmanager
+def observe(callback):
+    """
+    Report every stage entered inside this block (in this thread/context) to callback.
+    """
+    token = _stage_observer.set(callback)
+    try:
+        yield
+    finally:
+        _stage_observer.reset(token)
+
+
+@contextlib.contextmanager
+def _observed_stage(name, observer):
+    observer(name, "start")
+    try:
+        if active_profiler is None:
+            yield
+        else:
+            with active_profiler.stage(name):
+                yield
+    finally:
+        observer(name, "end")
+
+
+def stage(name):
+    """
+    Context manager timing one pipeline stage on the active profiler (a no-op when off).
+    """
+    observer = _stage_observer.get()
+    if observer is not None:
+        return _observed_stage(name, observer)
+    if active_profiler is None:
+        return contextlib.nullcontext()
+    return active_profiler.stage(name)
+
+
+if PROFILE_ENABLED:
+    enable()
@@ -0,0 +1,166 @@
+"""
+Scaling benchmark for the CPU side of the pipeline, from split_into_sentences to
+prepare_json_output and the custom sentences, on synthetic essays (see synthetic_essays.py). No API calls.
+
+Usage:
+    python benchmark_pipeline.py [--sizes 10 100 1000 10000] [--error-rate 1.0] [--seed 0]
+                                 [--repeat 3] [--csv PATH] [--memory]
+                                 [--save-baseline | --check [--tolerance 0.25]]
+
+Each size is timed per stage with stage_profiler (the best of --repeat runs) and printed
+as seconds per stage and sentences per second, i.e. the throughput curve.
+--save-baseline records the results in benchmark_baselines.json; --check compares
+against it and exits with status 1 if the total or any sizeable stage got slower than
+--tolerance allows. Baselines are machine-specific: record and check on the same box.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+
+# Ahead of this directory, which has its own (older) openai_api_call.py.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'run')))
+
+import main as pipeline
+import stage_profiler
+from custom_sentence import materialize_custom_sentences
+from seq_alignment_reverse import create_sentence_mapping
+from synthetic_essays import generate_essay
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+STAGES = ["split", "align", "diff", "blocks", "render", "cleanup", "overhang", "block_detection", "json",
+          "custom_sentences"]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+# Stages faster than this in the baseline are too noisy to flag on their own.
+MIN_CHECK_SECONDS = 0.02
+
+
+def run_pipeline(learner_text, corrected_text, trace_memory=False):
+    """
+    Run the CPU stages once and return the stage_profiler report.
+    """
+    profiler = stage_profiler.enable(trace_memory=trace_memory, cprofile_dir=None)
+    try:
+        # The pipeline prints every sentence; the renderer_output.pkl debug dump is not part of a request.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            matches, cleaned_pairs, report, tokenized_output = pipeline.align_and_diff(learner_text, corrected_text)
+            with stage_profiler.stage("align"):
+                sentence_mapping = create_sentence_mapping(cleaned_pairs)
+            output_data = pipeline.render_document(tokenized_output, save_debug_output=False)
+            with stage_profiler.stage("custom_sentences"):
+                materialize_custom_sentences(output_data, sentence_mapping)
+        return profiler.report(sentences=len(output_data["sentences"]))
+    finally:
+        stage_profiler.disable()
+
+
+def benchmark_size(size, error_rate, seed, repeat, trace_memory):
+    learner_text, corrected_text = generate_essay(size, error_rate=error_rate, seed=seed)
+    best = None
+    for _ in range(repeat):
+        report = run_pipeline(learner_text, corrected_text, trace_memory)
+        stages = {name: report["stages"].get(name, {}).get("wall_s", 0.0) for name in STAGES}
+        stages["total"] = sum(stages.values())
+        if best is None or stages["total"] < best["stages"]["total"]:
+            best = {"sentences": report["document"]["sentences"], "stages": stages}
+            if trace_memory:
+                best["peak_alloc_bytes"] = {name: report["stages"].get(name, {}).get("peak_alloc_bytes")
+                                            for name in STAGES}
+    return best
+
+
+def print_results(results):
+    print(f"\n{'size':>7}{'sents':>7}" + "".join(f"{name[:9]:>10}" for name in STAGES) + f"{'total s':>10}{'sent/s':>10}")
+    for size, result in results.items():
+        stages = result["stages"]
+        throughput = result["sentences"] / stages["total"] if stages["total"] else float("inf")
+        print(f"{size:>7}{result['sentences']:>7}" + "".join(f"{stages[name]:>10.4f}" for name in STAGES)
+              + f"{stages['total']:>10.4f}{throughput:>10.0f}")
+
+
+def write_csv(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("size,sentences," + ",".join(STAGES) + ",total,sentences_per_second\n")
+        for size, result in results.items():
+            stages = result["stages"]
+            f.write(f"{size},{result['sentences']}," + ",".join(f"{stages[name]:.6f}" for name in STAGES)
+                    + f",{stages['total']:.6f},{result['sentences'] / stages['total']:.1f}\n")
+    print(f"Throughput curve written to {path}")
+
+
+def check_against_baseline(results, baseline, tolerance):
+    """
+    Return a list of regression messages (empty if none).
+    """
+    regressions = []
+    for size, result in results.items():
+        base = baseline["results"].get(str(size))
+        if base is None:
+            continue
+        for name in STAGES + ["total"]:
+            if name not in base["stages"]:
+                continue  # Stage added after the baseline was recorded
+            before, after = base["stages"][name], result["stages"][name]
+            if name != "total" and before < MIN_CHECK_SECONDS:
+                continue
+            if after > before * (1 + tolerance):
+                regressions.append(f"size {size}: {name} {before:.4f}s -> {after:.4f}s (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--error-rate", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--csv", metavar="PATH")
+    parser.add_argument("--memory", action="store_true", help="Also record tracemalloc peaks (slows the run).")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--save-baseline", action="store_true")
+    group.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for size in args.sizes:
+                print(f"Benchmarking {size} sentences...")
+                results[size] = benchmark_size(size, args.error_rate, args.seed, args.repeat, args.memory)
+        finally:
+            os.chdir(cwd)
+
+    print_results(results)
+    if args.csv:
+        write_csv(results, args.csv)
+
+    if args.save_baseline:
+        baseline = {
+            "meta": {"python": sys.version.split()[0], "error_rate": args.error_rate,
+                     "seed": args.seed, "repeat": args.repeat},
+            "results": {str(size): result for size, result in results.items()},
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline["meta"]["error_rate"], baseline["meta"]["seed"]) != (args.error_rate, args.seed):
+            print("[WARN] Baseline was recorded with a different workload (error rate / seed)")
+        regressions = check_against_baseline(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"[REGRESSION] {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Per-worker memory and boot time of the web app under gunicorn, without and with
+preloading (see app/gunicorn.conf.py). No API calls.
+
+Usage:
+    python benchmark_preload.py [--workers 4] [--app app:app] [--worker-class sync] [--requests 400]
+                                [--modes off on]
+    (asyncio server: --app async_app:app --worker-class aiohttp.GunicornWebWorker)
+
+For each mode it starts gunicorn from renderer/run/app on a free port, with a throwaway
+document store and cache, sends --requests requests for /data.json, /data.json/index and
+/sentences from 8 threads so every worker has served the document, then reads each
+worker's memory from /proc/<pid>/smaps_rollup (Linux only):
+    RSS  resident pages, shared ones counted in full
+    PSS  resident pages, shared ones divided among the processes sharing them
+    USS  pages private to the worker, i.e. what each additional worker costs
+Boot time is from fork to ready, as logged by the config's post_worker_init hook.
+"""
+import argparse
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'run', 'app'))
+PATHS = ["/data.json", "/data.json/index", "/sentences?start=0&count=20"]
+BOOTED = re.compile(r"Worker (\d+) booted in ([0-9.]+)s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory_kib(pid):
+    """
+    Return {"rss", "pss", "uss"} in KiB for pid.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)}
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def run_mode(preload, workers, app, worker_class, requests):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, HW_HERO_PRELOAD="1" if preload else "0", HW_HERO_DB=os.path.join(tmp, "documents.db"),
+                   HW_HERO_BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers))
+        log_path = os.path.join(tmp, "gunicorn.log")
+        started = time.monotonic()
+        with open(log_path, "w") as log:
+            command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-k", worker_class, app]
+            server = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            boot_times = {}
+            while len(boot_times) < workers:
+                if server.poll() is not None or time.monotonic() - started > 120:
+                    raise RuntimeError(f"gunicorn did not start:\n{open(log_path).read()[-2000:]}")
+                with open(log_path) as log:
+                    boot_times = {int(pid): float(seconds) for pid, seconds in BOOTED.findall(log.read())}
+                time.sleep(0.05)
+            ready = time.monotonic() - started
+
+            base = f"http://127.0.0.1:{port}"
+            with ThreadPoolExecutor(8) as pool:
+                list(pool.map(get, [base + PATHS[i % len(PATHS)] for i in range(requests)]))
+            time.sleep(0.5)
+            pids = worker_pids(server.pid)
+            memory = [memory_kib(pid) for pid in pids]
+            return {
+                "preload": preload,
+                "ready_s": ready,
+                "boot_s": statistics.mean(boot_times.values()),
+                "master_rss": memory_kib(server.pid)["rss"],
+                **{key: statistics.mean(m[key] for m in memory) for key in ("rss", "pss", "uss")},
+            }
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+
+def print_results(results, workers):
+    print(f"\n{workers} workers, memory per worker in MiB (mean)")
+    print(f"{'preload':>8}{'boot s':>9}{'ready s':>9}{'RSS':>8}{'PSS':>8}{'USS':>8}{'master RSS':>12}")
+    for r in results:
+        print(f"{'on' if r['preload'] else 'off':>8}{r['boot_s']:>9.3f}{r['ready_s']:>9.2f}"
+              f"{r['rss'] / 1024:>8.1f}{r['pss'] / 1024:>8.1f}{r['uss'] / 1024:>8.1f}{r['master_rss'] / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--app", default="app:app")
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--modes", nargs="+", choices=["off", "on"], default=["off", "on"])
+    args = parser.parse_args()
+    results = [run_mode(mode == "on", args.workers, args.app, args.worker_class, args.requests) for mode in args.modes]
+    print_results(results, args.workers)
+
+
+if __name__ == "__main__":
+    main()
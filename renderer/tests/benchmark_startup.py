@@ -0,0 +1,150 @@
+"""
+Cold-start benchmark for the CLI and server entry points, with python -X importtime. No API calls.
+
+Usage:
+    python benchmark_startup.py [--entry NAME ...] [--repeat 5]
+                                [--save-baseline | --check [--tolerance 0.5]]
+
+Each entry point runs in a fresh interpreter (the best of --repeat runs) and is reported
+as its total import time, the process wall time and its slowest top-level imports.
+Entry points must also not load the heavy modules in HEAVY_MODULES unless they are
+listed as allowed for them, e.g. `main.py --use-test-data` must never import openai;
+--check fails on that regardless of timings, and on import time beyond --tolerance of
+benchmark_startup_baselines.json. Baselines are machine-specific: record and check on
+the same box.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', 'run'))
+APP_DIR = os.path.join(RUN_DIR, 'app')
+BASELINE_PATH = os.path.join(TESTS_DIR, "benchmark_startup_baselines.json")
+
+# Loaded only on the code paths that call the API or open images.
+HEAVY_MODULES = ["openai", "aiohttp", "requests", "PIL", "llm_client", "openai_api_call"]
+
+# name -> (working directory, code, heavy modules it may load)
+ENTRY_POINTS = {
+    "import main": (RUN_DIR, "import main", []),
+    "main --use-test-data": (RUN_DIR, "import main; main.main(use_test_data=True, write_files=False)", []),
+    "import job_queue": (RUN_DIR, "import job_queue", []),
+    "import app": (APP_DIR, "import app", []),
+    "app /data.json": (APP_DIR, "import app; assert app.app.test_client().get('/data.json').status_code == 200", []),
+    "import async_app": (APP_DIR, "import async_app", ["aiohttp"]),
+}
+
+
+def parse_importtime(stderr):
+    """
+    Return {top-level module: cumulative microseconds} from -X importtime output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            continue  # Nested import, already counted in its parent's cumulative time
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def run_entry_point(name):
+    """
+    Run one entry point in a fresh interpreter. Returns {"import_s", "wall_s", "slowest", "heavy"}.
+    """
+    cwd, code, _ = ENTRY_POINTS[name]
+    report = f"; import sys; print('HEAVY=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, HW_HERO_DB=os.path.join(tmp, "documents.db"), PYTHONDONTWRITEBYTECODE="1")
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code + report],
+                                cwd=cwd, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{result.stderr[-2000:]}")
+    heavy_line = [line for line in result.stdout.splitlines() if line.startswith("HEAVY=")][-1]
+    modules = parse_importtime(result.stderr)
+    return {
+        "import_s": sum(modules.values()) / 1e6,
+        "wall_s": wall,
+        "slowest": sorted(modules, key=modules.get, reverse=True)[:3],
+        "heavy": [m for m in heavy_line[len("HEAVY="):].split(",") if m],
+    }
+
+
+def unexpected_heavy_modules(name, result):
+    return [m for m in result["heavy"] if m not in ENTRY_POINTS[name][2]]
+
+
+def benchmark(names, repeat):
+    results = {}
+    for name in names:
+        runs = [run_entry_point(name) for _ in range(repeat)]
+        results[name] = min(runs, key=lambda r: r["import_s"])
+    return results
+
+
+def print_results(results):
+    print(f"\n{'entry point':<24}{'imports s':>11}{'wall s':>9}  slowest top-level imports / heavy modules loaded")
+    for name, r in results.items():
+        heavy = f"  [heavy: {', '.join(r['heavy'])}]" if r["heavy"] else ""
+        print(f"{name:<24}{r['import_s']:>11.3f}{r['wall_s']:>9.3f}  {', '.join(r['slowest'])}{heavy}")
+
+
+def check_against_baseline(results, baseline, tolerance):
+    """
+    Return a list of regression messages (empty if none).
+    """
+    regressions = []
+    for name, result in results.items():
+        unexpected = unexpected_heavy_modules(name, result)
+        if unexpected:
+            regressions.append(f"{name}: imports {', '.join(unexpected)}")
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        before, after = base["import_s"], result["import_s"]
+        if after > before * (1 + tolerance):
+            regressions.append(f"{name}: imports {before:.3f}s -> {after:.3f}s (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", nargs="+", choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--save-baseline", action="store_true")
+    group.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = benchmark(args.entry, args.repeat)
+    print_results(results)
+
+    if args.save_baseline:
+        baseline = {"meta": {"python": sys.version.split()[0], "repeat": args.repeat}, "results": results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = check_against_baseline(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"[REGRESSION] {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
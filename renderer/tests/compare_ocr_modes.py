@@ -0,0 +1,58 @@
+"""
+Side-by-side comparison of the two-call (perform_ocr + correct_text) and the
+combined single-call OCR + correction modes in openai_api_call.
+
+Usage:
+    python compare_ocr_modes.py IMAGE [IMAGE ...] [--runs N]
+
+For each image and mode it reports wall time, and for quality it compares the
+combined mode's transcription and correction against the two-call mode's
+(fuzz.ratio) and how many sentences each produces through align_sentences.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'run')))
+
+from fuzzywuzzy import fuzz
+from openai_api_call import ocr_and_correct
+from seq_alignment_reverse import align_sentences
+
+
+def run_mode(image_path, combined, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = ocr_and_correct(image_path, combined=combined)
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def compare(image_path, runs):
+    (two_ocr, two_corrected), two_times = run_mode(image_path, False, runs)
+    (one_ocr, one_corrected), one_times = run_mode(image_path, True, runs)
+
+    two_pairs = align_sentences(two_ocr, two_corrected)
+    one_pairs = align_sentences(one_ocr, one_corrected)
+    changed = lambda pairs: sum(1 for ocr, corrected in pairs if ocr != corrected)
+
+    print(f"\n=== {image_path} ===")
+    print(f"{'':24}{'two-call':>12}{'combined':>12}")
+    print(f"{'mean latency (s)':24}{sum(two_times) / runs:>12.2f}{sum(one_times) / runs:>12.2f}")
+    print(f"{'min latency (s)':24}{min(two_times):>12.2f}{min(one_times):>12.2f}")
+    print(f"{'aligned sentences':24}{len(two_pairs):>12}{len(one_pairs):>12}")
+    print(f"{'corrected sentences':24}{changed(two_pairs):>12}{changed(one_pairs):>12}")
+    print(f"transcription similarity: {fuzz.ratio(two_ocr, one_ocr)}")
+    print(f"correction similarity:    {fuzz.ratio(two_corrected, one_corrected)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    for image in args.images:
+        compare(image, args.runs)
@@ -0,0 +1,95 @@
+# conftest.py
+#
+# Shared setup for the tests of renderer/run and renderer/run/app.
+#
+# This directory also holds the early prototypes (block_creation.py, openai_api_call.py,
+# tokenizer.py, ...) that the older tests import by bare name, and two of them share a
+# name with modules in renderer/run. RUN_DIR and APP_DIR are therefore appended to
+# sys.path, so bare imports still find the prototypes first. Tests that import main use
+# the run_modules fixture: it puts RUN_DIR first and evicts the prototypes (and the
+# "renderer" namespace package, which shadows renderer/run/renderer.py) from sys.modules
+# for the duration of the test.
+
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', 'run'))
+APP_DIR = os.path.join(RUN_DIR, 'app')
+OUTPUT_JSON = os.path.join(APP_DIR, 'output.json')
+SENTENCE_MAPPING = os.path.join(RUN_DIR, 'sentence_mapping.json')
+# Names renderer/run imports that resolve to something else from this directory.
+SHADOWED_MODULES = ("block_creation", "openai_api_call", "renderer")
+
+for path in (RUN_DIR, APP_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import document_store
+import shared_cache
+
+
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def run_modules(monkeypatch):
+    """
+    Make bare imports resolve to renderer/run (e.g. for main and job runs) during the test.
+    """
+    monkeypatch.syspath_prepend(RUN_DIR)
+    for name in SHADOWED_MODULES:
+        module = sys.modules.get(name)
+        if module is not None and os.path.dirname(getattr(module, "__file__", None) or "") != RUN_DIR:
+            monkeypatch.delitem(sys.modules, name)
+
+
+@pytest.fixture
+def sample_document():
+    """
+    (output_data, sentence_mapping) of the sample essay, freshly loaded.
+    """
+    return load_json(OUTPUT_JSON), load_json(SENTENCE_MAPPING)
+
+
+@pytest.fixture
+def worker_cache(tmp_path):
+    """
+    Factory for the cache each gunicorn worker builds for the same file.
+    """
+    def make(path=None):
+        path = path or str(tmp_path / "cache.db")
+        return shared_cache.TieredCache(shared_cache.LRUCache(), shared_cache.SQLiteCache(path))
+    return make
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    A throwaway document store, installed as the process-wide store and cache location.
+    """
+    path = str(tmp_path / "documents.db")
+    monkeypatch.setattr(shared_cache, "DB_PATH", path)
+    store = document_store.DocumentStore(path)
+    monkeypatch.setattr(document_store, "_store", store)  # main.save_document uses get_store()
+    return store
+
+
+@pytest.fixture
+def flask_client(store, run_modules, monkeypatch):
+    """
+    Test client of app.py on the throwaway store, with a fresh hover prefetcher.
+    """
+    import explanation_prefetch
+    monkeypatch.setattr(explanation_prefetch, "_prefetcher", explanation_prefetch.Prefetcher())
+    # By path: "import app" may already be the renderer/run/app package.
+    spec = importlib.util.spec_from_file_location("flask_app", os.path.join(APP_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app.test_client()
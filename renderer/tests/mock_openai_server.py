@@ -0,0 +1,347 @@
+"""
+Local stand-in for the OpenAI ChatCompletion endpoint, so main.py, /highlight_click and
+generate_explanation can be benchmarked and regression-tested offline and deterministically.
+
+Usage:
+    python mock_openai_server.py --fixtures DIR [--mode replay|record] [--latency SPEC]
+                                 [--seed N] [--on-miss error|canned] [--port 8765]
+
+Point the code under test at it (openai reads OPENAI_API_BASE at import):
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python main.py
+
+Modes:
+    replay  answer from fixtures keyed by a hash of the request (model, messages and
+            sampling parameters). A miss is a 404, or a canned answer with --on-miss canned.
+    record  answer from fixtures when possible; otherwise forward the call to --upstream
+            (with the caller's Authorization header), save the answer as a fixture and return it.
+
+Latency SPEC (sampled per call from a generator seeded with --seed):
+    0 | fixed:SECONDS | uniform:LOW:HIGH | lognormal:MEDIAN:SIGMA | recorded[:SCALE]
+"recorded" sleeps for the latency measured when the fixture was recorded.
+
+Streamed requests (stream=True) are answered from the same fixtures as server-sent events.
+In tests, MockOpenAIServer runs the server on a background thread.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+DEFAULT_PORT = 8765
+DEFAULT_UPSTREAM = "https://api.openai.com/v1"
+
+# Request fields that change the answer; everything else (stream, request_timeout...) is ignored.
+KEY_FIELDS = (
+    "model", "messages", "temperature", "top_p", "n", "stop", "max_tokens",
+    "presence_penalty", "frequency_penalty", "response_format", "seed",
+)
+# Parts of a prompt that change on every call without changing the answer
+# (build_replacement_base_prompt appends a timestamp nonce).
+VOLATILE_PATTERNS = [re.compile(r"NONCE: \d+")]
+
+CANNED_CONTENT = "This is a mock response."
+PREVIEW_CHARS = 200
+# Streamed answers: share of the latency spent before the first chunk, and words per chunk.
+STREAM_FIRST_CHUNK_FRACTION = 0.3
+STREAM_WORDS_PER_CHUNK = 3
+
+
+def request_key(body):
+    """
+    Return the fixture key for a ChatCompletion request body.
+    """
+    key_body = {field: body[field] for field in KEY_FIELDS if field in body}
+    text = json.dumps(key_body, sort_keys=True)
+    for pattern in VOLATILE_PATTERNS:
+        text = pattern.sub("", text)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def prompt_preview(messages):
+    """
+    Return the start of the last text message, to make fixture files recognizable.
+    """
+    for message in reversed(messages):
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        if content:
+            return content[:PREVIEW_CHARS]
+    return ""
+
+
+class LatencyModel:
+    """
+    Seeded latency distribution parsed from a SPEC string (see the module docstring).
+    """
+    def __init__(self, spec="0", seed=0):
+        self.spec = spec
+        self.random = random.Random(seed)
+        name, _, params = spec.partition(":")
+        self.kind = "fixed" if name == "0" else name
+        self.params = [float(p) for p in params.split(":") if p]
+        if self.kind not in ("fixed", "uniform", "lognormal", "recorded"):
+            raise ValueError(f"Unknown latency spec: {spec}")
+
+    def sample(self, recorded=None):
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            low, high = self.params
+            return self.random.uniform(low, high)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return self.random.lognormvariate(math.log(median), sigma)
+        scale = self.params[0] if self.params else 1.0
+        return (recorded or 0.0) * scale
+
+
+class FixtureStore:
+    """
+    One JSON file per recorded call: {"key", "model", "prompt", "latency", "response"}.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, body, response, latency):
+        fixture = {
+            "key": key,
+            "model": body.get("model"),
+            "prompt": prompt_preview(body.get("messages", [])),
+            "latency": round(latency, 4),
+            "response": response,
+        }
+        with open(self.path(key), "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+        return fixture
+
+
+def canned_response(body):
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": CANNED_CONTENT}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 5, "total_tokens": prompt_tokens + 5},
+    }
+
+
+def error_response(status, message):
+    return web.json_response({"error": {"message": message, "type": "invalid_request_error"}}, status=status)
+
+
+def stream_chunks(response):
+    """
+    Turn a non-streamed completion into the chat.completion.chunk events the API streams.
+    """
+    content = response["choices"][0]["message"].get("content") or ""
+    words = re.findall(r"\S+\s*|\s+", content)
+    base = {"id": response.get("id"), "object": "chat.completion.chunk",
+            "created": response.get("created"), "model": response.get("model")}
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}])]
+    for i in range(0, len(words), STREAM_WORDS_PER_CHUNK):
+        delta = "".join(words[i:i + STREAM_WORDS_PER_CHUNK])
+        chunks.append(dict(base, choices=[{"index": 0, "delta": {"content": delta}, "finish_reason": None}]))
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    return chunks
+
+
+# Application state, set up by create_app.
+FIXTURES = web.AppKey("fixtures", FixtureStore)
+MODE = web.AppKey("mode", str)
+LATENCY = web.AppKey("latency", LatencyModel)
+ON_MISS = web.AppKey("on_miss", str)
+UPSTREAM = web.AppKey("upstream", str)
+UPSTREAM_SESSION = web.AppKey("upstream_session", aiohttp.ClientSession)
+STATS = web.AppKey("stats", dict)
+
+
+async def forward_upstream(app, request, body):
+    """
+    Send the call (unstreamed) to the real API. Returns (status, response JSON, latency).
+    """
+    upstream_body = dict(body, stream=False)
+    headers = {"Authorization": request.headers.get("Authorization", "")}
+    start = time.monotonic()
+    async with app[UPSTREAM_SESSION].post(f"{app[UPSTREAM]}/chat/completions",
+                                          json=upstream_body, headers=headers) as resp:
+        data = await resp.json()
+        return resp.status, data, time.monotonic() - start
+
+
+async def chat_completions(request):
+    app = request.app
+    body = await request.json()
+    key = request_key(body)
+    stats = app[STATS]
+    fixture = app[FIXTURES].load(key)
+
+    if fixture is not None:
+        stats["hits"] += 1
+        response, recorded_latency = fixture["response"], fixture.get("latency")
+    elif app[MODE] == "record":
+        status, response, recorded_latency = await forward_upstream(app, request, body)
+        if status != 200:
+            return web.json_response(response, status=status)
+        app[FIXTURES].save(key, body, response, recorded_latency)
+        stats["recorded"] += 1
+    elif app[ON_MISS] == "canned":
+        stats["misses"] += 1
+        response, recorded_latency = canned_response(body), None
+    else:
+        stats["misses"] += 1
+        print(f"[MOCK] No fixture for {body.get('model')} request {key[:12]}: {prompt_preview(body.get('messages', []))[:80]!r}")
+        return error_response(404, f"No recorded response for request {key}")
+
+    # In record mode the real call already took its time.
+    latency = 0.0 if fixture is None and app[MODE] == "record" else app[LATENCY].sample(recorded_latency)
+
+    if not body.get("stream"):
+        await asyncio.sleep(latency)
+        return web.json_response(response)
+
+    chunks = stream_chunks(response)
+    await asyncio.sleep(latency * STREAM_FIRST_CHUNK_FRACTION)
+    stream = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await stream.prepare(request)
+    gap = latency * (1 - STREAM_FIRST_CHUNK_FRACTION) / max(1, len(chunks) - 1)
+    for i, chunk in enumerate(chunks):
+        if i:
+            await asyncio.sleep(gap)
+        await stream.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+    await stream.write(b"data: [DONE]\n\n")
+    await stream.write_eof()
+    return stream
+
+
+async def get_stats(request):
+    return web.json_response(request.app[STATS])
+
+
+async def _open_upstream_session(app):
+    app[UPSTREAM_SESSION] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+
+async def _close_upstream_session(app):
+    await app[UPSTREAM_SESSION].close()
+
+
+def create_app(fixtures_dir, mode="replay", latency="0", seed=0, on_miss="error", upstream=DEFAULT_UPSTREAM):
+    if mode not in ("replay", "record"):
+        raise ValueError(f"Unknown mode: {mode}")
+    app = web.Application(client_max_size=64 * 1024 * 1024)  # OCR requests carry whole images
+    app[FIXTURES] = FixtureStore(fixtures_dir)
+    app[MODE] = mode
+    app[LATENCY] = LatencyModel(latency, seed)
+    app[ON_MISS] = on_miss
+    app[UPSTREAM] = upstream.rstrip("/")
+    app[STATS] = {"hits": 0, "misses": 0, "recorded": 0}
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/chat/completions", chat_completions)
+    app.router.add_get("/mock/stats", get_stats)
+    app.on_startup.append(_open_upstream_session)
+    app.on_cleanup.append(_close_upstream_session)
+    return app
+
+
+class MockOpenAIServer:
+    """
+    Run the mock server on a background thread. As a context manager it also points
+    openai.api_base at the server and restores it afterwards:
+
+        with MockOpenAIServer("fixtures/", latency="uniform:0.1:0.3") as server:
+            main.main()
+            print(server.stats)
+    """
+    def __init__(self, fixtures_dir, host="127.0.0.1", port=0, **app_options):
+        self.app = create_app(fixtures_dir, **app_options)
+        self.host = host
+        self.port = port
+        self.base_url = None
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.app)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            host, port = self._runner.addresses[0][:2]
+            self.base_url = f"http://{host}:{port}/v1"
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-openai", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    @property
+    def stats(self):
+        return dict(self.app[STATS])
+
+    def __enter__(self):
+        import openai
+        self.start()
+        self._previous_api = (openai.api_base, openai.api_key)
+        openai.api_base = self.base_url
+        openai.api_key = openai.api_key or "mock"
+        return self
+
+    def __exit__(self, *exc_info):
+        import openai
+        openai.api_base, openai.api_key = self._previous_api
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_fixtures"))
+    parser.add_argument("--mode", choices=["replay", "record"], default="replay")
+    parser.add_argument("--latency", default="0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--on-miss", choices=["error", "canned"], default="error")
+    parser.add_argument("--upstream", default=DEFAULT_UPSTREAM)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    print(f"[MOCK] {args.mode} mode, fixtures in {args.fixtures}, latency {args.latency}")
+    web.run_app(
+        create_app(args.fixtures, args.mode, args.latency, args.seed, args.on_miss, args.upstream),
+        host=args.host, port=args.port,
+    )
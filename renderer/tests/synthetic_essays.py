@@ -0,0 +1,195 @@
+"""
+Deterministic synthetic essays for benchmarking the render pipeline.
+
+generate_essay(sentence_count, error_rate, seed) builds a clean "corrected" essay from
+sentence templates and derives the learner's version from it by applying the kinds of
+errors the corrector sees in real homework:
+
+    article drops         "I bought a new phone."      -> "I bought new phone."
+    plural errors         "many singers"               -> "many singer"
+    punctuation           "However, it is ..."         -> "However it is ..."
+    sentence splits       "... because it is fun."     -> "... Because it is fun."
+    sentence merges       "... music. It helps ..."    -> "... music, it helps ..."
+
+error_rate is the expected number of errors per sentence. The same arguments always
+give the same texts.
+"""
+import random
+
+SUBJECTS = [
+    "My friend", "My older sister", "Our teacher", "The student", "My best friend",
+    "Everyone in my class", "My father", "The girl next door", "Our coach", "My little brother",
+]
+PLURAL_SUBJECTS = [
+    "Many students", "Young people", "My classmates", "Some parents", "Most teenagers",
+    "Korean singers", "Our neighbors", "The teachers", "Many fans", "Students",
+]
+VERB_PHRASES = [
+    ("listens to", "listen to"), ("talks about", "talk about"), ("likes", "like"),
+    ("watches", "watch"), ("writes about", "write about"), ("thinks about", "think about"),
+    ("buys", "buy"), ("shares", "share"),
+]
+# Regular nouns only, so the plural is always noun + "s".
+NOUNS = [
+    "song", "singer", "concert", "album", "video", "book", "game", "movie",
+    "festival", "dance", "phone", "picture", "friend", "lesson",
+]
+ADJECTIVES = ["new", "popular", "famous", "interesting", "old", "favorite", "difficult", "small", "exciting", "long"]
+TIMES = [
+    "every weekend", "after school", "during the vacation", "on Sunday", "in the evening",
+    "before the exam", "last summer", "every morning",
+]
+REASONS = [
+    "because it gives them hope", "because it is fun", "because it helps them relax",
+    "because their friends like it too", "because it makes them feel confident",
+    "since it is part of our culture", "so they can make more friends",
+]
+OPENERS = ["However", "Also", "In my opinion", "Recently", "For example", "Firstly", "Secondly", "Lastly"]
+
+ARTICLES = ("a", "an", "the")
+SENTENCES_PER_PARAGRAPH = 5
+# Relative frequency of each error type.
+ERROR_WEIGHTS = {
+    "article_drop": 3,
+    "plural": 3,
+    "punctuation": 2,
+    "split": 1,
+    "merge": 1,
+}
+
+
+def _with_article(rng, adjective, noun):
+    article = rng.choice(["a", "the"])
+    if article == "a" and adjective[0] in "aeiou":
+        article = "an"
+    return f"{article} {adjective} {noun}"
+
+
+def clean_sentence(rng):
+    """
+    One grammatical sentence built from the templates.
+    """
+    plural = rng.random() < 0.5
+    subject = rng.choice(PLURAL_SUBJECTS if plural else SUBJECTS)
+    singular_verb, plural_verb = rng.choice(VERB_PHRASES)
+    verb = plural_verb if plural else singular_verb
+    if rng.random() < 0.5:
+        obj = _with_article(rng, rng.choice(ADJECTIVES), rng.choice(NOUNS))
+    else:
+        obj = f"many {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s"
+    sentence = f"{subject} {verb} {obj} {rng.choice(TIMES)}"
+    if rng.random() < 0.4:
+        sentence += f" {rng.choice(REASONS)}"
+    if rng.random() < 0.3:
+        opener = rng.choice(OPENERS)
+        sentence = f"{opener}, {sentence[0].lower()}{sentence[1:]}"
+    return sentence + "."
+
+
+def _drop_article(rng, sentence):
+    words = sentence.split(" ")
+    positions = [i for i, w in enumerate(words) if w in ARTICLES]
+    if not positions:
+        return None
+    del words[rng.choice(positions)]
+    return " ".join(words)
+
+
+def _noun_base(word):
+    """
+    Return the singular noun a word is built on ("songs." -> "song"), or None.
+    """
+    word = word.rstrip(".,")
+    if word in NOUNS:
+        return word
+    if word.endswith("s") and word[:-1] in NOUNS:
+        return word[:-1]
+    return None
+
+
+def _plural_error(rng, sentence):
+    words = sentence.split(" ")
+    positions = [i for i, w in enumerate(words) if _noun_base(w)]
+    if not positions:
+        return None
+    i = rng.choice(positions)
+    word = words[i].rstrip(".,")
+    base = _noun_base(word)
+    # "many songs" -> "many song", "a song" -> "a songs"
+    flipped = base if word != base else base + "s"
+    words[i] = flipped + words[i][len(word):]
+    return " ".join(words)
+
+
+def _punctuation_error(rng, sentence):
+    if ", " in sentence:
+        return sentence.replace(", ", " ", 1)
+    words = sentence.split(" ")
+    if len(words) < 4:
+        return None
+    i = rng.randrange(1, len(words) - 2)
+    words[i] += ","
+    return " ".join(words)
+
+
+def _split_sentence(rng, sentence):
+    for reason_word in ("because", "since", "so"):
+        marker = f" {reason_word} "
+        if marker in sentence:
+            head, tail = sentence.split(marker, 1)
+            return f"{head}. {reason_word.capitalize()} {tail}"
+    return None
+
+
+def apply_errors(rng, sentences, error_rate):
+    """
+    Return the learner's sentences (a merge comma-splices a sentence onto the next one).
+    """
+    kinds = list(ERROR_WEIGHTS)
+    weights = [ERROR_WEIGHTS[k] for k in kinds]
+    learner = []
+    merge_with_previous = False
+    for sentence in sentences:
+        # Each sentence gets int(rate) errors, plus one more with probability equal to the remainder.
+        count = int(error_rate) + (1 if rng.random() < error_rate - int(error_rate) else 0)
+        merge_next = False
+        for kind in rng.choices(kinds, weights, k=count):
+            if kind == "article_drop":
+                sentence = _drop_article(rng, sentence) or sentence
+            elif kind == "plural":
+                sentence = _plural_error(rng, sentence) or sentence
+            elif kind == "punctuation":
+                sentence = _punctuation_error(rng, sentence) or sentence
+            elif kind == "split":
+                sentence = _split_sentence(rng, sentence) or sentence
+            elif kind == "merge":
+                merge_next = True
+        if merge_with_previous and learner:
+            previous = learner.pop()
+            sentence = f"{previous[:-1]}, {sentence[0].lower()}{sentence[1:]}"
+        learner.append(sentence)
+        merge_with_previous = merge_next
+    return learner
+
+
+def paragraphs(sentences, per_paragraph=SENTENCES_PER_PARAGRAPH):
+    return "\n\n".join(
+        " ".join(sentences[i:i + per_paragraph]) for i in range(0, len(sentences), per_paragraph)
+    )
+
+
+def generate_essay(sentence_count, error_rate=1.0, seed=0):
+    """
+    Return (learner_text, corrected_text) with sentence_count corrected sentences.
+    """
+    rng = random.Random(seed)
+    corrected = [clean_sentence(rng) for _ in range(sentence_count)]
+    learner = apply_errors(rng, corrected, error_rate)
+    return paragraphs(learner), paragraphs(corrected)
+
+
+if __name__ == "__main__":
+    learner_text, corrected_text = generate_essay(8, error_rate=1.5, seed=1)
+    print(learner_text)
+    print("---")
+    print(corrected_text)
@@ -0,0 +1,42 @@
+import contextlib
+import copy
+import os
+
+from custom_sentence import materialize_custom_sentences
+from generate_explanation import resolve_custom_sentence
+
+def test_every_block_gets_its_custom_sentence_without_touching_tokens(sample_document):
+    output_data, sentence_mapping = sample_document
+    original = copy.deepcopy(output_data)
+    materialize_custom_sentences(output_data, sentence_mapping)
+
+    for before, after in zip(original["sentences"], output_data["sentences"]):
+        assert after["final_sentence_tokens"] == before["final_sentence_tokens"]
+        for key in ("replacement_blocks", "insert_blocks", "delete_blocks"):
+            assert all("custom_sentence" in block for block in after[key])
+    block = output_data["sentences"][0]["replacement_blocks"][0]
+    assert (block["replaced_text"], block["corrected_text"]) == ("friend", "friends")
+    assert block["custom_sentence"] == "I want to be a math teacher because teaching my friend makes me feel great."
+
+    # The click path uses the stored sentence; without it, it rebuilds the same one.
+    entry = original["sentences"][1]
+    for block_type, key in (("replacement", "replacement_blocks"), ("insert", "insert_blocks")):
+        for plain, materialized in zip(entry[key], output_data["sentences"][1][key]):
+            assert resolve_custom_sentence(block_type, "", materialized) == materialized["custom_sentence"]
+            assert resolve_custom_sentence(block_type, "", plain, copy.deepcopy(entry)) == materialized["custom_sentence"]
+
+def test_isolated_punctuation_uses_the_ocr_sentence(run_modules):
+    import main
+    from seq_alignment_reverse import create_sentence_mapping
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _, cleaned_pairs, _, tokenized_output = main.align_and_diff(main.test_ocr_text, main.test_corrected_text)
+        sentence_mapping = create_sentence_mapping(cleaned_pairs)
+        output_data = main.render_document(tokenized_output, save_debug_output=False)
+    materialize_custom_sentences(output_data, sentence_mapping)
+
+    ocr_sentences = {s["sentence_index"]: s["ocr_sentence"] for s in sentence_mapping["sentences"]}
+    isolated = [(entry["sentence_index"], block) for entry in output_data["sentences"]
+                for block in entry["delete_blocks"] if block["isolated_punctuation"]]
+    assert isolated
+    for sentence_index, block in isolated:
+        assert block["custom_sentence"] == ocr_sentences[sentence_index]
@@ -0,0 +1,67 @@
+import json
+
+import correction_service
+import document_store
+from conftest import OUTPUT_JSON, SENTENCE_MAPPING
+from document_store import DocumentStore, BLOCK_KINDS
+
+def all_clicks(output_data):
+    for entry in output_data["sentences"]:
+        for key, (block_type, index_field) in BLOCK_KINDS.items():
+            for block in entry[key]:
+                yield {"blockType": block_type, "blockIndex": block[index_field],
+                       "sentenceIndex": entry["sentence_index"]}
+
+def test_documents_round_trip_and_stay_separate(tmp_path, sample_document):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    output_data, sentence_mapping = sample_document
+    first = store.save_document(output_data, sentence_mapping, source="sample")
+    second = store.save_document({"sentences": output_data["sentences"][:2]}, sentence_mapping)
+
+    assert store.get_document(first) == output_data
+    assert len(store.get_document(second)["sentences"]) == 2
+    assert store.get_document("missing") is None
+    assert {d["id"]: d["sentence_count"] for d in store.list_documents()} == {
+        first: len(output_data["sentences"]), second: 2}
+
+    store.save_document({"sentences": output_data["sentences"][:1]}, sentence_mapping, document_id=first)
+    assert len(store.get_document(first)["sentences"]) == 1
+    assert store.get_sentence(first, 1) is None
+
+def test_store_lookup_matches_file_lookup(tmp_path, monkeypatch, sample_document):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    monkeypatch.setattr(correction_service, "OUTPUT_JSON_PATH", OUTPUT_JSON)
+    monkeypatch.setattr(correction_service, "SENTENCE_MAPPING_PATH", SENTENCE_MAPPING)
+
+    clicks = list(all_clicks(output_data))
+    assert clicks
+    for click in clicks:
+        from_file = correction_service.get_correction_explanation(click)
+        from_store = correction_service.get_correction_explanation_from_store(
+            document_id, click["blockType"], click["blockIndex"], click["sentenceIndex"], store=store)
+        assert from_store == from_file
+
+    missing = correction_service.get_correction_explanation_from_store(document_id, "insert", 99, 0, store=store)
+    assert missing["error"] == "Insert block not found"
+
+def test_sentence_ranges_and_index(tmp_path, sample_document):
+    store = DocumentStore(str(tmp_path / "documents.db"))
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    sentences = output_data["sentences"]
+
+    page = store.get_sentence_range(document_id, 3, 4)
+    assert page == {"sentence_count": len(sentences), "start": 3, "sentences": sentences[3:7]}
+    assert page == document_store.sentence_range(sentences, 3, 4)
+    assert store.get_sentence_range(document_id, len(sentences), 5)["sentences"] == []
+    assert store.get_sentence_range("missing", 0, 5) is None
+
+    # Offsets point at each record in the document as json.dumps writes it.
+    index = store.get_document_index(document_id)
+    serialized = json.dumps(output_data).encode("utf-8")
+    assert index["sentence_count"] == len(sentences) and index["total_bytes"] == len(serialized)
+    for entry, sentence in zip(index["sentences"], sentences):
+        record = serialized[entry["offset"]:entry["offset"] + entry["bytes"]]
+        assert json.loads(record) == sentence
@@ -0,0 +1,26 @@
+from edit_list_correction import apply_sentence_edits, build_edit_list_output
+
+SENTENCE = "Recently, there are many music and K-pop singer coming out."
+
+def test_edits_are_applied_in_sentence_order():
+    edits = [{"original": "singer", "replacement": "singers"},
+             {"original": "there are", "replacement": "there have been"}]
+    corrected, _ = apply_sentence_edits(SENTENCE, edits)
+    assert corrected == "Recently, there have been many music and K-pop singers coming out."
+
+    repeated = [{"original": "the", "replacement": "a"}, {"original": "the", "replacement": "this"}]
+    assert apply_sentence_edits("the cat and the dog", repeated)[0] == "a cat and this dog"
+
+def test_unapplied_edits_are_reported():
+    dropped = []
+    edits = [{"original": "there are many", "replacement": "there were many"},
+             {"original": "are many music", "replacement": "is much music"},  # overlaps the first
+             {"original": "songs", "replacement": "song"}]
+    corrected, _ = apply_sentence_edits(SENTENCE, edits, dropped)
+    assert corrected == SENTENCE.replace("there are many", "there were many")
+    assert [e["original"] for e in dropped] == ["are many music", "songs"]
+
+    matches, _, _ = build_edit_list_output([SENTENCE], [
+        {"sentence_index": 0, "original": "singer", "replacement": "singers"},
+        {"sentence_index": 3, "original": "out", "replacement": "up"}])
+    assert matches[0][1] == SENTENCE.replace("singer", "singers")
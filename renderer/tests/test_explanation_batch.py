@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+import correction_service
+import explanation_batch
+import generate_explanation
+
+def fake_generator(monkeypatch):
+    calls, running = [], [0, 0]  # running now, most at once
+    lock = threading.Lock()
+
+    def generate(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        with lock:
+            calls.append(block_type)
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return f"explanation of {block_type} {json.dumps(correction_block, sort_keys=True)}"
+
+    monkeypatch.setattr(generate_explanation, "generate_correction_explanation_single", generate)
+    return calls, running
+
+def test_each_sentence_is_read_once(monkeypatch, sample_document, store):
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    reads = []
+    get_sentence = store.get_sentence
+    monkeypatch.setattr(store, "get_sentence", lambda *args: reads.append(args[1]) or get_sentence(*args))
+
+    resolved = correction_service.get_correction_explanations({
+        "documentId": document_id,
+        "sentences": [1],
+        "blocks": [[1, "replacement", 0], {"sentenceIndex": 0, "blockType": "replacement", "blockIndex": 99},
+                   [1000, "insert", 0]],
+    }, store=store)
+    sentence = output_data["sentences"][1]
+    expected = ([f"1:replacement:{b['block_index']}" for b in sentence["replacement_blocks"]]
+                + [f"1:insert:{b['insert_block_index']}" for b in sentence["insert_blocks"]]
+                + [f"1:delete:{b['delete_block_index']}" for b in sentence["delete_blocks"]])
+    assert [k for k in resolved if "error" not in resolved[k]] == list(dict.fromkeys(["1:replacement:0"] + expected))
+    assert resolved["0:replacement:99"]["error"] == "Replacement block not found"
+    assert resolved["1000:insert:0"]["error"] == "Sentence not found"
+    assert sorted(reads) == [0, 1, 1000]
+
+    single = correction_service.get_correction_explanation_from_store(document_id, "delete", 0, 1, store=store)
+    assert {k: v for k, v in resolved["1:delete:0"].items() if k != "block_type"} == single
+
+    assert "error" in correction_service.get_correction_explanations({"documentId": document_id, "blocks": [[1, "bogus", 0]]})
+
+def test_batch_generates_missing_explanations_once_and_concurrently(monkeypatch, sample_document, store, worker_cache):
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    calls, running = fake_generator(monkeypatch)
+    cache = worker_cache()
+    everything = {"documentId": document_id, "sentences": [s["sentence_index"] for s in output_data["sentences"]]}
+
+    resolved = explanation_batch.resolve_batch(everything)
+    body = explanation_batch.batch_explanations(resolved, cache=cache, concurrency=4)
+    stats = body["stats"]
+    assert list(body["explanations"]) == list(resolved)
+    assert all("explanation" in r for r in body["explanations"].values())
+    assert stats["blocks"] == len(resolved) == stats["rule_based"] + stats["generated"] + stats["deduped"]
+    assert len(calls) == stats["generated"] and running[1] > 1
+
+    again = explanation_batch.batch_explanations(resolved, cache=cache)
+    assert again["explanations"] == body["explanations"] and len(calls) == stats["generated"]
+    assert again["stats"]["generated"] == 0
+
+def test_batch_through_the_api(monkeypatch, sample_document, store, flask_client):
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    fake_generator(monkeypatch)
+    client = flask_client
+    payload = {"documentId": document_id, "sentences": [1], "blocks": [[1, "replacement", 7]]}
+
+    streamed = client.post("/highlight_batch/stream", json=payload).get_data(as_text=True)
+    events = [chunk.split("\n") for chunk in streamed.strip().split("\n\n")]
+    assert events[-1][0] == "event: done"
+    blocks = [json.loads(data[len("data: "):]) for event, data in events if event == "event: block"]
+    assert {b["key"] for b in blocks if "error" in b} == {"1:replacement:7"}
+
+    body = client.post("/highlight_batch", json=payload).get_json()
+    assert body["explanations"]["1:replacement:7"]["error"] == "Replacement block not found"
+    assert body["stats"]["generated"] == 0  # all cached by the stream
+    assert {k: v["explanation"] for k, v in body["explanations"].items() if "explanation" in v} == {
+        b["key"]: b["explanation"] for b in blocks if "explanation" in b}
+    assert client.post("/highlight_batch", json={"documentId": document_id}).status_code == 400
@@ -0,0 +1,85 @@
+import threading
+
+import explanation_prefetch
+import generate_explanation
+from rule_based_explanation import explain_trivial_edit
+
+BLOCK = {"block_index": 0, "replaced_text": "go", "corrected_text": "went", "custom_sentence": "I go home."}
+
+def slow_generator(monkeypatch, release):
+    calls = []
+
+    def generate(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        calls.append(correction_block.get("corrected_text"))
+        release.wait(10)
+        return f"because {correction_block.get('corrected_text')}"
+
+    monkeypatch.setattr(explanation_prefetch, "generate_correction_explanation_single", generate)
+    monkeypatch.setattr(generate_explanation, "generate_correction_explanation_single", generate)
+    return calls
+
+def test_prefetch_dedupes_and_is_joined_by_the_click(monkeypatch, worker_cache):
+    release = threading.Event()
+    calls = slow_generator(monkeypatch, release)
+    prefetcher = explanation_prefetch.Prefetcher(cache=worker_cache())
+    args = ("replacement", "I go home.", "I went home.", BLOCK)
+
+    assert prefetcher.prefetch("s1", *args) == "queued"
+    assert prefetcher.prefetch("s2", *args) == "pending"  # another student hovering the same block
+    release.set()
+    assert prefetcher.join(*args) == "because went"
+    assert prefetcher.prefetch("s1", *args) == "cached"
+    assert calls == ["went"]
+    assert prefetcher.remaining("s1") == prefetcher.budget - 1 and prefetcher.remaining("s2") == prefetcher.budget
+
+    trivial = {"block_index": 1, "replaced_text": "i", "corrected_text": "I"}
+    assert explain_trivial_edit("replacement", trivial) is not None
+    assert prefetcher.prefetch("s1", "replacement", "i go.", "I go.", trivial) == "rule_based"
+
+def test_budgets_and_backpressure(monkeypatch, worker_cache):
+    release = threading.Event()
+    slow_generator(monkeypatch, release)
+    prefetcher = explanation_prefetch.Prefetcher(budget=2, max_pending=3, cache=worker_cache())
+    blocks = [dict(BLOCK, corrected_text=word) for word in ("went", "goes", "gone", "going")]
+
+    statuses = [prefetcher.prefetch("s1", "replacement", "I go home.", "I went home.", b) for b in blocks[:3]]
+    assert statuses == ["queued", "queued", "over_budget"] and prefetcher.remaining("s1") == 0
+    assert prefetcher.prefetch("s2", "replacement", "I go home.", "I went home.", blocks[2]) == "queued"
+    assert prefetcher.prefetch("s3", "replacement", "I go home.", "I went home.", blocks[3]) == "busy"
+    release.set()
+    assert prefetcher.stats()["counts"]["busy"] == 1
+
+def test_a_prefetch_in_another_worker_is_waited_for(monkeypatch, worker_cache):
+    release = threading.Event()
+    calls = slow_generator(monkeypatch, release)
+    hovered, clicked = (explanation_prefetch.Prefetcher(cache=worker_cache()) for _ in range(2))
+    args = ("replacement", "I go home.", "I went home.", BLOCK)
+
+    assert hovered.prefetch("s1", *args) == "queued"
+    assert clicked.prefetch("s1", *args) == "pending"  # claimed in the shared cache
+    threading.Timer(0.2, release.set).start()
+    assert clicked.join(*args) == "because went"
+    assert calls == ["went"]
+    assert clicked.get_cache().get(explanation_prefetch.CLAIM_CACHE, generate_explanation.explanation_cache_key(
+        *args)) is None
+
+def test_hover_then_click_through_the_api(monkeypatch, sample_document, store, flask_client):
+    output_data, sentence_mapping = sample_document
+    document_id = store.save_document(output_data, sentence_mapping)
+    sentence_index, block = next(
+        (s["sentence_index"], b) for s in output_data["sentences"] for b in s["replacement_blocks"]
+        if explain_trivial_edit("replacement", b) is None)
+    release = threading.Event()
+    calls = slow_generator(monkeypatch, release)
+    client = flask_client
+    payload = {"documentId": document_id, "blockType": "replacement", "blockIndex": block["block_index"],
+               "sentenceIndex": sentence_index}
+
+    hover = client.post("/highlight_prefetch", json=payload, headers={"X-Client-Id": "page-1"})
+    assert hover.status_code == 202 and hover.get_json()["status"] == "queued"
+    threading.Timer(0.2, release.set).start()  # the click comes while it is still running
+    click = client.post("/highlight_click", json=payload)
+    assert click.get_json() == {"explanation": f"because {block['corrected_text']}"}
+    assert len(calls) == 1
+    assert client.post("/highlight_prefetch", json=payload).get_json()["status"] == "cached"
+    assert client.get("/prefetch_stats").get_json()["counts"]["joined"] == 1
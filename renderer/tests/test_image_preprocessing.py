@@ -0,0 +1,28 @@
+import base64
+import io
+
+import pytest
+
+import image_preprocessing
+
+Image = pytest.importorskip("PIL.Image")
+
+def test_stream_encoding_matches_b64encode():
+    data = bytes(range(256)) * 3000
+    encoded = image_preprocessing.b64encode_stream(io.BytesIO(data), chunk_size=3 * 1000, prefix="data:x;base64,")
+    assert encoded == "data:x;base64," + base64.b64encode(data).decode("ascii")
+
+def test_unreadable_images_fall_back_to_the_original(tmp_path, monkeypatch):
+    page = str(tmp_path / "page.png")
+    Image.new("RGB", (400, 1200), "white").save(page)
+    with open(page, "rb") as f:
+        original = "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+    assert image_preprocessing.encode_image_data_url(page).startswith("data:image/jpeg;base64,")
+
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)  # DecompressionBombError, not an OSError
+    assert image_preprocessing.encode_image_data_url(page) == original
+    assert image_preprocessing.encode_image_bands(page) == [original]
+
+    corrupt = tmp_path / "corrupt.png"
+    corrupt.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+    assert image_preprocessing.encode_image_data_url(str(corrupt)).startswith("data:image/png;base64,")
@@ -0,0 +1,134 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import document_store
+import job_queue
+from stage_profiler import stage
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+def wait_for(queue, job_id, status, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {queue.get(job_id)}")
+
+def test_upload_poll_and_fetch_through_the_api(tmp_path, monkeypatch, store, flask_client):
+    queue = job_queue.JobQueue(
+        store=store, upload_dir=str(tmp_path / "uploads"),
+        runner=lambda job_id, paths, mode: job_queue.run_pipeline(job_id, paths, mode, use_test_data=True),
+    )
+    monkeypatch.setattr(job_queue, "_job_queue", queue)
+    client = flask_client
+
+    response = client.post("/jobs", data={"image": (io.BytesIO(PNG), "page.png")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 202
+    job_id = response.json["id"]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+
+    queue.wait()
+    status = client.get(f"/jobs/{job_id}").json
+    assert status["status"] == "done" and status["view_url"] == f"/?document={job_id}"
+    stages = status["progress"]["stages"]
+    # Test data skips OCR and correction; everything from alignment on ran.
+    assert [name for name in job_queue.JOB_STAGES if stages[name]["status"] == "done"] == \
+        ["align", "diff", "render", "store"]
+    assert stages["ocr"]["status"] == "skipped"
+
+    result = client.get(f"/jobs/{job_id}/result")
+    assert result.status_code == 200
+    assert result.json == client.get(f"/data.json?document={job_id}").json
+    assert len(result.json["sentences"]) > 10
+    assert not os.listdir(tmp_path / "uploads")
+
+    store.delete_document(job_id)
+    assert client.get(f"/jobs/{job_id}/result").status_code == 404
+
+    assert client.post("/jobs", data={"image": (io.BytesIO(b"not an image"), "page.txt")},
+                       content_type="multipart/form-data").status_code == 400
+    assert client.get("/jobs/missing").status_code == 404
+
+def test_backpressure_and_progress(tmp_path):
+    store = document_store.DocumentStore(str(tmp_path / "documents.db"))
+    release = threading.Event()
+
+    def runner(job_id, paths, mode):
+        with stage("ocr"):
+            release.wait(10)
+        with stage("render"):
+            pass
+        store.save_document({"sentences": []}, {"sentences": []}, document_id=job_id)
+
+    queue = job_queue.JobQueue(store=store, workers=1, max_queue_depth=1, max_jobs_per_client=1,
+                               upload_dir=str(tmp_path / "uploads"), runner=runner)
+    first = queue.submit([("a.png", PNG)], client="a")
+    running = wait_for(queue, first["id"], "running")
+    assert running["progress"]["stage"] == "ocr"
+
+    with pytest.raises(job_queue.QueueFull):
+        queue.submit([("a.png", PNG)], client="a")  # one unfinished job per client
+    second = queue.submit([("b.png", PNG)], client="b")
+    assert second["status"] == "queued" and second["queue_position"] == 1
+    with pytest.raises(job_queue.QueueFull) as full:
+        queue.submit([("c.png", PNG)], client="c")  # queue depth
+    assert full.value.retry_after >= 1
+    assert queue.depth()["queued"] == 1 and queue.depth()["running"] == 1
+
+    release.set()
+    queue.wait()
+    done = queue.get(first["id"])
+    assert done["status"] == "done"
+    assert done["progress"]["stages"]["ocr"]["seconds"] > 0
+    assert done["progress"]["stages"]["correction"]["status"] == "skipped"
+    assert queue.get(second["id"])["status"] == "done"
+
+def test_failed_job_reports_the_error(tmp_path):
+    store = document_store.DocumentStore(str(tmp_path / "documents.db"))
+
+    def runner(job_id, paths, mode):
+        raise RuntimeError("OCR returned nothing")
+
+    queue = job_queue.JobQueue(store=store, upload_dir=str(tmp_path / "uploads"), runner=runner)
+    job = queue.submit([("a.png", PNG)])
+    queue.wait()
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed" and failed["error"] == "OCR returned nothing"
+    with pytest.raises(job_queue.JobError):
+        queue.submit([("a.png", PNG)], correction_mode="pipelined")
+
+def test_jobs_run_in_any_process_under_one_running_cap(tmp_path):
+    store = document_store.DocumentStore(str(tmp_path / "documents.db"))
+    release = threading.Event()
+    ran = []
+
+    def runner(job_id, paths, mode):
+        ran.append([os.path.basename(path) for path in paths])
+        release.wait(10)
+        store.save_document({"sentences": []}, {"sentences": []}, document_id=job_id)
+
+    # One queue per "gunicorn worker": the first takes uploads but has no free worker thread.
+    options = dict(store=store, max_running=1, poll_seconds=0.01, upload_dir=str(tmp_path / "uploads"), runner=runner)
+    busy = job_queue.JobQueue(workers=0, **options)
+    idle = [job_queue.JobQueue(workers=2, **options) for _ in range(2)]
+    for queue in idle:
+        queue.start()
+
+    first = busy.submit([("a.png", PNG), ("b.png", PNG)], client="a")
+    second = busy.submit([("c.png", PNG)], client="b")
+    wait_for(busy, first["id"], "running")
+    time.sleep(0.2)
+    assert busy.depth()["running"] == 1 and busy.get(second["id"])["status"] == "queued"
+    assert busy.retry_after(1) >= 1
+
+    release.set()
+    busy.wait()
+    assert busy.get(second["id"])["status"] == "done"
+    assert ran[0] == ["page-1.png", "page-2.png"]
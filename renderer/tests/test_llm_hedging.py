@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+import types
+
+import openai
+import llm_client
+
+def make_response(text):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message={"content": text})])
+
+def reset_hedging(monkeypatch, delay=0.05):
+    monkeypatch.setattr(llm_client, "HEDGE_DEFAULT_DELAY", delay)
+    llm_client._latencies.clear()
+    llm_client._hedge_stats.update(calls=0, hedges=0)
+
+def test_async_hedge_wins_over_slow_primary(monkeypatch):
+    reset_hedging(monkeypatch)
+    latencies = [1.0, 0.01]  # first call stalls, the hedge is fast
+    cancelled = []
+
+    async def acreate(**kwargs):
+        delay = latencies.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return make_response(f"slept {delay}")
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    async def run():
+        start = time.monotonic()
+        response = await llm_client.achat_completion_hedged("gpt-4o-mini", [], hedge=True)
+        await asyncio.sleep(0)  # let the cancellation land
+        await llm_client.aclose()
+        return response, time.monotonic() - start
+
+    response, elapsed = asyncio.run(run())
+    assert llm_client.completion_text(response) == "slept 0.01"
+    assert elapsed < 0.5
+    assert cancelled == [1.0]
+    assert llm_client.hedge_stats()["hedges"] == 1
+
+def test_fast_calls_are_not_hedged(monkeypatch):
+    reset_hedging(monkeypatch, delay=0.5)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return make_response("fast")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    response = llm_client.chat_completion_hedged("gpt-4o-mini", [], hedge=True)
+    assert llm_client.completion_text(response) == "fast"
+    assert len(calls) == 1
+    assert llm_client.hedge_stats()["hedges"] == 0
+
+def test_hedge_budget_caps_duplicates(monkeypatch):
+    reset_hedging(monkeypatch, delay=0.01)
+    monkeypatch.setattr(llm_client, "HEDGE_BUDGET_BURST", 1)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        time.sleep(0.05)
+        return make_response("slow")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    for _ in range(5):
+        llm_client.chat_completion_hedged("gpt-4o-mini", [], hedge=True)
+    # 5 calls * 10% + burst of 1 allows a single hedge
+    assert llm_client.hedge_stats() == {"calls": 5, "hedges": 1}
+    assert len(calls) == 6
+
+def test_queued_and_saturated_calls_are_not_hedged(monkeypatch):
+    reset_hedging(monkeypatch, delay=0.01)
+    monkeypatch.setattr(llm_client, "_sync_semaphore", threading.BoundedSemaphore(1))
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        time.sleep(0.05)  # slower than the hedge delay, but holds the only slot
+        return make_response("slow")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    llm_client._sync_semaphore.acquire()  # another request holds the slot for a while
+    threading.Timer(0.1, llm_client._sync_semaphore.release).start()
+    response = llm_client.chat_completion_hedged("gpt-4o-mini", [], hedge=True)
+    assert llm_client.completion_text(response) == "slow"
+    assert len(calls) == 1 and llm_client.hedge_stats()["hedges"] == 0
+
+    monkeypatch.setattr(llm_client, "MAX_CONCURRENT_REQUESTS", 1)
+
+    async def acreate(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.05)
+        return make_response("slow")
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    async def run():
+        slots = llm_client._get_async_state()["semaphore"]
+        await slots.acquire()
+        asyncio.get_running_loop().call_later(0.1, slots.release)
+        response = await llm_client.achat_completion_hedged("gpt-4o-mini", [], hedge=True)
+        await llm_client.aclose()
+        return response
+
+    assert llm_client.completion_text(asyncio.run(run())) == "slow"
+    assert len(calls) == 2 and llm_client.hedge_stats()["hedges"] == 0
@@ -0,0 +1,112 @@
+import asyncio
+import gc
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import llm_client
+import llm_metrics
+import generate_explanation
+from mock_openai_server import MockOpenAIServer
+
+def test_replacement_chain_is_traced_per_step(tmp_path):
+    llm_metrics.reset()
+    with MockOpenAIServer(str(tmp_path), on_miss="canned"):
+        with llm_metrics.trace("highlight_click", blockType="replacement") as trace:
+            generate_explanation.build_replacement_prompt(
+                "affected", "influenced", "people are affected by it.", "people are influenced by it.")
+            generate_explanation.rule_based_explanation("insert", {"insert_text": "the "})
+
+    calls = trace["calls"]
+    assert [c["step"] for c in calls] == ["BULLET", "DRAFT", "POLISHED", "SUMMARY", "RULE"]
+    assert [c["model"] for c in calls[:4]] == ["gpt-4o", "gpt-4o-mini", "gpt-4o-mini", "gpt-4o-mini"]
+    assert all(c["completion_tokens"] == 5 and c["cost_usd"] > 0 for c in calls[:4])
+    assert calls[4]["rule_based"] and not calls[4]["cache_hit"] and calls[4]["cost_usd"] == 0
+
+    summary = llm_metrics.get_stats()["summary"]
+    assert summary["BULLET|gpt-4o"]["calls"] == 1
+    assert sum(summary["SUMMARY|gpt-4o-mini"]["histogram"]["counts"]) == 1
+    assert summary["RULE|None"]["rule_based"] == 1
+    assert (summary["RULE|None"]["calls"], summary["RULE|None"]["cache_hits"]) == (0, 0)
+
+def test_streams_and_worker_threads_record_into_the_trace(tmp_path):
+    llm_metrics.reset()
+    messages = [{"role": "user", "content": "Correct this paragraph."}]
+    with MockOpenAIServer(str(tmp_path), on_miss="canned"):
+        with llm_metrics.trace("main") as trace:
+            stream = llm_client.chat_completion("gpt-4o", messages, stream=True, step="OCR_STREAM")
+            assert "".join(c.choices[0].delta.get("content") or "" for c in stream) == "This is a mock response."
+            call = llm_metrics.bind_trace(llm_client.chat_completion)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: call("gpt-4o", messages, step="PARAGRAPH_CORRECTION"), range(2)))
+
+    steps = [c["step"] for c in trace["calls"]]
+    assert steps == ["OCR_STREAM", "PARAGRAPH_CORRECTION", "PARAGRAPH_CORRECTION"]
+    assert trace["calls"][0]["estimated_tokens"] and trace["calls"][0]["completion_tokens"] > 0
+
+def test_retries_and_errors_are_counted(monkeypatch):
+    llm_metrics.reset()
+    monkeypatch.setattr(llm_client, "backoff_delay", lambda attempt, error=None: 0)
+    failures = [openai.error.RateLimitError("slow down")]
+
+    def create(**kwargs):
+        if failures:
+            raise failures.pop()
+        return {"choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 1000, "completion_tokens": 100}}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    llm_client.chat_completion("gpt-4o-mini", [], step="CORRECTION")
+
+    def broken(**kwargs):
+        raise openai.error.InvalidRequestError("bad request", None)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", broken)
+    try:
+        llm_client.chat_completion("gpt-4o-mini", [], step="CORRECTION")
+    except openai.error.InvalidRequestError:
+        pass
+
+    row = llm_metrics.get_stats()["summary"]["CORRECTION|gpt-4o-mini"]
+    assert (row["calls"], row["retries"], row["errors"]) == (2, 1, 1)
+    assert abs(row["cost_usd"] - (1000 * 0.15 + 100 * 0.60) / 1_000_000) < 1e-9
+
+def test_streams_hold_their_concurrency_slot_until_closed(monkeypatch):
+    chunks = [types.SimpleNamespace(choices=[types.SimpleNamespace(delta={"content": word})]) for word in "ab"]
+
+    async def acreate(**kwargs):
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        return stream()
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kwargs: iter(chunks))
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    semaphore = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(llm_client, "_sync_semaphore", semaphore)
+
+    stream = llm_client.chat_completion("gpt-4o", [], stream=True)
+    assert not semaphore.acquire(blocking=False)  # the body has not been read yet
+    assert len(list(stream)) == 2
+    assert semaphore.acquire(blocking=False)
+    semaphore.release()
+
+    stream = llm_client.chat_completion("gpt-4o", [], stream=True)
+    next(stream)
+    stream.close()
+    del stream
+    llm_client.chat_completion("gpt-4o", [], stream=True)  # never iterated, dropped
+    gc.collect()
+    assert semaphore.acquire(blocking=False)
+
+    async def use_async_stream():
+        slots = llm_client._get_async_state()["semaphore"]
+        stream = await llm_client.achat_completion("gpt-4o", [], stream=True)
+        held = slots._value
+        assert len([chunk async for chunk in stream]) == 2
+        await llm_client.aclose()
+        return held, slots._value
+
+    held, after = asyncio.run(use_async_stream())
+    assert after == held + 1 == llm_client.MAX_CONCURRENT_REQUESTS
@@ -0,0 +1,70 @@
+import os
+import time
+
+import llm_client
+from mock_openai_server import MockOpenAIServer, FixtureStore, LatencyModel, request_key
+
+def make_completion(text):
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14},
+    }
+
+def record_fixture(directory, messages, text, latency=0.0, **params):
+    body = dict(model="gpt-4o-mini", messages=messages, **params)
+    FixtureStore(directory).save(request_key(body), body, make_completion(text), latency)
+
+def test_request_key_ignores_nonce_and_stream_flag():
+    messages = [{"role": "user", "content": "Before: ...\n\nNONCE: 1700000000000\n\nList bullet points"}]
+    later = [{"role": "user", "content": "Before: ...\n\nNONCE: 1700000009999\n\nList bullet points"}]
+    assert request_key({"model": "gpt-4o", "messages": messages}) == \
+        request_key({"model": "gpt-4o", "messages": later, "stream": True})
+    assert request_key({"model": "gpt-4o", "messages": messages}) != \
+        request_key({"model": "gpt-4o-mini", "messages": messages})
+
+def test_replay_and_stream_through_llm_client(tmp_path):
+    messages = [{"role": "user", "content": "Explain friend -> friends."}]
+    record_fixture(tmp_path, messages, "Use the plural after 'one of my'.", temperature=0.7, max_tokens=200)
+
+    with MockOpenAIServer(str(tmp_path)) as server:
+        response = llm_client.chat_completion("gpt-4o-mini", messages, temperature=0.7, max_tokens=200)
+        assert llm_client.completion_text(response) == "Use the plural after 'one of my'."
+
+        stream = llm_client.chat_completion("gpt-4o-mini", messages, temperature=0.7, max_tokens=200, stream=True)
+        streamed = "".join(chunk.choices[0].delta.get("content") or "" for chunk in stream)
+        assert streamed == "Use the plural after 'one of my'."
+
+        missing = [{"role": "user", "content": "Not recorded."}]
+        try:
+            llm_client.chat_completion("gpt-4o-mini", missing, max_retries=0)
+            assert False, "expected a miss"
+        except Exception as e:
+            assert "No recorded response" in str(e)
+        assert server.stats == {"hits": 2, "misses": 1, "recorded": 0}
+
+def test_record_mode_captures_upstream_calls(tmp_path):
+    upstream_dir, record_dir = tmp_path / "upstream", tmp_path / "recorded"
+    messages = [{"role": "user", "content": "Correct: I has a dog."}]
+    record_fixture(upstream_dir, messages, "I have a dog.", max_tokens=50)
+
+    with MockOpenAIServer(str(upstream_dir)) as upstream:
+        with MockOpenAIServer(str(record_dir), mode="record", upstream=upstream.base_url) as recorder:
+            first = llm_client.chat_completion("gpt-4o-mini", messages, max_tokens=50)
+            second = llm_client.chat_completion("gpt-4o-mini", messages, max_tokens=50)
+            assert recorder.stats == {"hits": 1, "misses": 0, "recorded": 1}
+        assert upstream.stats["hits"] == 1
+    assert llm_client.completion_text(first) == llm_client.completion_text(second) == "I have a dog."
+    assert len(os.listdir(record_dir)) == 1
+
+def test_latency_injection_is_seeded(tmp_path):
+    first, second = LatencyModel("lognormal:0.8:0.5", seed=7), LatencyModel("lognormal:0.8:0.5", seed=7)
+    assert [first.sample() for _ in range(5)] == [second.sample() for _ in range(5)]
+    assert LatencyModel("recorded:0.5").sample(recorded=2.0) == 1.0
+
+    messages = [{"role": "user", "content": "Slow call."}]
+    record_fixture(tmp_path, messages, "Done.")
+    with MockOpenAIServer(str(tmp_path), latency="fixed:0.3"):
+        start = time.monotonic()
+        llm_client.chat_completion("gpt-4o-mini", messages)
+        assert time.monotonic() - start >= 0.3
@@ -0,0 +1,37 @@
+from rule_based_explanation import classify_edit, explain_trivial_edit
+
+def test_classify_trivial_edits():
+    assert classify_edit("singer", "singers") == "add_s_ending"
+    assert classify_edit("story", "stories") == "add_s_ending"
+    assert classify_edit("songs", "song") == "remove_s_ending"
+    assert classify_edit("watch", "watches") == "add_s_ending"
+    assert classify_edit("play", "plays") == "add_s_ending"
+    assert classify_edit("cloth", "cloths") == "add_s_ending"
+    assert classify_edit("korean", "Korean") == "capitalize"
+    assert classify_edit("Music", "music") == "lowercase"
+    assert classify_edit("", "the") == "article_insert"
+    assert classify_edit("a", "") == "article_delete"
+    assert classify_edit("a", "an") == "article_a_an"
+    assert classify_edit(",", "") == "punctuation_delete"
+    assert classify_edit("", ",") == "punctuation_insert"
+    assert classify_edit(";", ",") == "punctuation_replace"
+
+def test_real_rewrites_escalate_to_llm():
+    assert classify_edit("affected by", "influenced by") is None
+    assert classify_edit("it", "its") is None
+    for before, after in (("her", "hers"), ("our", "ours"), ("cloth", "clothes"), ("new", "news"),
+                          ("other", "others"), ("studys", "studies"), ("storys", "story")):
+        assert classify_edit(before, after) is None, (before, after)
+    assert classify_edit("", "have been") is None
+    assert classify_edit("harm", "") is None
+
+def test_explain_trivial_edit_uses_block_text():
+    explanation = explain_trivial_edit("insert", {"insert_text": "the "})
+    assert "'the'" in explanation
+    assert explain_trivial_edit("replacement", {"replaced_text": "go", "corrected_text": "went"}) is None
+
+if __name__ == "__main__":
+    test_classify_trivial_edits()
+    test_real_rewrites_escalate_to_llm()
+    test_explain_trivial_edit_uses_block_text()
+    print("All rule-based explanation tests passed.")
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+import correction_service
+import sentence_index
+from conftest import OUTPUT_JSON, SENTENCE_MAPPING, load_json as load
+from document_store import file_document_index, file_sentence_range
+
+def test_writer_matches_json_dump_and_reader_decodes_one_record(tmp_path):
+    for source, ensure_ascii in ((OUTPUT_JSON, True), (SENTENCE_MAPPING, False)):
+        data = load(source)
+        path = str(tmp_path / os.path.basename(source))
+        records = sentence_index.write_indexed_json(data, path, ensure_ascii=ensure_ascii)
+        with open(path, "rb") as f:
+            assert f.read() == json.dumps(data, indent=4, ensure_ascii=ensure_ascii).encode("utf-8")
+        assert len(records) == len(data["sentences"])
+        for entry in data["sentences"]:
+            assert sentence_index.read_record(path, entry["sentence_index"]) == entry
+        assert sentence_index.read_record(path, len(data["sentences"])) is None
+
+    path = str(tmp_path / "output.json")
+    sentences = load(OUTPUT_JSON)["sentences"]
+    assert file_sentence_range(path, 2, 3)["sentences"] == sentences[2:5]
+    index = file_document_index(path)
+    with open(path, "rb") as f:
+        raw = f.read()
+    first = index["sentences"][1]
+    assert json.loads(raw[first["offset"]:first["offset"] + first["bytes"]]) == sentences[1]
+
+def test_stale_index_falls_back_to_parsing(tmp_path, monkeypatch):
+    output_path, mapping_path = str(tmp_path / "output.json"), str(tmp_path / "sentence_mapping.json")
+    sentence_index.write_indexed_json(load(OUTPUT_JSON), output_path)
+    sentence_index.write_indexed_json(load(SENTENCE_MAPPING), mapping_path, ensure_ascii=False)
+    monkeypatch.setattr(correction_service, "OUTPUT_JSON_PATH", output_path)
+    monkeypatch.setattr(correction_service, "SENTENCE_MAPPING_PATH", mapping_path)
+    click = {"blockType": "replacement", "blockIndex": 0, "sentenceIndex": 0}
+    indexed = correction_service.get_correction_explanation(click)
+    assert indexed["correction_block"]["replaced_text"]
+
+    # Rewritten without the sidecar (e.g. by an older main.py): the index no longer matches.
+    data = load(OUTPUT_JSON)
+    data["sentences"][0]["container_length"] += 1
+    with open(output_path, "w") as f:
+        json.dump(data, f)
+    with pytest.raises(sentence_index.IndexUnavailable):
+        sentence_index.read_record(output_path, 0)
+    reparsed = correction_service.get_correction_explanation(click)
+    assert reparsed["correction_entry"]["container_length"] == indexed["correction_entry"]["container_length"] + 1
+    assert file_sentence_range(output_path, 0, 1)["sentences"] == data["sentences"][:1]
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import threading
+
+import correction_service
+import generate_explanation
+import llm_metrics
+import shared_cache
+from document_store import DocumentStore
+
+def test_entries_and_invalidations_are_shared_between_workers(worker_cache):
+    first, second = worker_cache(), worker_cache()
+
+    first.set("explanations", "k", "because", scope="doc-1")
+    assert second.get("explanations", "k") == "because"  # from SQLite, now in its LRU too
+    assert second.local.get("explanations", "k") == "because"
+
+    first.invalidate("explanations", scope="doc-1")
+    assert second.get("explanations", "k") is None
+    assert second.local.stats()["entries"] == 0
+
+    # A value computed before an invalidation of its scope is not stored after it.
+    token = first.token()
+    second.invalidate("explanations", scope="doc-1")
+    assert not first.set("explanations", "k", "stale", scope="doc-1", since=token)
+    assert first.set("explanations", "other", "fresh", scope="doc-2", since=token)
+    assert second.get("explanations", "k") is None
+
+def test_eviction_keeps_both_tiers_within_budget(tmp_path):
+    local = shared_cache.LRUCache(max_bytes=10)
+    for key in "abcd":
+        local.set("n", key, "xxxx")
+    assert local.get("n", "a") is None and local.get("n", "d") == "xxxx"
+    assert local.stats()["bytes"] <= 10 and local.stats()["evictions"] == 2
+
+    shared = shared_cache.SQLiteCache(str(tmp_path / "cache.db"), max_bytes=100)
+    for i in range(10):
+        shared.set("n", str(i), "y" * 30)
+    assert shared.stats()["bytes"] <= 100
+    assert shared.get("n", "9") is not None and shared.get("n", "0") is None
+
+def test_documents_and_corrections_are_invalidated_when_a_document_changes(tmp_path, sample_document, worker_cache):
+    output_data, sentence_mapping = sample_document
+    path = str(tmp_path / "documents.db")
+    reader = DocumentStore(path, cache=worker_cache(path))
+    writer = DocumentStore(path, cache=worker_cache(path))  # e.g. main.py or a job in another worker
+
+    document_id = writer.save_document(output_data, sentence_mapping)
+    assert json.loads(reader.get_document_json(document_id)) == output_data
+    first = correction_service.get_correction_explanation_from_store(document_id, "replacement", 0, 0, store=reader)
+    assert correction_service.get_correction_explanation_from_store(
+        document_id, "replacement", 0, 0, store=reader) == first
+    assert reader.cache.stats()["local"]["hits"] >= 1
+
+    shortened = {"sentences": output_data["sentences"][1:2]}
+    writer.save_document(shortened, sentence_mapping, document_id=document_id)
+    assert json.loads(reader.get_document_json(document_id)) == shortened
+    missing = correction_service.get_correction_explanation_from_store(document_id, "replacement", 0, 0, store=reader)
+    assert missing["error"] == "Sentence not found"
+
+    writer.delete_document(document_id)
+    assert reader.get_document_json(document_id) is None
+
+def test_explanations_are_generated_once_per_correction(monkeypatch, worker_cache):
+    calls = []
+
+    def generate(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        calls.append(block_type)
+        return f"explanation {len(calls)}"
+
+    monkeypatch.setattr(generate_explanation, "generate_correction_explanation_single", generate)
+    block = {"block_index": 0, "replaced_text": "go", "corrected_text": "went", "custom_sentence": "I go home."}
+    caches = [worker_cache() for _ in range(2)]
+    answers = [generate_explanation.generate_correction_explanation_cached(
+        "replacement", "I go home.", "I went home.", block, cache=cache) for cache in caches]
+    assert answers == ["explanation 1", "explanation 1"] and len(calls) == 1
+
+    streamed = list(generate_explanation.stream_correction_explanation_cached(
+        "replacement", "I go home.", "I went home.", block, cache=caches[1]))
+    assert streamed == [("done", "explanation 1")]
+
+    other = dict(block, corrected_text="goes")
+    assert generate_explanation.generate_correction_explanation_cached(
+        "replacement", "I go home.", "I goes home.", other, cache=caches[0]) == "explanation 2"
+
+def test_rule_based_explanations_skip_the_cache(worker_cache):
+    cache = worker_cache()
+    block = {"block_index": 0, "replaced_text": "singer", "corrected_text": "singers", "custom_sentence": "I like singer."}
+    args = ("replacement", "I like singer.", "I like singers.", block)
+
+    async def aclick():
+        return (await generate_explanation.agenerate_correction_explanation_cached(*args, cache=cache),
+                [event async for event in generate_explanation.astream_correction_explanation_cached(*args, cache=cache)])
+
+    with llm_metrics.trace("highlight_click") as trace:
+        first = generate_explanation.generate_correction_explanation_cached(*args, cache=cache)
+        streamed = list(generate_explanation.stream_correction_explanation_cached(*args, cache=cache))
+        awaited, astreamed = asyncio.run(aclick())
+    assert streamed == astreamed == [("done", first)] and awaited == first
+    assert [c["step"] for c in trace["calls"]] == ["RULE"] * 4
+    assert cache.stats()["shared"]["entries"] == 0
+
+def test_async_explanations_use_the_cache_off_the_event_loop(monkeypatch, worker_cache):
+    cache, threads = worker_cache(), []
+    for name in ("get", "set", "token"):
+        method = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, _method=method, **kwargs: (
+            threads.append(threading.current_thread()), _method(*args, **kwargs))[1])
+
+    async def generate(block_type, ocr_sentence, corrected_sentence, correction_block, correction_entry=None):
+        return "because"
+
+    monkeypatch.setattr(generate_explanation, "agenerate_correction_explanation_single", generate)
+    block = {"block_index": 0, "replaced_text": "go", "corrected_text": "went", "custom_sentence": "I go home."}
+    args = ("replacement", "I go home.", "I went home.", block)
+
+    async def click_twice():
+        first = await generate_explanation.agenerate_correction_explanation_cached(*args, cache=cache)
+        with llm_metrics.trace("highlight_click") as trace:
+            streamed = [event async for event in generate_explanation.astream_correction_explanation_cached(
+                *args, cache=cache)]
+        return first, streamed, trace
+
+    first, streamed, trace = asyncio.run(click_twice())
+    assert first == "because" and streamed == [("done", "because")]
+    assert [c["step"] for c in trace["calls"]] == ["CACHE"]  # recorded from the executor thread
+    assert len(threads) == 4 and threading.main_thread() not in threads
+
+def test_forked_children_open_their_own_connections(worker_cache):
+    # A preloaded gunicorn master uses the cache and then forks its workers.
+    cache = worker_cache()
+    cache.set("documents", "k", "v")
+    pid = os.fork()
+    if pid == 0:
+        inherited = cache.shared._local.conn is not None  # closed before the fork
+        ok = not inherited and cache.get("documents", "k") == "v" and cache.set("documents", "k2", "v2")
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache.get("documents", "k2") == "v2"
@@ -0,0 +1,32 @@
+import json
+import os
+
+import stage_profiler
+
+def test_stage_is_a_no_op_when_disabled():
+    stage_profiler.disable()
+    with stage_profiler.stage("split"):
+        pass
+    assert stage_profiler.active_profiler is None
+
+def test_stages_accumulate_time_and_peak_allocations(tmp_path):
+    profiler = stage_profiler.enable(cprofile_dir=str(tmp_path / "profiles"))
+    try:
+        for _ in range(2):
+            with stage_profiler.stage("render"):
+                buffer = [bytearray(1024) for _ in range(512)]  # ~0.5 MiB
+                del buffer
+        with stage_profiler.stage("json"):
+            json.dumps({"sentences": list(range(1000))})
+        report = profiler.write_report(str(tmp_path / "report.json"), images=["page1.jpg"], sentences=2)
+    finally:
+        stage_profiler.disable()
+
+    assert report["document"] == {"images": ["page1.jpg"], "sentences": 2}
+    render = report["stages"]["render"]
+    assert render["calls"] == 2
+    assert render["wall_s"] > 0 and render["cpu_s"] > 0
+    assert render["peak_alloc_bytes"] >= 512 * 1024
+    assert report["stages"]["json"]["peak_alloc_bytes"] < render["peak_alloc_bytes"]
+    assert json.load(open(tmp_path / "report.json"))["stages"].keys() == {"render", "json"}
+    assert sorted(os.listdir(tmp_path / "profiles")) == ["json.prof", "render.prof"]
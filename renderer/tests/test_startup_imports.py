@@ -0,0 +1,18 @@
+import pytest
+
+from benchmark_startup import parse_importtime, run_entry_point, unexpected_heavy_modules
+
+def test_parse_importtime_keeps_top_level_imports():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   json.decoder",
+        "import time:        50 |        150 | json",
+        "import time:       300 |        300 | main",
+    ])
+    assert parse_importtime(stderr) == {"json": 150, "main": 300}
+
+@pytest.mark.parametrize("name", ["main --use-test-data", "app /data.json", "import async_app"])
+def test_entry_points_do_not_import_the_api_client_or_pillow(name):
+    result = run_entry_point(name)
+    assert unexpected_heavy_modules(name, result) == [], result
+    assert "openai" not in result["heavy"] and "PIL" not in result["heavy"]
@@ -0,0 +1,22 @@
+from synthetic_essays import generate_essay
+from seq_alignment_reverse import split_into_sentences
+
+def test_generator_is_deterministic():
+    assert generate_essay(50, error_rate=1.5, seed=3) == generate_essay(50, error_rate=1.5, seed=3)
+    assert generate_essay(50, error_rate=1.5, seed=3) != generate_essay(50, error_rate=1.5, seed=4)
+
+def test_error_rate_controls_the_mutations():
+    clean_learner, clean_corrected = generate_essay(40, error_rate=0, seed=1)
+    assert clean_learner == clean_corrected
+    assert len(split_into_sentences(clean_corrected)) == 40
+
+    learner, corrected = generate_essay(40, error_rate=2.0, seed=1)
+    assert corrected == clean_corrected
+    pairs = zip(split_into_sentences(learner), split_into_sentences(corrected))
+    assert sum(1 for a, b in pairs if a != b) > 20
+
+def test_benchmark_runs_every_stage(run_modules):
+    from benchmark_pipeline import STAGES, run_pipeline
+    report = run_pipeline(*generate_essay(20, error_rate=1.0, seed=0))
+    assert set(report["stages"]) == set(STAGES)
+    assert report["document"]["sentences"] > 0